@@ -0,0 +1,158 @@
+"""
+In-process job manager for graph runs served over HTTP.
+
+Jobs are kept in memory and executed on the server's event loop. A semaphore caps how
+many `graph_run` calls are in flight at once; further jobs wait in the queued state.
+"""
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from db.run_log import append_run
+from schemas import JobState, JobStatus, LearningState
+
+
+class Job:
+    def __init__(self, request: dict, stream: bool = False):
+        self.status = JobStatus(job_id=uuid.uuid4().hex, created_at=datetime.utcnow())
+        self.request = request
+        self.stream = stream
+        self.result: Optional[LearningState] = None
+        self.task: Optional[asyncio.Task] = None
+        self.events: List[dict] = []
+        self._changed = asyncio.Condition()
+
+    @property
+    def job_id(self) -> str:
+        return self.status.job_id
+
+    @property
+    def finished(self) -> bool:
+        return self.status.status in (JobState.COMPLETED, JobState.FAILED)
+
+    async def publish(self, event: dict):
+        """Content stream sink: buffer the event and wake up subscribers."""
+        self.events.append(event)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def notify_finished(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[dict]:
+        """Replay buffered stream events, then follow new ones until the job finishes."""
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self.events) or self.finished)
+            while index < len(self.events):
+                yield self.events[index]
+                index += 1
+            if self.finished:
+                return
+
+
+class JobManager:
+    """
+    Accepts generation requests and runs them through `graph_run` with bounded concurrency.
+
+    Args:
+        max_concurrency (int): Maximum number of graph runs executing at the same time.
+        max_finished_jobs (int): Finished jobs kept for status/result lookups before the oldest are evicted.
+    """
+
+    def __init__(self, max_concurrency: int = 2, max_finished_jobs: int = 500):
+        self.max_concurrency = max_concurrency
+        self.max_finished_jobs = max_finished_jobs
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._jobs: Dict[str, Job] = OrderedDict()
+
+    def submit(self, request: dict, stream: bool = False) -> Job:
+        """
+        Validate the request, register a job for it and schedule its run.
+
+        Args:
+            request (dict): Initial graph input, shaped like `user_data` in `main.py`.
+            stream (bool): Run through `graph_stream` and buffer content events for subscribers.
+        """
+        LearningState.model_validate(request)
+        job = Job(request, stream=stream)
+        self._jobs[job.job_id] = job
+        job.task = asyncio.create_task(self._run(job))
+        self._evict_finished()
+        logging.info(f"Job {job.job_id} queued")
+        return job
+
+    def resume(self, job: Job) -> Job:
+        """
+        Re-run a failed job under the same id. The graph continues from the last node
+        checkpointed before the failure instead of starting over. Stream events of the
+        failed attempt are dropped, so subscribers only see the resumed run.
+        """
+        if job.status.status != JobState.FAILED:
+            raise ValueError(f"Job {job.job_id} is {job.status.status.value}; only failed jobs can be resumed")
+        # Subscribers of the failed attempt have all returned, since the job was finished.
+        job.events = []
+        job.status.status = JobState.QUEUED
+        job.status.error = None
+        job.status.finished_at = None
+        job.task = asyncio.create_task(self._run(job))
+        logging.info(f"Job {job.job_id} queued for resume")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def counts(self) -> Dict[str, int]:
+        counts = {state.value: 0 for state in JobState}
+        for job in self._jobs.values():
+            counts[job.status.status.value] += 1
+        return counts
+
+    async def shutdown(self):
+        """Cancel jobs that have not finished yet."""
+        pending = [job.task for job in self._jobs.values() if job.task and not job.task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _run(self, job: Job):
+        # Imported lazily so the module can be loaded before the graph is warmed up.
+        from nodes import graph_run, graph_stream
+
+        async with self._semaphore:
+            job.status.status = JobState.RUNNING
+            job.status.started_at = datetime.utcnow()
+            logging.info(f"Job {job.job_id} started")
+            try:
+                # The job id doubles as the checkpoint run id, so a failed job can be resumed.
+                if job.stream:
+                    output = await graph_stream(job.request, job.publish, run_id=job.job_id)
+                else:
+                    output = await graph_run(job.request, run_id=job.job_id)
+                job.result = output if isinstance(output, LearningState) else LearningState.model_validate(output)
+                # Finished results outlive in-memory job eviction in the append-only run log.
+                await asyncio.to_thread(append_run, job.result, job.job_id)
+                job.status.status = JobState.COMPLETED
+                logging.info(f"Job {job.job_id} completed")
+            except asyncio.CancelledError:
+                job.status.status = JobState.FAILED
+                job.status.error = "Cancelled"
+                raise
+            except Exception as e:
+                job.status.status = JobState.FAILED
+                job.status.error = str(e)
+                logging.error(f"Job {job.job_id} failed: {e}")
+            finally:
+                job.status.finished_at = datetime.utcnow()
+                await job.notify_finished()
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.status.status in (JobState.COMPLETED, JobState.FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
@@ -0,0 +1,150 @@
+"""api/server.py
+
+Long-running HTTP service for the Personalised Learning System.
+
+Models, ChromaDB handles and LLM clients are loaded once at startup and reused by every
+request, so the startup cost of `main.py` is paid once per process. Generation requests
+are queued as jobs and executed by `graph_run` with a configurable concurrency limit.
+
+Run with:
+    python -m api.server
+or:
+    uvicorn api.server:app --host 0.0.0.0 --port 8000
+
+Environment variables:
+    MAX_CONCURRENT_RUNS: Maximum number of graph runs executing at once (default 2).
+    API_HOST / API_PORT: Bind address when started with `python -m api.server`.
+"""
+import asyncio
+import importlib
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sse_starlette.sse import EventSourceResponse
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s [%(filename)s:%(lineno)d] %(levelname)s %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+from api.jobs import JobManager
+from db.run_log import get_run
+from models.concurrency import concurrency_snapshot
+from schemas import JobState, JobStatus
+from utils.instrumentation import REGISTRY
+
+
+def warm_up():
+    """
+    Load everything a graph run needs so the first request does not pay for it:
+    the embedding model, the LLM chains built in `prompts.prompts`, the compiled
+    graph and the ChromaDB collections.
+    """
+    logging.info("Warming up models, LLM clients and ChromaDB collections")
+    importlib.import_module("nodes")  # builds the prompt chains and compiles the graph
+    from logis.logical_functions import load_or_build_collections
+    load_or_build_collections("./local VDB/chromadb", "lessons", "scraped_data")
+    logging.info("Warm-up complete")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up()
+    app.state.jobs = JobManager(max_concurrency=int(os.environ.get("MAX_CONCURRENT_RUNS", "2")))
+    yield
+    await app.state.jobs.shutdown()
+
+
+app = FastAPI(title="Personalised Learning System", lifespan=lifespan)
+
+
+def _get_job(request: Request, job_id: str):
+    job = request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@app.get("/health")
+async def health(request: Request):
+    jobs = request.app.state.jobs
+    return {"status": "ok", "max_concurrency": jobs.max_concurrency, "jobs": jobs.counts(),
+            "providers": concurrency_snapshot()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Process-wide node, LLM call, token, cost and cache counters in Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/generate", response_model=JobStatus, status_code=202)
+async def generate(request: Request, user_data: dict, stream: bool = False):
+    """
+    Queue a graph run. The body has the same shape as `user_data` in `main.py`.
+    With `?stream=true`, generated content can be followed live on `/jobs/{job_id}/stream`.
+    """
+    try:
+        job = request.app.state.jobs.submit(user_data, stream=stream)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return job.status
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def job_status(request: Request, job_id: str):
+    return _get_job(request, job_id).status
+
+
+@app.post("/jobs/{job_id}/resume", response_model=JobStatus, status_code=202)
+async def resume_job(request: Request, job_id: str):
+    """Resume a failed job from its last checkpointed node."""
+    job = _get_job(request, job_id)
+    try:
+        request.app.state.jobs.resume(job)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job.status
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(request: Request, job_id: str):
+    job = request.app.state.jobs.get(job_id)
+    if job is None:
+        # Evicted from memory (or from an earlier process): serve it from the run log.
+        record = await asyncio.to_thread(get_run, job_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+        return record["state"]
+    if job.status.status == JobState.FAILED:
+        raise HTTPException(status_code=500, detail=job.status.error)
+    if job.status.status != JobState.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status.status.value}")
+    return job.result.model_dump(mode="json")
+
+
+@app.get("/jobs/{job_id}/stream")
+async def job_stream(request: Request, job_id: str):
+    """
+    Server-Sent Events feed of a streaming job's content: token deltas while the lesson
+    is generated, then replace-in-place updates for each later revision.
+    """
+    job = _get_job(request, job_id)
+    if not job.stream:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} was not submitted with stream=true")
+
+    async def events():
+        async for event in job.subscribe():
+            yield {"event": event["event"], "data": json.dumps(event, ensure_ascii=False)}
+
+    return EventSourceResponse(events())
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=os.environ.get("API_HOST", "127.0.0.1"), port=int(os.environ.get("API_PORT", "8000")))
@@ -0,0 +1,229 @@
+"""
+Deterministic fake chat models for offline benchmarks.
+
+`FakeChatModel` answers every prompt with output derived from a hash of the prompt, so
+repeated runs do identical work without network access or API credits. With an output
+schema it returns a schema-valid instance: JSON objects embedded in the prompt (such as
+the user profile or foundation resource) are echoed back where their keys match the
+schema, and the remaining fields are filled deterministically. Simulated latency and
+token usage let the instrumentation and concurrency layers behave as they would live.
+
+Install with `install_fake_models()` before importing `prompts.prompts` or `nodes`.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+import typing
+from datetime import datetime
+from enum import Enum
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+
+from models.llm_models import set_model_override
+from schemas import CombinedCritique, ContentResponse, FeedBack, LessonOutline, OutlineSection, PostValidationResult, \
+    RouteSelector
+
+PROVIDER_MODELS = {
+    "gemini": ("google_genai", "gemini-2.0-flash"),
+    "groq": ("groq", "meta-llama/llama-4-scout-17b-16e-instruct"),
+    "deepseek": ("openai", "deepseek/deepseek-r1-0528:free"),
+}
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+def fake_markdown(seed: int, words: int = 600) -> str:
+    """A deterministic markdown lesson of roughly `words` words."""
+    rng = random.Random(seed)
+    vocabulary = ["magnetic", "field", "force", "charge", "current", "flux", "pole", "energy", "motion",
+                  "vector", "induction", "coil", "student", "example", "law", "experiment", "velocity"]
+    sections = ["Introduction", "Core Concepts", "Worked Example", "Applications",
+                "Frequently Asked Questions", "Summary"]
+    per_section = max(1, words // len(sections))
+    lines = [f"# Understanding Topic {seed % 1000}", ""]
+    for section in sections:
+        lines += [f"## {section}", ""]
+        sentence = []
+        for _ in range(per_section):
+            sentence.append(rng.choice(vocabulary))
+            if len(sentence) >= 12:
+                lines.append(" ".join(sentence).capitalize() + ".")
+                sentence = []
+        if sentence:
+            lines.append(" ".join(sentence).capitalize() + ".")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _embedded_objects(text: str) -> List[dict]:
+    decoder = json.JSONDecoder()
+    objects, index = [], text.find("{")
+    while index != -1:
+        try:
+            obj, end = decoder.raw_decode(text, index)
+            if isinstance(obj, dict):
+                objects.append(obj)
+            index = text.find("{", end)
+        except ValueError:
+            index = text.find("{", index + 1)
+    return objects
+
+
+def _fake_value(annotation, name: str, seed: int, words: int):
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        options = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        return _fake_value(options[0], name, seed, words) if options else None
+    if origin in (list, List):
+        return []
+    if origin is typing.Literal:
+        return typing.get_args(annotation)[0]
+    if isinstance(annotation, type):
+        if issubclass(annotation, Enum):
+            return list(annotation)[0]
+        if issubclass(annotation, BaseModel):
+            return fake_instance(annotation, seed, words)
+        if issubclass(annotation, bool):
+            return True
+        if issubclass(annotation, int):
+            return 1
+        if issubclass(annotation, float):
+            return 0.5
+        if issubclass(annotation, datetime):
+            return datetime(2024, 1, 1)
+        if issubclass(annotation, dict):
+            return {}
+    if name == "content":
+        return fake_markdown(seed, words)
+    return f"{name} {seed % 1000}"
+
+
+def fake_instance(schema, seed: int, words: int = 600, prompt: str = "") -> BaseModel:
+    """Build a schema-valid instance, echoing matching keys from JSON objects found in `prompt`."""
+    if schema is RouteSelector:
+        return RouteSelector(next_node="content_generation")
+    if schema is ContentResponse:
+        return ContentResponse(content=fake_markdown(seed, words))
+    if schema is FeedBack:
+        return FeedBack(rating=4, comments="Clear and well structured.", needed=True,
+                        gaps=["Add a worked numerical example"], ai_reliability_score=0.85)
+    if schema is PostValidationResult:
+        return PostValidationResult(is_valid=True, violations=[])
+    if schema is CombinedCritique:
+        return CombinedCritique(rating=4, comments="Clear and well structured.", needed=True,
+                                gaps=["Worked Example: add a numerical example"], ai_reliability_score=0.85,
+                                is_valid=True, violations=[])
+    if schema is LessonOutline:
+        headings = ["Introduction", "Real-Life Application", "Formula & Explanation", "Curriculum Relevance",
+                    "Frequently Asked Questions", "Summary"]
+        return LessonOutline(title=f"Understanding Topic {seed % 1000}",
+                             sections=[OutlineSection(heading=heading, key_points=[f"{heading} point {seed % 97}"])
+                                       for heading in headings])
+
+    fields = schema.model_fields
+    values = {}
+    candidates = sorted(_embedded_objects(prompt), key=lambda obj: len(fields.keys() & obj.keys()), reverse=True)
+    if candidates:
+        values.update({key: value for key, value in candidates[0].items() if key in fields})
+    for name, field in fields.items():
+        if name not in values and field.is_required():
+            values[name] = _fake_value(field.annotation, name, seed, words)
+    try:
+        return schema.model_validate(values)
+    except Exception:
+        # Echoed values did not fit the schema; fall back to generated ones only.
+        return schema.model_validate({name: _fake_value(field.annotation, name, seed, words)
+                                      for name, field in fields.items() if field.is_required()})
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model with deterministic output and simulated latency.
+
+    Attributes:
+        provider (str): Provider this fake stands in for (`gemini`, `groq` or `deepseek`).
+        latency (float): Mean simulated latency per call in seconds.
+        jitter (float): Deterministic +/- fraction applied to `latency` per prompt.
+        content_words (int): Approximate length of generated markdown content.
+        output_schema (Any): Structured output schema, set by `with_structured_output`.
+    """
+
+    provider: str = "gemini"
+    latency: float = 0.0
+    jitter: float = 0.0
+    content_words: int = 600
+    output_schema: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"fake-{self.provider}"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"provider": self.provider, "latency": self.latency}
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params["ls_provider"], params["ls_model_name"] = PROVIDER_MODELS.get(self.provider,
+                                                                             (self.provider, self.provider))
+        return params
+
+    def _delay(self, seed: int) -> float:
+        if not self.latency:
+            return 0.0
+        spread = (seed % 2001 - 1000) / 1000 * self.jitter
+        return max(0.0, self.latency * (1 + spread))
+
+    def _respond(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        seed = _seed(prompt)
+        if self.output_schema is not None:
+            text = fake_instance(self.output_schema, seed, self.content_words, prompt).model_dump_json()
+        else:
+            text = fake_markdown(seed, self.content_words)
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4,
+                 "total_tokens": (len(prompt) + len(text)) // 4}
+        message = AIMessage(content=text, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs) -> ChatResult:
+        result = self._respond(messages)
+        time.sleep(self._delay(_seed(result.generations[0].message.content)))
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs) -> ChatResult:
+        result = self._respond(messages)
+        await asyncio.sleep(self._delay(_seed(result.generations[0].message.content)))
+        return result
+
+    def with_structured_output(self, schema, **kwargs):
+        model = self.model_copy(update={"output_schema": schema})
+        return model | RunnableLambda(lambda message: schema.model_validate_json(message.content))
+
+
+def install_fake_models(latency: float = 0.0, jitter: float = 0.0, content_words: int = 600):
+    """
+    Replace every provider in `models.llm_models` with a `FakeChatModel`.
+
+    Args:
+        latency (float): Mean simulated latency per LLM call in seconds.
+        jitter (float): Deterministic +/- fraction applied to the latency.
+        content_words (int): Approximate length of generated lessons.
+    """
+
+    def factory(provider: str, output_schema=None):
+        model = FakeChatModel(provider=provider, latency=latency, jitter=jitter, content_words=content_words)
+        return model.with_structured_output(output_schema) if output_schema is not None else model
+
+    set_model_override(factory)
@@ -0,0 +1,315 @@
+"""benchmarks/run_benchmarks.py
+
+Offline benchmark suite for the Personalised Learning System.
+
+Every LLM provider is replaced with a deterministic fake (see `benchmarks/fake_models.py`),
+so the suite measures graph overhead, retrieval latency and indexing throughput without
+network access or API credits. The embedding model and ChromaDB are the real ones.
+
+Benchmarks run in a scratch copy of `data/` so the repository's vector store and
+output files are untouched. Results are appended to `benchmarks/results.jsonl` and
+compared with the previous run of the same configuration, so regressions show up
+over time.
+
+Usage:
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --llm-latency 0.2 --iterations 5 --only graph_run
+    python -m benchmarks.run_benchmarks --llm-latency 0.2 --only graph_run --generation-mode outline_sections
+    python -m benchmarks.run_benchmarks --only state_update
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.fake_models import install_fake_models
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_PATH = REPO_ROOT / "benchmarks" / "results.jsonl"
+
+USER_DATA = {
+    "user": {
+        "username": "bench_student",
+        "age": 17,
+        "grade": 11,
+        "id": 1,
+        "is_active": True,
+        "user_info": "Benchmark student."
+    },
+    "current_resource": {
+        "subject": "physics",
+        "grade": 11,
+        "unit": "",
+        "topic_id": "",
+        "topic": "Magnetism",
+        "description": "",
+        "elaboration": "",
+        "keywords": [],
+        "hours": 7,
+        "references": ""
+    },
+    "next_action": {"next_node": "lesson_blog"},
+    "content_type": "lesson",
+}
+
+
+def _stats(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "min": ordered[0],
+    }
+
+
+def _time(fn, iterations: int) -> list:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def prepare_workspace() -> str:
+    """Copy `data/` into a scratch directory and make it the working directory."""
+    workspace = tempfile.mkdtemp(prefix="pls-bench-")
+    shutil.copytree(REPO_ROOT / "data", Path(workspace) / "data")
+    scrapped = Path(workspace) / "data" / "scrapped_data.json"
+    if not scrapped.exists():
+        scrapped.write_text("[]", encoding="utf-8")
+    os.chdir(workspace)
+    return workspace
+
+
+def bench_build_chroma_db_collection(iterations: int) -> dict:
+    from db.vector_db import build_chroma_db_collection, get_chroma_client
+    from db.loader import load_json_data
+
+    documents = len(load_json_data("lessons/class_11_physics.json"))
+    counter = iter(range(iterations))
+
+    def run():
+        build_chroma_db_collection(collection_name=f"bench_lessons_{next(counter)}")
+
+    samples = _time(run, iterations)
+    client = get_chroma_client("./local VDB/chromadb")
+    for i in range(iterations):
+        client.delete_collection(f"bench_lessons_{i}")
+    result = _stats(samples)
+    result["docs_per_second"] = documents / result["mean"]
+    return result
+
+
+def bench_save_scraped_data_to_vdb(iterations: int) -> dict:
+    from db.vector_db import save_scraped_data_to_vdb
+    from db.loader import load_json_data
+
+    documents = len(load_json_data("raw_data.json"))
+    samples = _time(lambda: save_scraped_data_to_vdb(collection_name="bench_scraped"), iterations)
+    result = _stats(samples)
+    result["docs_per_second"] = documents / result["mean"]
+    return result
+
+
+def bench_search_both_collections(iterations: int) -> dict:
+    from logis.logical_functions import search_both_collections
+    from schemas import LearningState
+
+    state = LearningState.model_validate(USER_DATA)
+    search_both_collections(state=state)  # builds or seeds the collections once
+    return _stats(_time(lambda: search_both_collections(state=state), iterations))
+
+
+def bench_graph_run(iterations: int) -> dict:
+    from nodes import graph_run
+
+    summaries = []
+
+    def run():
+        # A new learner every run: each one misses the profile cache and starts with no stored
+        # history, instead of later runs hitting the cache and loading the history of earlier ones.
+        user = {**USER_DATA["user"], "id": f"bench-{uuid.uuid4().hex}"}
+        output = asyncio.run(graph_run({**USER_DATA, "user": user, "generation_mode": GENERATION_MODE,
+                                           "critique_mode": CRITIQUE_MODE},
+                                       use_pregenerated=False))
+        summaries.append(output.get("run_summary") or {})
+
+    run()  # Warm-up, not timed: imports, graph compilation and first-use setup.
+    summaries.clear()
+    result = _stats(_time(run, iterations))
+    node_times = {}
+    for summary in summaries:
+        for node, entry in summary.get("nodes", {}).items():
+            node_times.setdefault(node, []).append(entry["wall_time"])
+    result["nodes"] = {node: statistics.fmean(times) for node, times in sorted(node_times.items())}
+    result["llm_calls"] = statistics.fmean(summary.get("totals", {}).get("llm_calls", 0) for summary in summaries)
+    return result
+
+
+STATE_UPDATE_STEPS = 24
+
+
+def bench_state_update(iterations: int) -> dict:
+    """
+    Per-step overhead of LangGraph state handling: a loop of no-op nodes over a populated
+    `LearningState`, once returning the whole state from every node (as nodes did before)
+    and once returning only the changed field. The timed samples are the partial updates.
+    """
+    from typing import List
+    from langgraph.graph import StateGraph, END
+    from schemas import LearningState, ContentResponse, FeedBack, HistoryEntry, UserProgress
+
+    class FullState(LearningState):
+        # Without reducers, as before: a returned state replaces every field.
+        progress: List[UserProgress] = []
+        history: List[HistoryEntry] = []
+
+    def full_step(state):
+        state.count += 1
+        return state
+
+    def partial_step(state):
+        return {"count": state.count + 1}
+
+    def compile_loop(schema, step):
+        builder = StateGraph(schema)
+        builder.add_node("step", step)
+        builder.set_entry_point("step")
+        builder.add_conditional_edges("step", lambda state: "step" if state.count < STATE_UPDATE_STEPS else "END",
+                                      {"step": "step", "END": END})
+        return builder.compile()
+
+    data = {
+        **USER_DATA,
+        "content": ContentResponse(content=" ".join(["word"] * 3000)),
+        "feedback": FeedBack(rating=3, comments="ok", needed=True, gaps=["gap"] * 10, ai_reliability_score=0.7),
+        "history": [HistoryEntry(user_id=1, resource=USER_DATA["current_resource"], timestamp=datetime.utcnow(),
+                                 action="step") for _ in range(50)],
+    }
+    config = {"recursion_limit": STATE_UPDATE_STEPS + 5}
+    full_graph = compile_loop(FullState, full_step)
+    partial_graph = compile_loop(LearningState, partial_step)
+    full = _time(lambda: full_graph.invoke(FullState.model_validate(data), config=config), iterations)
+    partial = _time(lambda: partial_graph.invoke(LearningState.model_validate(data), config=config), iterations)
+    result = _stats(partial)
+    result["full_state_per_step"] = statistics.fmean(full) / STATE_UPDATE_STEPS
+    result["partial_per_step"] = statistics.fmean(partial) / STATE_UPDATE_STEPS
+    print(f"  per step: full state {result['full_state_per_step'] * 1e3:.3f} ms, "
+          f"partial update {result['partial_per_step'] * 1e3:.3f} ms")
+    return result
+
+
+GENERATION_MODE = "single_pass"
+CRITIQUE_MODE = "separate"
+
+BENCHMARKS = {
+    "build_chroma_db_collection": bench_build_chroma_db_collection,
+    "save_scraped_data_to_vdb": bench_save_scraped_data_to_vdb,
+    "search_both_collections": bench_search_both_collections,
+    "graph_run": bench_graph_run,
+    "state_update": bench_state_update,
+}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def _previous_record(config: dict):
+    if not RESULTS_PATH.exists():
+        return None
+    previous = None
+    with open(RESULTS_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("config") == config:
+                    previous = record
+    return previous
+
+
+def report(results: dict, previous, threshold: float):
+    print(f"\n{'benchmark':<30}{'mean (s)':>12}{'p95 (s)':>12}{'previous':>12}{'change':>10}")
+    for name, result in results.items():
+        before = (previous or {}).get("results", {}).get(name, {}).get("mean")
+        change = (result["mean"] - before) / before if before else None
+        flag = "  REGRESSION" if change is not None and change > threshold else ""
+        before_text = f"{before:.4f}" if before else "-"
+        change_text = f"{change:+.1%}" if change is not None else "-"
+        print(f"{name:<30}{result['mean']:>12.4f}{result['p95']:>12.4f}{before_text:>12}{change_text:>10}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run offline benchmarks with deterministic fake LLM providers.")
+    parser.add_argument("--iterations", type=int, default=3, help="Timed iterations per benchmark.")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Mean simulated latency per LLM call (s).")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="Deterministic +/- latency fraction.")
+    parser.add_argument("--content-words", type=int, default=600, help="Approximate length of fake lessons.")
+    parser.add_argument("--generation-mode", default="single_pass", choices=["single_pass", "outline_sections"],
+                        help="Lesson generation mode used by the graph_run benchmark.")
+    parser.add_argument("--critique-mode", default="separate", choices=["separate", "combined"],
+                        help="Critique mode used by the graph_run benchmark.")
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown fraction reported as a regression.")
+    parser.add_argument("--no-record", action="store_true", help="Do not append results to results.jsonl.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    global GENERATION_MODE, CRITIQUE_MODE
+    GENERATION_MODE = args.generation_mode
+    CRITIQUE_MODE = args.critique_mode
+    install_fake_models(latency=args.llm_latency, jitter=args.llm_jitter, content_words=args.content_words)
+    sys.path.insert(0, str(REPO_ROOT))
+    workspace = prepare_workspace()
+
+    config = {
+        "iterations": args.iterations,
+        "llm_latency": args.llm_latency,
+        "llm_jitter": args.llm_jitter,
+        "content_words": args.content_words,
+        "generation_mode": args.generation_mode,
+        "critique_mode": args.critique_mode,
+    }
+    results = {}
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"Running {name} ...", flush=True)
+            results[name] = BENCHMARKS[name](args.iterations)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    report(results, _previous_record(config), args.threshold)
+    if not args.no_record:
+        record = {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "config": config,
+            "results": results,
+        }
+        with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"\nResults appended to {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
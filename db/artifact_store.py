@@ -0,0 +1,107 @@
+"""
+Content-addressed store for large run artifacts. Today it holds the crawl results
+referenced by `LearningState.topic_data`.
+
+`LearningState` is validated, copied and checkpointed after every node, so bulky data
+kept in it is paid for on every step. Nodes instead write such data here with
+`put_artifact` and keep only the returned `ArtifactRef` in the state; `load_artifact`
+reads it back lazily in a node that needs it. Artifacts are immutable JSON files named
+by the SHA-256 of their contents, so equal data is stored once and can be cached by
+digest.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from functools import lru_cache
+from typing import Any, Optional
+
+from schemas import ArtifactRef
+
+ARTIFACT_STORE_PATH = os.environ.get("ARTIFACT_STORE_PATH", "./data/artifacts")
+
+
+def _artifact_path(digest: str, root: str) -> str:
+    return os.path.join(root, digest[:2], f"{digest}.json")
+
+
+def put_artifact(kind: str, data: Any, root: str = ARTIFACT_STORE_PATH) -> ArtifactRef:
+    """
+    Store `data` as JSON unless an artifact with the same contents exists.
+
+    Args:
+        kind (str): What the artifact holds, e.g. `crawl_results`.
+        data (Any): JSON-serialisable data.
+        root (str): Store directory.
+
+    Returns:
+        ArtifactRef: Reference to keep in the state instead of the data.
+    """
+    payload = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    digest = hashlib.sha256(payload).hexdigest()
+    path = _artifact_path(digest, root)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename, so readers never see a partial artifact.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    items = len(data) if isinstance(data, (list, dict)) else None
+    return ArtifactRef(kind=kind, digest=digest, size=len(payload), items=items)
+
+
+def put_artifact_file(kind: str, file_path: str, root: str = ARTIFACT_STORE_PATH) -> ArtifactRef:
+    """
+    Store the JSON file at `file_path` as an artifact, like `put_artifact`. The reference
+    is remembered next to the file (`<file_path>.artifact`) with the file's size and
+    modification time, so an unchanged file is not read, re-serialised and hashed again.
+    """
+    stat = os.stat(file_path)
+    sidecar = f"{file_path}.artifact"
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            remembered = json.load(f)
+        if (remembered["mtime_ns"], remembered["size"]) == (stat.st_mtime_ns, stat.st_size):
+            ref = ArtifactRef.model_validate(remembered["ref"])
+            if os.path.exists(_artifact_path(ref.digest, root)):
+                return ref
+    except (OSError, ValueError, KeyError):
+        pass
+    with open(file_path, "r", encoding="utf-8") as f:
+        ref = put_artifact(kind, json.load(f), root)
+    try:
+        with open(sidecar, "w", encoding="utf-8") as f:
+            json.dump({"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "ref": ref.model_dump()}, f)
+    except OSError as e:
+        logging.warning(f"Could not remember the artifact of {file_path}: {e}")
+    return ref
+
+
+@lru_cache(maxsize=32)
+def _load(digest: str, root: str) -> Any:
+    with open(_artifact_path(digest, root), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_artifact(ref: Optional[ArtifactRef], root: str = ARTIFACT_STORE_PATH) -> Any:
+    """
+    Load the data behind `ref`; None if `ref` is None or the artifact is missing.
+    Recently loaded artifacts are cached in memory and shared between callers, so
+    callers must not modify the returned data.
+    """
+    if ref is None:
+        return None
+    try:
+        return _load(ref.digest, root)
+    except FileNotFoundError:
+        logging.error(f"Artifact {ref.kind} {ref.digest} is missing from {root}.")
+    except json.JSONDecodeError as e:
+        logging.error(f"Artifact {ref.kind} {ref.digest} is corrupt: {e}")
+    return None
@@ -0,0 +1,107 @@
+"""
+Durable SQLite checkpoints for graph runs.
+
+LangGraph's `AsyncSqliteSaver` stores the state after every completed node, keyed by the
+run id (`thread_id`). A run that crashes, is cancelled or raises can be re-invoked with
+the same run id and continues from the last completed node instead of starting again
+from `user_info_node`.
+
+A small `graph_runs` table in the same database tracks each run's status and age so
+finished checkpoints can be garbage-collected.
+"""
+import logging
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager, closing
+from typing import Optional
+
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+CHECKPOINT_DB_PATH = os.environ.get("CHECKPOINT_DB_PATH", "./data/checkpoints/graph.sqlite")
+COMPLETED_MAX_AGE = float(os.environ.get("CHECKPOINT_MAX_AGE_SECONDS", 7 * 24 * 3600))
+UNFINISHED_MAX_AGE = float(os.environ.get("CHECKPOINT_UNFINISHED_MAX_AGE_SECONDS", 30 * 24 * 3600))
+PRUNE_INTERVAL = 3600
+
+_last_prune = 0.0
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS graph_runs (
+            run_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_graph_runs_updated ON graph_runs (status, updated_at)")
+    return conn
+
+
+def mark_run(run_id: str, status: str, user_id: Optional[str] = None, path: str = CHECKPOINT_DB_PATH):
+    """Record the status (`running`, `completed`, `failed`) of a checkpointed run."""
+    now = time.time()
+    with closing(_connect(path)) as conn, conn:
+        conn.execute("""
+            INSERT INTO graph_runs (run_id, user_id, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(run_id) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at,
+                user_id = COALESCE(excluded.user_id, graph_runs.user_id)
+        """, (run_id, user_id, status, now, now))
+
+
+def run_status(run_id: str, path: str = CHECKPOINT_DB_PATH) -> Optional[str]:
+    with closing(_connect(path)) as conn:
+        row = conn.execute("SELECT status FROM graph_runs WHERE run_id = ?", (run_id,)).fetchone()
+    return row[0] if row else None
+
+
+def prune_checkpoints(completed_max_age: float = COMPLETED_MAX_AGE,
+                      unfinished_max_age: float = UNFINISHED_MAX_AGE,
+                      path: str = CHECKPOINT_DB_PATH) -> int:
+    """
+    Delete checkpoints of completed runs older than `completed_max_age` seconds and of
+    failed or abandoned runs older than `unfinished_max_age` seconds.
+
+    Returns:
+        int: Number of runs removed.
+    """
+    now = time.time()
+    with closing(_connect(path)) as conn, conn:
+        run_ids = [row[0] for row in conn.execute("""
+            SELECT run_id FROM graph_runs
+            WHERE (status = 'completed' AND updated_at < ?) OR (status != 'completed' AND updated_at < ?)
+        """, (now - completed_max_age, now - unfinished_max_age))]
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for run_id in run_ids:
+            for table in ("checkpoints", "writes"):
+                if table in tables:
+                    conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (run_id,))
+            conn.execute("DELETE FROM graph_runs WHERE run_id = ?", (run_id,))
+    if run_ids:
+        logging.info(f"Pruned checkpoints of {len(run_ids)} runs")
+    return len(run_ids)
+
+
+@asynccontextmanager
+async def open_checkpointer(path: str = CHECKPOINT_DB_PATH):
+    """
+    Open the SQLite checkpointer, pruning expired checkpoints at most once per `PRUNE_INTERVAL`.
+    """
+    global _last_prune
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    if time.time() - _last_prune > PRUNE_INTERVAL:
+        _last_prune = time.time()
+        try:
+            prune_checkpoints(path=path)
+        except Exception as e:
+            logging.error(f"Failed to prune checkpoints in {path}: {e}")
+    async with AsyncSqliteSaver.from_conn_string(path) as saver:
+        yield saver
@@ -0,0 +1,159 @@
+"""
+Versioned store of the content iterations of graph runs.
+
+`content_improviser_node` replaces `state.content` on every iteration, and a later draft
+is not always a better one. `update_state` records each iteration here, keyed by run id
+and iteration number, together with the feedback and validation result it was scored
+with. At the end of the run `select_version_node` restores the best-scoring version.
+
+Texts are stored once per SHA-256 digest. Identical drafts, such as an iteration the
+improver left unchanged, share one blob. Blobs are compressed with zstd, or with zlib
+when `zstandard` is not installed. The codec is stored with each blob, so a store
+written with one codec stays readable after the other is installed.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from typing import List, Optional
+
+try:
+    import zstandard
+except ImportError:  # Optional: fall back to zlib.
+    zstandard = None
+
+CONTENT_VERSIONS_DB_PATH = os.environ.get("CONTENT_VERSIONS_DB_PATH", "./data/content_versions.sqlite")
+ZSTD_LEVEL = int(os.environ.get("CONTENT_VERSIONS_ZSTD_LEVEL", "10"))
+
+# Best version first: valid content, then higher rating, then higher reliability, then
+# fewer violations; ties go to the later iteration.
+_BEST_ORDER = "v.is_valid DESC, v.rating DESC, v.ai_reliability_score DESC, v.violations ASC, v.version DESC"
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS content_blobs (
+            digest TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS content_versions (
+            run_id TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            digest TEXT NOT NULL,
+            rating INTEGER NOT NULL,
+            ai_reliability_score REAL NOT NULL,
+            is_valid INTEGER NOT NULL,
+            violations INTEGER NOT NULL,
+            feedback TEXT,
+            validation_result TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (run_id, version)
+        );
+        CREATE INDEX IF NOT EXISTS idx_content_versions_digest ON content_versions (digest);
+    """)
+    return conn
+
+
+def _compress(text: str):
+    data = text.encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+
+def _decompress(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Content was compressed with zstd; install zstandard to read it.")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return zlib.decompress(data).decode("utf-8")
+
+
+def put_version(run_id: str, version: int, content: str, feedback=None, validation_result=None,
+                path: str = CONTENT_VERSIONS_DB_PATH) -> str:
+    """
+    Record iteration `version` of a run's content with the scores it was given. Recording
+    the same iteration again (a resumed run) replaces it.
+
+    Args:
+        run_id (str): Run id.
+        version (int): Iteration number, `state.count`.
+        content (str): The content text.
+        feedback (Optional[FeedBack]): Feedback on this content.
+        validation_result (Optional[PostValidationResult]): Validation of this content.
+
+    Returns:
+        str: SHA-256 digest of the content.
+    """
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    with closing(_connect(path)) as conn, conn:
+        if conn.execute("SELECT 1 FROM content_blobs WHERE digest = ?", (digest,)).fetchone() is None:
+            codec, data = _compress(content)
+            conn.execute("INSERT OR IGNORE INTO content_blobs (digest, codec, size, data) VALUES (?, ?, ?, ?)",
+                         (digest, codec, len(content), data))
+        conn.execute("INSERT OR REPLACE INTO content_versions (run_id, version, digest, rating, ai_reliability_score, "
+                     "is_valid, violations, feedback, validation_result, created_at) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (run_id, version, digest,
+                      feedback.rating if feedback is not None else 0,
+                      (feedback.ai_reliability_score or 0.0) if feedback is not None else 0.0,
+                      int(bool(validation_result and validation_result.is_valid)),
+                      len(validation_result.violations) if validation_result is not None else 0,
+                      feedback.model_dump_json() if feedback is not None else None,
+                      validation_result.model_dump_json() if validation_result is not None else None,
+                      time.time()))
+    return digest
+
+
+_VERSION_COLUMNS = ("version", "digest", "rating", "ai_reliability_score", "is_valid", "violations")
+
+
+def list_versions(run_id: str, path: str = CONTENT_VERSIONS_DB_PATH) -> List[dict]:
+    """Scores of every recorded version of a run, in iteration order, without their text."""
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(f"SELECT {', '.join(_VERSION_COLUMNS)} FROM content_versions WHERE run_id = ? "
+                            f"ORDER BY version", (run_id,)).fetchall()
+    return [dict(zip(_VERSION_COLUMNS, row)) for row in rows]
+
+
+def _version(run_id: str, where: str, params: tuple, order: str, path: str) -> Optional[dict]:
+    with closing(_connect(path)) as conn:
+        row = conn.execute(f"SELECT {', '.join('v.' + c for c in _VERSION_COLUMNS)}, v.feedback, "
+                           f"v.validation_result, b.codec, b.data FROM content_versions v "
+                           f"JOIN content_blobs b ON b.digest = v.digest WHERE v.run_id = ? {where} "
+                           f"ORDER BY {order} LIMIT 1", (run_id, *params)).fetchone()
+    if row is None:
+        return None
+    version = dict(zip(_VERSION_COLUMNS, row))
+    feedback, validation_result, codec, data = row[len(_VERSION_COLUMNS):]
+    version["feedback"] = json.loads(feedback) if feedback else None
+    version["validation_result"] = json.loads(validation_result) if validation_result else None
+    version["content"] = _decompress(codec, data)
+    return version
+
+
+def get_version(run_id: str, version: int, path: str = CONTENT_VERSIONS_DB_PATH) -> Optional[dict]:
+    """One version of a run: its scores, `feedback`, `validation_result` and `content`."""
+    return _version(run_id, "AND v.version = ?", (version,), "v.version", path)
+
+
+def best_version(run_id: str, path: str = CONTENT_VERSIONS_DB_PATH) -> Optional[dict]:
+    """
+    The best-scoring version of a run, like `get_version`, or None if none was recorded.
+    Valid content ranks first, then rating, AI reliability score and fewest violations.
+    """
+    try:
+        return _version(run_id, "", (), _BEST_ORDER, path)
+    except (sqlite3.Error, RuntimeError, zlib.error) as e:
+        logging.error(f"Failed to read content versions of run {run_id}: {e}")
+        return None
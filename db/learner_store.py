@@ -0,0 +1,248 @@
+"""
+SQLite store for learners: profiles, progress, history and generated content.
+
+Progress and history used to exist only as in-memory lists on `LearningState`, passed in
+by the caller, re-serialised wholesale and lost after the run. Here they are rows keyed
+by user id, indexed on (user_id, topic_id) and (user_id, timestamp). A run loads only a
+window of the learner's most recent history and the progress for its topic
+(`load_learner_slice`). `record_run` writes what the run produced in one transaction
+with batched inserts.
+
+Every table is keyed by user id, so any number of learners share one database file.
+"""
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from schemas import HistoryEntry, LearningState, UserInfo, UserProgress
+
+LEARNER_DB_PATH = os.environ.get("LEARNER_DB_PATH", "./data/learners.sqlite")
+# Most recent history entries loaded into a run's state.
+HISTORY_WINDOW = int(os.environ.get("LEARNER_HISTORY_WINDOW", "20"))
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS learners (
+            user_id TEXT PRIMARY KEY,
+            profile TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS progress (
+            user_id TEXT NOT NULL,
+            progress_id INTEGER NOT NULL,
+            topic_id TEXT NOT NULL,
+            completed INTEGER NOT NULL,
+            completion_date TEXT,
+            score REAL,
+            entry TEXT NOT NULL,
+            PRIMARY KEY (user_id, progress_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_progress_topic ON progress (user_id, topic_id);
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            topic_id TEXT NOT NULL,
+            action TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            entry TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_time ON history (user_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_history_topic ON history (user_id, topic_id, timestamp);
+        CREATE TABLE IF NOT EXISTS generated_content (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            run_id TEXT,
+            topic_id TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_content_topic ON generated_content (user_id, topic_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_content_run ON generated_content (run_id);
+    """)
+    return conn
+
+
+def _topic_key(resource) -> str:
+    # Resources loaded from the curriculum may have an empty topic_id; fall back to the topic name.
+    return resource.topic_id or resource.topic
+
+
+def _history_rows(entries: Iterable[HistoryEntry]) -> list:
+    return [(str(entry.user_id), _topic_key(entry.resource), entry.action, entry.timestamp.isoformat(),
+             entry.model_dump_json()) for entry in entries]
+
+
+def _progress_rows(entries: Iterable[UserProgress]) -> list:
+    return [(str(entry.user_id), entry.id, _topic_key(entry.resource), int(entry.completed),
+             entry.completion_date.isoformat() if entry.completion_date else None, entry.score,
+             entry.model_dump_json()) for entry in entries]
+
+
+_UPSERT_PROGRESS = """
+    INSERT INTO progress (user_id, progress_id, topic_id, completed, completion_date, score, entry)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, progress_id) DO UPDATE SET topic_id = excluded.topic_id, completed = excluded.completed,
+        completion_date = excluded.completion_date, score = excluded.score, entry = excluded.entry
+"""
+_INSERT_HISTORY = "INSERT INTO history (user_id, topic_id, action, timestamp, entry) VALUES (?, ?, ?, ?, ?)"
+
+
+def save_learner(user: UserInfo, path: str = LEARNER_DB_PATH):
+    with closing(_connect(path)) as conn, conn:
+        conn.execute("INSERT INTO learners (user_id, profile, updated_at) VALUES (?, ?, ?) "
+                     "ON CONFLICT(user_id) DO UPDATE SET profile = excluded.profile, updated_at = excluded.updated_at",
+                     (str(user.id), user.model_dump_json(), time.time()))
+
+
+def get_learner(user_id, path: str = LEARNER_DB_PATH) -> Optional[UserInfo]:
+    with closing(_connect(path)) as conn:
+        row = conn.execute("SELECT profile FROM learners WHERE user_id = ?", (str(user_id),)).fetchone()
+    return UserInfo.model_validate_json(row[0]) if row else None
+
+
+def save_progress(entries: Iterable[UserProgress], path: str = LEARNER_DB_PATH) -> int:
+    """Insert or update progress entries in one batch. Returns the number written."""
+    rows = _progress_rows(entries)
+    with closing(_connect(path)) as conn, conn:
+        conn.executemany(_UPSERT_PROGRESS, rows)
+    return len(rows)
+
+
+def add_history(entries: Iterable[HistoryEntry], path: str = LEARNER_DB_PATH) -> int:
+    """Append history entries in one batch. Returns the number written."""
+    rows = _history_rows(entries)
+    with closing(_connect(path)) as conn, conn:
+        conn.executemany(_INSERT_HISTORY, rows)
+    return len(rows)
+
+
+def get_history(user_id, topic_id: Optional[str] = None, limit: int = HISTORY_WINDOW,
+                before: Optional[datetime] = None, path: str = LEARNER_DB_PATH) -> List[HistoryEntry]:
+    """
+    A page of a learner's history, newest first.
+
+    Args:
+        user_id: Learner id.
+        topic_id (Optional[str]): Only entries for this topic id (or topic name, if the id was empty).
+        limit (int): Page size.
+        before (Optional[datetime]): Cursor: only entries older than this, e.g. the timestamp
+            of the last entry of the previous page.
+
+    Returns:
+        List[HistoryEntry]: At most `limit` entries.
+    """
+    query, params = "SELECT entry FROM history WHERE user_id = ?", [str(user_id)]
+    if topic_id is not None:
+        query += " AND topic_id = ?"
+        params.append(topic_id)
+    if before is not None:
+        query += " AND timestamp < ?"
+        params.append(before.isoformat())
+    query += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    params.append(limit)
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(query, params).fetchall()
+    return [HistoryEntry.model_validate_json(row[0]) for row in rows]
+
+
+def get_progress(user_id, topic_id: Optional[str] = None, limit: int = 50, offset: int = 0,
+                 path: str = LEARNER_DB_PATH) -> List[UserProgress]:
+    """A page of a learner's progress entries, optionally for one topic."""
+    query, params = "SELECT entry FROM progress WHERE user_id = ?", [str(user_id)]
+    if topic_id is not None:
+        query += " AND topic_id = ?"
+        params.append(topic_id)
+    query += " ORDER BY progress_id LIMIT ? OFFSET ?"
+    params += [limit, offset]
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(query, params).fetchall()
+    return [UserProgress.model_validate_json(row[0]) for row in rows]
+
+
+def list_content(user_id, topic_id: Optional[str] = None, limit: int = 20, offset: int = 0,
+                 path: str = LEARNER_DB_PATH) -> List[dict]:
+    """A page of the content generated for a learner, newest first."""
+    query, params = ("SELECT run_id, topic_id, content_type, content, created_at FROM generated_content "
+                     "WHERE user_id = ?"), [str(user_id)]
+    if topic_id is not None:
+        query += " AND topic_id = ?"
+        params.append(topic_id)
+    query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+    params += [limit, offset]
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(query, params).fetchall()
+    return [dict(zip(("run_id", "topic_id", "content_type", "content", "created_at"), row)) for row in rows]
+
+
+def load_learner_slice(user_data: dict, history_window: int = HISTORY_WINDOW, path: str = LEARNER_DB_PATH) -> dict:
+    """
+    Fill the `history` and `progress` of a run's input from the store unless the caller
+    supplied them: the learner's `history_window` most recent history entries and their
+    progress for the requested topic only.
+    """
+    user_id = (user_data.get("user") or {}).get("id")
+    resource = user_data.get("current_resource") or {}
+    if user_id is None or (user_data.get("history") and user_data.get("progress")):
+        return user_data
+    try:
+        user_data = dict(user_data)
+        if not user_data.get("history"):
+            user_data["history"] = [entry.model_dump() for entry in get_history(user_id, limit=history_window,
+                                                                                 path=path)]
+        if not user_data.get("progress") and resource:
+            topic_id = resource.get("topic_id") or resource.get("topic")
+            user_data["progress"] = [entry.model_dump() for entry in get_progress(user_id, topic_id, path=path)]
+    except (sqlite3.Error, ValueError) as e:
+        logging.error(f"Failed to load history and progress of user {user_id}: {e}")
+    return user_data
+
+
+def record_run(state, profile: Optional[dict] = None, path: str = LEARNER_DB_PATH):
+    """
+    Persist what a finished run produced in one transaction: the learner's profile, their
+    progress entries, a history entry for the run and the generated content.
+
+    Args:
+        state: Final `LearningState` (or its dict form, as returned by the graph).
+        profile (Optional[dict]): The learner's profile as given in the run input. The final
+            state holds the LLM summary of it instead, so the stored profile is only updated
+            when this is passed.
+    """
+    try:
+        if isinstance(state, dict):
+            state = LearningState.model_validate(state)
+        user = UserInfo.model_validate(profile) if profile is not None else None
+    except ValueError as e:
+        logging.error(f"Run output or input profile is not valid, not recording the run: {e}")
+        return
+    resource = state.current_resource
+    user_id = str(state.user.id)
+    history = []
+    if resource is not None and state.content is not None:
+        history.append(HistoryEntry(user_id=state.user.id, resource=resource, timestamp=datetime.utcnow(),
+                                    action=f"generate_{state.content_type.value}"))
+    try:
+        with closing(_connect(path)) as conn, conn:
+            if user is not None:
+                conn.execute("INSERT INTO learners (user_id, profile, updated_at) VALUES (?, ?, ?) "
+                             "ON CONFLICT(user_id) DO UPDATE SET profile = excluded.profile, "
+                             "updated_at = excluded.updated_at", (str(user.id), user.model_dump_json(), time.time()))
+            conn.executemany(_UPSERT_PROGRESS, _progress_rows(state.progress))
+            conn.executemany(_INSERT_HISTORY, _history_rows(history))
+            if history:
+                conn.execute("INSERT INTO generated_content (user_id, run_id, topic_id, content_type, content, "
+                             "created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                             (user_id, state.run_id, _topic_key(resource), state.content_type.value,
+                              state.content.content, time.time()))
+    except sqlite3.Error as e:
+        logging.error(f"Failed to record run {state.run_id} of user {user_id}: {e}")
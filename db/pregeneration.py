@@ -0,0 +1,190 @@
+"""
+Work queue and result cache for offline curriculum pre-generation (`pregenerate.py`).
+
+Every curriculum topic is known ahead of time, so content for each (grade, topic_id,
+style, content_type) combination can be generated before a student asks for it. The
+queue records the status of each combination. An interrupted job resumes with the
+items that are not done yet. Validated results are kept in `pregenerated_content`,
+where `graph_run` looks them up before running the graph.
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Iterable, List, Optional
+
+PREGENERATION_DB_PATH = os.environ.get("PREGENERATION_DB_PATH", "./data/pregenerated.sqlite")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS pregeneration_queue (
+            grade INTEGER NOT NULL,
+            topic_id TEXT NOT NULL,
+            style TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            resource TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (grade, topic_id, style, content_type)
+        );
+        CREATE INDEX IF NOT EXISTS idx_pregeneration_status ON pregeneration_queue (status, attempts);
+        CREATE TABLE IF NOT EXISTS pregenerated_content (
+            grade INTEGER NOT NULL,
+            topic_id TEXT NOT NULL,
+            style TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            content TEXT NOT NULL,
+            feedback TEXT,
+            validation_result TEXT,
+            run_id TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (grade, topic_id, style, content_type)
+        );
+        CREATE INDEX IF NOT EXISTS idx_pregenerated_topic ON pregenerated_content (grade, topic, content_type);
+    """)
+    return conn
+
+
+def item_key(item: dict) -> str:
+    """Id of a queue item."""
+    return f"pregen-{item['grade']}-{item['topic_id']}-{item['style']}-{item['content_type']}"
+
+
+def attempt_run_id(item: dict) -> str:
+    """
+    Run id of the graph run of a claimed item's current attempt. Every attempt gets a fresh
+    checkpoint thread, so a retry does not inherit the history and progress of the last one.
+    An interrupted attempt keeps its number (`reset_interrupted`), so it resumes.
+    """
+    return f"{item_key(item)}-{item['attempts']}"
+
+
+def enqueue(items: Iterable[dict], path: str = PREGENERATION_DB_PATH) -> int:
+    """
+    Add (grade, topic_id, style, content_type, resource) items to the queue. Items already
+    queued keep their status, so re-running the job does not redo finished work.
+
+    Returns:
+        int: Number of new items.
+    """
+    now = time.time()
+    rows = [(item["grade"], item["topic_id"], item["style"], item["content_type"], json.dumps(item["resource"]),
+             PENDING, now) for item in items]
+    with closing(_connect(path)) as conn, conn:
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO pregeneration_queue "
+                         "(grade, topic_id, style, content_type, resource, status, updated_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return conn.total_changes - before
+
+
+def reset_interrupted(path: str = PREGENERATION_DB_PATH) -> int:
+    """
+    Return items left `running` by an interrupted job to the queue. Their interrupted
+    attempt is not counted, so claiming them again resumes its graph run. Returns their
+    number.
+    """
+    with closing(_connect(path)) as conn, conn:
+        return conn.execute("UPDATE pregeneration_queue SET status = ?, attempts = MAX(attempts - 1, 0), "
+                            "updated_at = ? WHERE status = ?", (PENDING, time.time(), RUNNING)).rowcount
+
+
+def claim(max_attempts: int, path: str = PREGENERATION_DB_PATH) -> Optional[dict]:
+    """
+    Mark the next pending item, or failed item with attempts left, as running and return it.
+
+    Returns:
+        Optional[dict]: The item, or None when the queue is drained.
+    """
+    with closing(_connect(path)) as conn, conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT grade, topic_id, style, content_type, resource, attempts FROM pregeneration_queue "
+                           "WHERE status = ? OR (status = ? AND attempts < ?) "
+                           "ORDER BY attempts, grade, topic_id LIMIT 1", (PENDING, FAILED, max_attempts)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE pregeneration_queue SET status = ?, attempts = attempts + 1, updated_at = ? "
+                     "WHERE grade = ? AND topic_id = ? AND style = ? AND content_type = ?",
+                     (RUNNING, time.time(), *row[:4]))
+    grade, topic_id, style, content_type, resource, attempts = row
+    return {"grade": grade, "topic_id": topic_id, "style": style, "content_type": content_type,
+            "resource": json.loads(resource), "attempts": attempts + 1}
+
+
+def finish(item: dict, error: Optional[str] = None, path: str = PREGENERATION_DB_PATH):
+    """Mark a claimed item done, or failed with `error`."""
+    with closing(_connect(path)) as conn, conn:
+        conn.execute("UPDATE pregeneration_queue SET status = ?, error = ?, updated_at = ? "
+                     "WHERE grade = ? AND topic_id = ? AND style = ? AND content_type = ?",
+                     (FAILED if error else DONE, error, time.time(), item["grade"], item["topic_id"], item["style"],
+                      item["content_type"]))
+
+
+def queue_counts(path: str = PREGENERATION_DB_PATH) -> dict:
+    with closing(_connect(path)) as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM pregeneration_queue GROUP BY status").fetchall())
+
+
+def save_pregenerated(item: dict, state, path: str = PREGENERATION_DB_PATH):
+    """Store the content of a finished run for `item`, with its feedback and validation result."""
+    with closing(_connect(path)) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO pregenerated_content (grade, topic_id, style, content_type, topic, "
+                     "content, feedback, validation_result, run_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (item["grade"], item["topic_id"], item["style"], item["content_type"],
+                      item["resource"]["topic"].lower(), state.content.content,
+                      state.feedback.model_dump_json() if state.feedback else None,
+                      state.validation_result.model_dump_json() if state.validation_result else None,
+                      state.run_id, time.time()))
+
+
+def get_pregenerated(grade: int, topic_id: str, topic: str, style: str, content_type: str,
+                     path: str = PREGENERATION_DB_PATH) -> Optional[dict]:
+    """
+    Pre-generated content for a resource, matched on its topic id or, when the id is empty,
+    its topic title.
+
+    Returns:
+        Optional[dict]: `content`, `feedback`, `validation_result` and `run_id`, or None.
+    """
+    if topic_id:
+        where, params = "topic_id = ?", (topic_id,)
+    else:
+        where, params = "topic = ?", (topic.lower(),)
+    try:
+        with closing(_connect(path)) as conn:
+            row = conn.execute(f"SELECT content, feedback, validation_result, run_id FROM pregenerated_content "
+                               f"WHERE grade = ? AND {where} AND style = ? AND content_type = ? "
+                               f"ORDER BY created_at DESC LIMIT 1", (grade, *params, style, content_type)).fetchone()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to read pre-generated content: {e}")
+        return None
+    if row is None:
+        return None
+    content, feedback, validation_result, run_id = row
+    return {"content": content, "feedback": json.loads(feedback) if feedback else None,
+            "validation_result": json.loads(validation_result) if validation_result else None, "run_id": run_id}
+
+
+def list_pregenerated(grade: Optional[int] = None, path: str = PREGENERATION_DB_PATH) -> List[dict]:
+    """Keys of the stored results, optionally for one grade."""
+    query, params = "SELECT grade, topic_id, style, content_type, run_id FROM pregenerated_content", ()
+    if grade is not None:
+        query, params = query + " WHERE grade = ?", (grade,)
+    with closing(_connect(path)) as conn:
+        rows = conn.execute(query + " ORDER BY grade, topic_id", params).fetchall()
+    return [dict(zip(("grade", "topic_id", "style", "content_type", "run_id"), row)) for row in rows]
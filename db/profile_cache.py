@@ -0,0 +1,70 @@
+"""
+SQLite cache of summarised user profiles.
+
+`user_info_node` asks an LLM to reword the raw profile (username, age, grade, ...) on
+every run. The summary only depends on those fields, so it is stored per user id together
+with a hash of the raw profile and reused until the profile changes.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Optional, Tuple
+
+PROFILE_CACHE_DB_PATH = os.environ.get("PROFILE_CACHE_DB_PATH", "./data/profile_cache.sqlite")
+# Cached summaries older than this are refreshed in the background; 0 disables refreshes.
+PROFILE_REFRESH_AGE = float(os.environ.get("PROFILE_REFRESH_AGE_SECONDS", 30 * 24 * 3600))
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            user_id TEXT PRIMARY KEY,
+            profile_hash TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def profile_hash(profile: dict) -> str:
+    """Stable hash of the raw profile fields the summary is derived from."""
+    return hashlib.sha256(json.dumps(profile, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def get_cached_profile(user_id, profile_digest: str, path: str = PROFILE_CACHE_DB_PATH) -> Optional[Tuple[dict, float]]:
+    """
+    Returns:
+        Optional[Tuple[dict, float]]: The cached summary and its age in seconds, or None
+        if there is no summary for this user or the profile has changed since.
+    """
+    try:
+        with closing(_connect(path)) as conn:
+            row = conn.execute("SELECT summary, updated_at FROM user_profiles WHERE user_id = ? AND profile_hash = ?",
+                               (str(user_id), profile_digest)).fetchone()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to read cached profile of user {user_id}: {e}")
+        return None
+    if row is None:
+        return None
+    return json.loads(row[0]), time.time() - row[1]
+
+
+def save_profile(user_id, profile_digest: str, summary: dict, path: str = PROFILE_CACHE_DB_PATH):
+    try:
+        with closing(_connect(path)) as conn, conn:
+            conn.execute("""
+                INSERT INTO user_profiles (user_id, profile_hash, summary, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET profile_hash = excluded.profile_hash,
+                    summary = excluded.summary, updated_at = excluded.updated_at
+            """, (str(user_id), profile_digest, json.dumps(summary, default=str), time.time()))
+    except sqlite3.Error as e:
+        logging.error(f"Failed to cache profile of user {user_id}: {e}")
@@ -0,0 +1,171 @@
+"""
+Append-only log of finished graph runs.
+
+Each finished run is appended to one JSONL file as a single line,
+`{"run_id", "user_id", "recorded_at", "state"}`, instead of rewriting a shared
+`learning_state.json`. Concurrent writers do not clobber each other:
+- every line is written with one `O_APPEND` write under an exclusive file lock;
+- a crash mid-write leaves at most a truncated last line, which readers skip.
+
+A SQLite index maps run ids and user ids to byte offsets in the log. Lookups then read
+only the line they need. `rebuild_index` recreates the index from the log if it is
+lost or falls behind.
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still single writes, just not locked across processes.
+    fcntl = None
+
+RUN_LOG_PATH = os.environ.get("RUN_LOG_PATH", "./data/runs/runs.jsonl")
+RUN_INDEX_DB_PATH = os.environ.get("RUN_INDEX_DB_PATH", "./data/runs/index.sqlite")
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS run_index (
+            run_id TEXT NOT NULL,
+            user_id TEXT,
+            recorded_at REAL NOT NULL,
+            offset INTEGER NOT NULL PRIMARY KEY,
+            length INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_run_index_run ON run_index (run_id, recorded_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_run_index_user ON run_index (user_id, recorded_at)")
+    return conn
+
+
+def _serialise_state(state) -> str:
+    # pydantic's Rust serialiser writes compact JSON much faster than json.dumps(indent=4).
+    if hasattr(state, "model_dump_json"):
+        return state.model_dump_json()
+    return json.dumps(state, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _user_id(state) -> Optional[str]:
+    user = state.get("user") if isinstance(state, dict) else getattr(state, "user", None)
+    user_id = user.get("id") if isinstance(user, dict) else getattr(user, "id", None)
+    return str(user_id) if user_id is not None else None
+
+
+def _append(path: str, data: bytes) -> int:
+    """Append `data` in one write under an exclusive lock. Returns its byte offset."""
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        offset = os.fstat(fd).st_size
+        if offset and hasattr(os, "pread") and os.pread(fd, 1, offset - 1) != b"\n":
+            # Terminate a line truncated by an earlier crash so this record starts cleanly.
+            data = b"\n" + data
+            offset += 1
+        written = 0
+        while written < len(data):
+            written += os.write(fd, data[written:])
+        os.fsync(fd)
+        return offset
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def append_run(state, run_id: Optional[str] = None, path: str = RUN_LOG_PATH,
+               index_path: str = RUN_INDEX_DB_PATH) -> Optional[int]:
+    """
+    Append a finished run's state to the log and index it.
+
+    Args:
+        state: Final `LearningState` (or its dict form).
+        run_id (Optional[str]): Defaults to the state's `run_id`.
+
+    Returns:
+        Optional[int]: Byte offset of the record in the log, or None if it could not be written.
+    """
+    run_id = run_id or (state.get("run_id") if isinstance(state, dict) else getattr(state, "run_id", None))
+    user_id = _user_id(state)
+    recorded_at = time.time()
+    try:
+        line = (f'{{"run_id":{json.dumps(run_id)},"user_id":{json.dumps(user_id)},'
+                f'"recorded_at":{recorded_at},"state":{_serialise_state(state)}}}\n').encode("utf-8")
+        offset = _append(path, line)
+    except Exception as e:
+        logging.error(f"Failed to append run {run_id} to {path}: {e}")
+        return None
+    try:
+        with closing(_connect(index_path)) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO run_index (run_id, user_id, recorded_at, offset, length) "
+                         "VALUES (?, ?, ?, ?, ?)", (run_id, user_id, recorded_at, offset, len(line)))
+    except sqlite3.Error as e:
+        logging.error(f"Run {run_id} was logged but not indexed ({e}); run rebuild_index() to repair.")
+    logging.info(f"Run {run_id} appended to {path} at offset {offset}")
+    return offset
+
+
+def _read_record(path: str, offset: int, length: int) -> Optional[dict]:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError:
+        logging.error(f"Corrupt run log record at offset {offset} of {path}")
+        return None
+
+
+def get_run(run_id: str, path: str = RUN_LOG_PATH, index_path: str = RUN_INDEX_DB_PATH) -> Optional[dict]:
+    """The latest logged record of `run_id` (a resumed run may have several), or None."""
+    with closing(_connect(index_path)) as conn:
+        row = conn.execute("SELECT offset, length FROM run_index WHERE run_id = ? "
+                           "ORDER BY recorded_at DESC LIMIT 1", (run_id,)).fetchone()
+    if row is None:
+        return None
+    return _read_record(path, *row)
+
+
+def list_runs(user_id, limit: int = 20, offset: int = 0, index_path: str = RUN_INDEX_DB_PATH) -> List[dict]:
+    """Run ids and timestamps of a user's logged runs, newest first, without reading the log."""
+    with closing(_connect(index_path)) as conn:
+        rows = conn.execute("SELECT run_id, recorded_at FROM run_index WHERE user_id = ? "
+                            "ORDER BY recorded_at DESC LIMIT ? OFFSET ?", (str(user_id), limit, offset)).fetchall()
+    return [{"run_id": run_id, "recorded_at": recorded_at} for run_id, recorded_at in rows]
+
+
+def rebuild_index(path: str = RUN_LOG_PATH, index_path: str = RUN_INDEX_DB_PATH) -> int:
+    """
+    Recreate the index from the log, skipping a truncated last line.
+
+    Returns:
+        int: Number of records indexed.
+    """
+    rows = []
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    rows.append((record["run_id"], record.get("user_id"), record["recorded_at"], offset, len(line)))
+                except (json.JSONDecodeError, KeyError):
+                    logging.warning(f"Skipping unreadable run log record at offset {offset}")
+                offset += len(line)
+    with closing(_connect(index_path)) as conn, conn:
+        conn.execute("DELETE FROM run_index")
+        conn.executemany("INSERT INTO run_index (run_id, user_id, recorded_at, offset, length) VALUES (?, ?, ?, ?, ?)",
+                         rows)
+    return len(rows)
@@ -0,0 +1,189 @@
+"""
+Precomputed topic-similarity graph over the curriculum lesson files.
+
+`build_topic_graph` embeds every lesson once and computes two k-nearest-neighbour tables:
+- related: the most similar topics anywhere in the curriculum;
+- next: the most similar topics that come later in curriculum order (grade, then topic
+  id), with a bonus for staying in the same unit.
+
+The tables are saved as `.npy` files next to a `topics.json` list and memory-mapped on
+load. Looking up the related or next topics of a resource is then a dict lookup plus a
+row read, with no embedding or vector query at request time.
+
+Build or rebuild the graph after changing the lesson files:
+    python -m db.topic_graph --k 8
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db.loader import load_json_data
+
+TOPIC_GRAPH_DIR = os.environ.get("TOPIC_GRAPH_DIR", "./data/topic_graph")
+TOPIC_GRAPH_K = int(os.environ.get("TOPIC_GRAPH_K", "8"))
+LESSON_FILES = ("lessons/class_11_physics.json", "lessons/class_12_physics.json")
+# Added to the similarity of a later topic in the same unit when ranking next topics.
+SAME_UNIT_BONUS = 0.1
+
+_TABLES = ("related", "related_scores", "next", "next_scores")
+
+
+def _document(lesson: dict) -> str:
+    # Same text as the lessons collection in db/vector_db.py.
+    return (f"{lesson.get('unit', '')} {lesson.get('topic_title', '')} {lesson.get('description', '')} "
+            f"{lesson.get('elaboration', '')}")
+
+
+def _curriculum_order(lesson: dict, position: int) -> tuple:
+    """Sort key: grade, then numeric topic id ("2.5" < "2.10"), then position in the file."""
+    topic_id = str(lesson.get("topic_id", ""))
+    numbers = tuple(int(part) for part in topic_id.split(".")) if re.fullmatch(r"\d+(\.\d+)*", topic_id) else None
+    # Non-numeric ids (evaluation components, instruments) come after the numbered topics.
+    return lesson.get("grade", 0), numbers is None, numbers or (), position
+
+
+def _top_k(scores: np.ndarray, k: int):
+    """Column indices and values of the `k` highest finite scores per row, best first; -1 pads."""
+    k = max(1, min(k, scores.shape[1]))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    top[~np.isfinite(top_scores)] = -1
+    return top.astype(np.int32), np.where(np.isfinite(top_scores), top_scores, 0).astype(np.float16)
+
+
+def build_topic_graph(k: int = TOPIC_GRAPH_K, path: str = TOPIC_GRAPH_DIR) -> int:
+    """
+    Embed every lesson of `LESSON_FILES` and save the related and next topic tables.
+
+    Returns:
+        int: Number of topics in the graph.
+    """
+    from models.embedding_model import embedding_model
+
+    lessons = [lesson for filename in LESSON_FILES for lesson in load_json_data(filename)]
+    if not lessons:
+        raise ValueError(f"No lessons found in {', '.join(LESSON_FILES)}")
+    logging.info(f"Encoding {len(lessons)} lessons for the topic graph")
+    embeddings = np.asarray(embedding_model.encode([_document(lesson) for lesson in lessons],
+                                                   normalize_embeddings=True), dtype=np.float32)
+    similarity = embeddings @ embeddings.T
+    np.fill_diagonal(similarity, -np.inf)
+
+    rank = np.empty(len(lessons), dtype=np.int64)
+    rank[sorted(range(len(lessons)), key=lambda i: _curriculum_order(lessons[i], i))] = np.arange(len(lessons))
+    units = np.array([f"{lesson.get('grade')}|{lesson.get('unit', '')}".lower() for lesson in lessons])
+    later = rank[None, :] > rank[:, None]
+    next_scores = np.where(later, similarity + SAME_UNIT_BONUS * (units[None, :] == units[:, None]), -np.inf)
+
+    tables = dict(zip(("related", "related_scores"), _top_k(similarity, k)))
+    tables.update(zip(("next", "next_scores"), _top_k(next_scores, k)))
+    os.makedirs(path, exist_ok=True)
+    for name in _TABLES:
+        np.save(os.path.join(path, f"{name}.npy"), tables[name])
+    topics = [{"grade": lesson.get("grade"), "topic_id": str(lesson.get("topic_id", "")),
+               "topic": lesson.get("topic_title", ""), "unit": lesson.get("unit", "")} for lesson in lessons]
+    with open(os.path.join(path, "topics.json"), "w", encoding="utf-8") as f:
+        json.dump(topics, f, ensure_ascii=False)
+    logging.info(f"Topic graph with {len(topics)} topics and k={k} saved to {path}")
+    return len(topics)
+
+
+class TopicGraph:
+    """Memory-mapped related and next topic tables with O(1) lookups by topic."""
+
+    def __init__(self, path: str = TOPIC_GRAPH_DIR):
+        with open(os.path.join(path, "topics.json"), "r", encoding="utf-8") as f:
+            self.topics = json.load(f)
+        self.tables = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _TABLES}
+        self._by_id = {(topic["grade"], topic["topic_id"]): row for row, topic in enumerate(self.topics)}
+        self._by_title = {(topic["grade"], topic["topic"].lower()): row for row, topic in enumerate(self.topics)}
+
+    def find(self, grade: int, topic_id: str = "", topic: str = "") -> Optional[int]:
+        """Row of a topic, by grade and topic id or, when the id is empty or unknown, its title."""
+        row = self._by_id.get((grade, topic_id)) if topic_id else None
+        if row is None and topic:
+            row = self._by_title.get((grade, topic.lower()))
+        return row
+
+    def _neighbours(self, table: str, row: int, k: Optional[int]) -> List[dict]:
+        indices, scores = self.tables[table][row], self.tables[f"{table}_scores"][row]
+        return [{**self.topics[index], "score": float(score)}
+                for index, score in list(zip(indices, scores))[:k] if index >= 0]
+
+    def related(self, grade: int, topic_id: str = "", topic: str = "", k: Optional[int] = None) -> List[dict]:
+        """Most similar topics, best first, or [] if the topic is not in the graph."""
+        row = self.find(grade, topic_id, topic)
+        return [] if row is None else self._neighbours("related", row, k)
+
+    def next_topics(self, grade: int, topic_id: str = "", topic: str = "", k: Optional[int] = None) -> List[dict]:
+        """Most similar later topics in curriculum order, best first, or [] if the topic is not in the graph."""
+        row = self.find(grade, topic_id, topic)
+        return [] if row is None else self._neighbours("next", row, k)
+
+
+# Loaded graphs by path, with the modification time of their topics.json.
+_graphs: Dict[str, Tuple[int, TopicGraph]] = {}
+_missing_logged = set()
+_graphs_lock = threading.Lock()
+
+
+def load_topic_graph(path: str = TOPIC_GRAPH_DIR) -> Optional[TopicGraph]:
+    """
+    The process-wide topic graph at `path`, or None if it has not been built. Only loaded
+    graphs are cached, keyed on the modification time of `topics.json` (written last by
+    `build_topic_graph`), so a graph built or rebuilt while the process runs is picked up.
+    """
+    try:
+        mtime = os.stat(os.path.join(path, "topics.json")).st_mtime_ns
+    except FileNotFoundError:
+        if path not in _missing_logged:
+            _missing_logged.add(path)
+            logging.warning(f"No topic graph in {path}; build it with `python -m db.topic_graph`.")
+        return None
+    with _graphs_lock:
+        cached = _graphs.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            graph = TopicGraph(path)
+        except (OSError, ValueError) as e:
+            logging.error(f"Failed to load the topic graph from {path}: {e}")
+            return None
+        _graphs[path] = (mtime, graph)
+        _missing_logged.discard(path)
+        return graph
+
+
+def related_examples(resource, k: int = 3) -> Optional[List[str]]:
+    """
+    `LearningState.related_examples` for a resource: titles of its related topics and the
+    topics to study next, from the precomputed graph. None if the graph is unavailable or
+    does not contain the resource.
+    """
+    graph = load_topic_graph()
+    if graph is None or resource is None:
+        return None
+    related = graph.related(resource.grade, resource.topic_id, resource.topic, k)
+    following = graph.next_topics(resource.grade, resource.topic_id, resource.topic, k)
+    if not related and not following:
+        return None
+    return ([f"Related: {topic['topic']} ({topic['unit']}, grade {topic['grade']})" for topic in related] +
+            [f"Next: {topic['topic']} ({topic['unit']}, grade {topic['grade']})" for topic in following])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the topic-similarity graph from the lesson files.")
+    parser.add_argument("--k", type=int, default=TOPIC_GRAPH_K, help="Neighbours kept per topic.")
+    parser.add_argument("--path", default=TOPIC_GRAPH_DIR, help="Output directory.")
+    args = parser.parse_args()
+    print(f"Topic graph with {build_topic_graph(args.k, args.path)} topics saved to {args.path}")
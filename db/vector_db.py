@@ -1,12 +1,19 @@
 """
 Vector database utilities for building and saving ChromaDB collections from lesson and scraped data.
 """
+import asyncio
+import hashlib
 import logging
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
 
 import chromadb
 
 from db.loader import load_json_data
 from models.embedding_model import embedding_model
+from scrapper.dedup import dedupe_records
 
 
 def sanitize_metadata(metadata: dict) -> dict:
@@ -17,7 +24,17 @@ def clean_metadata(metadata: dict) -> dict:
     return {k: v for k, v in metadata.items() if v is not None}
 
 
-def build_chroma_db_collection(filename: str = 'lessons/class_11_physics.json', collection_name: str = 'lessons'):
+@lru_cache(maxsize=None)
+def get_chroma_client(vdb_path: str = './local VDB/chromadb'):
+    """
+    Return the process-wide ChromaDB client for `vdb_path`, opening it on first use.
+    """
+    logging.info(f"Opening ChromaDB client at {vdb_path}")
+    return chromadb.PersistentClient(path=vdb_path)
+
+
+def build_chroma_db_collection(filename: str = 'lessons/class_11_physics.json', collection_name: str = 'lessons',
+                               vdb_path: str = './local VDB/chromadb'):
     logging.info(f"Building ChromaDB collection for {filename} with name '{collection_name}'")
     lessons = load_json_data(filename)
     documents = [
@@ -50,7 +67,7 @@ def build_chroma_db_collection(filename: str = 'lessons/class_11_physics.json',
         for lesson in lessons
     ]
 
-    client = chromadb.PersistentClient(path='./local VDB/chromadb')
+    client = get_chroma_client(vdb_path)
     logging.info("Connecting to ChromaDB")
     collection = client.get_or_create_collection(name=collection_name)
     try:
@@ -65,6 +82,66 @@ def build_chroma_db_collection(filename: str = 'lessons/class_11_physics.json',
         logging.error(f"Error adding documents to ChromaDB collection '{collection_name}': {e}")
 
 
+def scraped_record_id(url: str) -> str:
+    """
+    Stable ChromaDB id for a scraped page, derived from its normalised URL.
+
+    The scheme and host are lower-cased and the fragment and trailing slash dropped,
+    so re-crawling the same page maps onto the same id instead of a new one.
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip('/') or '/'
+    normalised = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ''))
+    return hashlib.sha1(normalised.encode('utf-8')).hexdigest()
+
+
+def scraped_document(item: dict) -> str:
+    return f"{item.get('main_findings')} {item.get('keywords')} {item.get('headings')}"
+
+
+def scraped_metadata(item: dict) -> dict:
+    return sanitize_metadata({
+        "url": item.get("url", ""),
+        "headings": item.get("headings", []),
+        "main_findings": item.get("main_findings", []),
+        "keywords": item.get("keywords", []),
+        "duplicate_urls": item.get("duplicate_urls", []),
+    })
+
+
+def _indexable(item: dict) -> bool:
+    return bool(item.get('url')) and item.get('status', 'success') == 'success'
+
+
+def upsert_scraped_records(records: List[dict], collection) -> int:
+    """
+    Embed scraped records in one batch and upsert them under their URL-derived ids.
+
+    Records that failed to crawl or have no URL are skipped.
+
+    Args:
+        records (List[dict]): Extracted page records as produced by the crawler.
+        collection: ChromaDB collection holding scraped data.
+
+    Returns:
+        int: Number of records written.
+    """
+    records = [item for item in records if _indexable(item)]
+    if not records:
+        return 0
+    # Chroma rejects duplicate ids within one upsert; the last copy of a URL wins.
+    by_id = {scraped_record_id(item['url']): item for item in records}
+    documents = [scraped_document(item) for item in by_id.values()]
+    embeddings = embedding_model.encode(documents, show_progress_bar=False).tolist()
+    collection.upsert(
+        ids=list(by_id.keys()),
+        embeddings=embeddings,
+        documents=documents,
+        metadatas=[scraped_metadata(item) for item in by_id.values()]
+    )
+    return len(by_id)
+
+
 def save_scraped_data_to_vdb(
         scraped_file: str = "raw_data.json",
         vdb_path: str = "./local VDB/chromadb",
@@ -72,35 +149,128 @@ def save_scraped_data_to_vdb(
 ):
     logging.info(f"Loading scraped data from {scraped_file}")
     scrapped_data = load_json_data(scraped_file)
-    scrapped_documents = [f'{item.get('main_findings')} {item.get('keywords')} {item.get('headings')}' for item in
-                          scrapped_data]
+    scrapped_data = dedupe_records(scrapped_data)
+    logging.info(f"{len(scrapped_data)} scraped records left after near-duplicate removal")
+
+    collection = get_chroma_client(vdb_path).get_or_create_collection(collection_name)
 
     try:
-        embeddings = embedding_model.encode(scrapped_documents, show_progress_bar=True).tolist()
-        logging.info(f"Encoded {len(embeddings)} embeddings OF SCRAPPED DATA!")
+        written = upsert_scraped_records(scrapped_data, collection)
+        logging.info(f"Upserted {written} scraped records into ChromaDB collection '{collection_name}'")
     except Exception as e:
-        logging.error(f"Error encoding scraped documents for embeddings in save_scraped_data_to_vdb: {e}")
-        return
+        logging.error(f"Error adding scraped documents to ChromaDB collection '{collection_name}': {e}")
 
-    scrapped_meta = [
-        {
-            "headings": item.get("headings", []),
-            "main_findings": item.get("main_findings", []),
-            "keywords": item.get("keywords", []),
-        }
-        for item in scrapped_data
-    ]
 
-    client = chromadb.PersistentClient(path=vdb_path)
-    collection = client.get_or_create_collection(collection_name)
+class ScrapedDataIndexer:
+    """
+    Streams crawled records into the scraped-data collection as they arrive.
 
-    try:
-        collection.add(
-            ids=[str(i) for i in range(1, len(scrapped_data) + 1)],
-            embeddings=embeddings,
-            documents=scrapped_documents,
-            metadatas=[sanitize_metadata(_) for _ in scrapped_meta]
-        )
-        logging.info(f"ChromaDB collection '{collection_name}' built successfully")
-    except Exception as e:
-        logging.error(f"Error adding scraped documents to ChromaDB collection '{collection_name}': {e}")
+    Records are queued with `put`, which blocks once `max_pending` records are
+    waiting, so a fast crawler cannot outrun embedding. A background task drains the
+    queue in batches of up to `batch_size`, flushing a partial batch after
+    `flush_interval` seconds so fresh pages become retrievable quickly. Embedding runs
+    in a worker thread to keep the event loop free for crawling.
+
+    The crawler adds URLs to a record's `duplicate_urls` when it finds copies of the
+    page, which may be after the record was indexed. On `close` the metadata of such
+    records is rewritten, without embedding them again.
+
+    Usage:
+        async with ScrapedDataIndexer() as indexer:
+            async for record in crawl_and_extract_stream(urls):
+                await indexer.put(record)
+    """
+
+    def __init__(self,
+                 vdb_path: str = "./local VDB/chromadb",
+                 collection_name: str = "scraped_data",
+                 batch_size: int = 16,
+                 flush_interval: float = 2.0,
+                 max_pending: int = 64):
+        self.collection = get_chroma_client(vdb_path).get_or_create_collection(collection_name)
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._worker: Optional[asyncio.Task] = None
+        # Indexed records by id, with the number of duplicate URLs their metadata lists.
+        self._written: Dict[str, Tuple[dict, int]] = {}
+        self.indexed = 0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def put(self, record: dict):
+        """Queue a record for indexing, waiting while the queue is full."""
+        await self._queue.put(record)
+
+    async def put_many(self, records: Iterable[dict]):
+        for record in records:
+            await self.put(record)
+
+    async def close(self):
+        """Flush everything queued so far and stop the background task."""
+        if self._worker is None:
+            return
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+        await self._update_duplicates()
+        logging.info(f"Indexer closed after streaming {self.indexed} records into '{self.collection_name}'")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            batch = []
+            record = await self._queue.get()
+            if record is None:
+                break
+            batch.append(record)
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    done = True
+                    break
+                batch.append(record)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[dict]):
+        started = time.perf_counter()
+        # Counted before the upsert, so duplicates added while it runs are written on close.
+        counts = {scraped_record_id(item['url']): (item, len(item.get('duplicate_urls') or []))
+                  for item in batch if _indexable(item)}
+        try:
+            written = await asyncio.to_thread(upsert_scraped_records, batch, self.collection)
+            self.indexed += written
+            self._written.update(counts)
+            logging.info(f"Indexed {written} scraped records in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logging.error(f"Error upserting scraped batch into ChromaDB collection '{self.collection_name}': {e}")
+
+    async def _update_duplicates(self):
+        stale = {record_id: item for record_id, (item, count) in self._written.items()
+                 if len(item.get('duplicate_urls') or []) > count}
+        if not stale:
+            return
+        try:
+            await asyncio.to_thread(self.collection.update, ids=list(stale.keys()),
+                                    metadatas=[scraped_metadata(item) for item in stale.values()])
+            logging.info(f"Updated duplicate URLs of {len(stale)} scraped records")
+        except Exception as e:
+            logging.error(f"Error updating duplicate URLs in ChromaDB collection '{self.collection_name}': {e}")
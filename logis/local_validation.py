@@ -0,0 +1,179 @@
+"""
+Deterministic checks of generated markdown that do not need an LLM.
+
+`validate_markdown` covers the mechanical part of post-validation: heading structure,
+length, paragraph size, primary keyword placement, SEO metadata, broken markdown and link
+format. It runs in well under a millisecond, so `post_validator_node` only asks the LLM
+for the semantic checks (factual integrity, hallucinated content) and skips it when the
+local checks are clean and the reviewer's reliability score is high.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+MIN_WORDS = 300
+MAX_WORDS = 6000
+MAX_PARAGRAPH_WORDS = 120
+MAX_TITLE_TAG_CHARS = 60
+MAX_META_DESCRIPTION_CHARS = 155
+KEYWORD_WINDOW_WORDS = 25
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+LINK_PATTERN = re.compile(r"\[([^\]]*)\]\(([^)]*)\)")
+SPACED_LINK_PATTERN = re.compile(r"\[[^\]]+\]\s+\((https?://[^)]*)\)")
+METADATA_PATTERN = re.compile(r"^\W*(title_tag|meta_description)\W*:?\W*\s*(.*)$", re.IGNORECASE)
+WORD_PATTERN = re.compile(r"\w+")
+
+
+@dataclass
+class LocalValidationReport:
+    """Violations found by the local checks and the names of the checks that ran."""
+    violations: List[str] = field(default_factory=list)
+    checks: List[str] = field(default_factory=list)
+
+    @property
+    def is_clean(self) -> bool:
+        return not self.violations
+
+
+def _strip_fences(lines: List[str]) -> List[str]:
+    """Lines outside fenced code blocks."""
+    kept, in_fence = [], False
+    for line in lines:
+        if FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+            continue
+        if not in_fence:
+            kept.append(line)
+    return kept
+
+
+def _check_headings(lines: List[str], report: LocalValidationReport):
+    report.checks.append("headings")
+    headings = [(len(match.group(1)), match.group(2)) for match in map(HEADING_PATTERN.match, lines) if match]
+    h1_count = sum(1 for level, _ in headings if level == 1)
+    if h1_count != 1:
+        report.violations.append(f"The content has {h1_count} H1 headings; exactly one is required.")
+    if sum(1 for level, _ in headings if level == 2) < 2:
+        report.violations.append("The content has fewer than two H2 sections.")
+    for (previous, _), (level, text) in zip(headings, headings[1:]):
+        if level > previous + 1:
+            report.violations.append(f"Heading '{text}' skips from H{previous} to H{level}.")
+    for index, line in enumerate(lines):
+        if HEADING_PATTERN.match(line):
+            following = next((other for other in lines[index + 1:] if other.strip()), None)
+            match = HEADING_PATTERN.match(following) if following is not None else None
+            if following is None or (match and len(match.group(1)) <= len(HEADING_PATTERN.match(line).group(1))):
+                report.violations.append(f"Section '{HEADING_PATTERN.match(line).group(2)}' is empty.")
+
+
+def _check_length(lines: List[str], report: LocalValidationReport):
+    report.checks.append("length")
+    words = len(WORD_PATTERN.findall("\n".join(lines)))
+    if words < MIN_WORDS:
+        report.violations.append(f"The content is too short ({words} words, at least {MIN_WORDS} expected).")
+    elif words > MAX_WORDS:
+        report.violations.append(f"The content is too long ({words} words, at most {MAX_WORDS} expected).")
+    paragraph: List[str] = []
+    for line in lines + [""]:
+        if line.strip() and not HEADING_PATTERN.match(line) and not line.lstrip().startswith(("-", "*", "|", ">")):
+            paragraph.append(line)
+            continue
+        size = len(WORD_PATTERN.findall(" ".join(paragraph)))
+        if size > MAX_PARAGRAPH_WORDS:
+            report.violations.append(f"A paragraph starting '{' '.join(paragraph)[:40]}...' has {size} words; "
+                                     f"split it into blocks of at most {MAX_PARAGRAPH_WORDS}.")
+        paragraph = []
+
+
+def _words(text: str) -> List[str]:
+    """Lower-cased words of `text`, so punctuation such as "Coulomb’s" or "Geiger-Muller" compares equal."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+def _check_keyword(lines: List[str], keyword: str, report: LocalValidationReport):
+    report.checks.append("keyword")
+    phrase = " ".join(_words(keyword))
+    keyword = keyword.lower().strip()
+    body = [line for line in lines if not METADATA_PATTERN.match(line)]
+    opening = " ".join(_words(" ".join(line for line in body if not HEADING_PATTERN.match(line)))
+                       [:KEYWORD_WINDOW_WORDS])
+    if phrase not in opening:
+        report.violations.append(f"The primary keyword '{keyword}' is not in the first {KEYWORD_WINDOW_WORDS} words.")
+    subheadings = [" ".join(_words(match.group(2))) for match in map(HEADING_PATTERN.match, lines)
+                   if match and len(match.group(1)) > 1]
+    if not any(phrase in heading for heading in subheadings):
+        report.violations.append(f"The primary keyword '{keyword}' does not appear in any subheading.")
+
+
+def _check_metadata(lines: List[str], report: LocalValidationReport):
+    report.checks.append("seo_metadata")
+    found = {}
+    for line in lines:
+        match = METADATA_PATTERN.match(line)
+        if match:
+            found.setdefault(match.group(1).lower(), match.group(2).strip().strip("*").strip())
+    limits = {"title_tag": MAX_TITLE_TAG_CHARS, "meta_description": MAX_META_DESCRIPTION_CHARS}
+    for name, limit in limits.items():
+        if name not in found:
+            report.violations.append(f"The {name} metadata is missing.")
+        elif len(found[name]) > limit:
+            report.violations.append(f"The {name} is {len(found[name])} characters; at most {limit} allowed.")
+
+
+def _check_markdown(content: str, lines: List[str], report: LocalValidationReport):
+    report.checks.append("markdown")
+    fences = sum(1 for line in content.splitlines() if FENCE_PATTERN.match(line))
+    if fences % 2:
+        report.violations.append("A fenced code block is not closed.")
+    text = "\n".join(lines)
+    if text.count("$$") % 2:
+        report.violations.append("A $$ LaTeX block is not closed.")
+    for line in lines:
+        if line.count("**") % 2:
+            report.violations.append(f"Unbalanced bold markers in: '{line.strip()[:60]}'.")
+        if line.count("[") != line.count("]") or line.count("](") > line.count(")"):
+            report.violations.append(f"Broken link or bracket syntax in: '{line.strip()[:60]}'.")
+
+
+def _check_links(lines: List[str], allowed_urls: Optional[Iterable[str]], report: LocalValidationReport):
+    report.checks.append("links")
+    allowed = {url.rstrip("/") for url in allowed_urls} if allowed_urls is not None else None
+    text = "\n".join(lines)
+    for match in SPACED_LINK_PATTERN.finditer(text):
+        report.violations.append(f"Link '{match.group(0)[:60]}' has a space between its text and URL.")
+    for text_part, url in LINK_PATTERN.findall(text):
+        url = url.strip().split(" ")[0]
+        if not text_part.strip():
+            report.violations.append(f"Link to '{url}' has no text.")
+        if not re.match(r"^(https?://|#|mailto:)\S+$", url):
+            report.violations.append(f"Link '{url}' is not a valid absolute URL or anchor.")
+        elif allowed is not None and url.startswith("http") and url.rstrip("/") not in allowed:
+            report.violations.append(f"Link '{url}' is not one of the reference URLs.")
+
+
+def validate_markdown(content: str, keyword: Optional[str] = None,
+                      allowed_urls: Optional[Iterable[str]] = None) -> LocalValidationReport:
+    """
+    Run every local check over `content`.
+
+    Args:
+        content (str): Markdown lesson or blog post.
+        keyword (Optional[str]): Primary keyword (usually the topic); keyword checks are skipped if None.
+        allowed_urls (Optional[Iterable[str]]): Reference URLs; other absolute links are reported.
+            Link provenance is not checked if None.
+
+    Returns:
+        LocalValidationReport: Violations, in the same descriptive style as the LLM validator.
+    """
+    report = LocalValidationReport()
+    lines = _strip_fences(content.splitlines())
+    _check_headings(lines, report)
+    _check_length(lines, report)
+    if keyword:
+        _check_keyword(lines, keyword, report)
+    _check_metadata(lines, report)
+    _check_markdown(content, lines, report)
+    _check_links(lines, allowed_urls, report)
+    return report
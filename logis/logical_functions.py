@@ -1,33 +1,48 @@
 import logging
+import os
+import threading
+from collections import Counter
+from typing import Tuple
 
 import chromadb
 
-from db.vector_db import build_chroma_db_collection, save_scraped_data_to_vdb
+from db.vector_db import build_chroma_db_collection, save_scraped_data_to_vdb, get_chroma_client
 from models.embedding_model import embedding_model
 from schemas import LearningResource, ResourceSubject, LearningState, ContentType
+from utils.instrumentation import record_route_decision
+
+ROUTE_CONFIDENCE_THRESHOLD = float(os.environ.get('ROUTE_CONFIDENCE_THRESHOLD', '0.7'))
+BLOG_KEYWORDS = ("importance", "history", "story", "career", "daily life", "everyday", "real-world", "real world",
+                 "impact", "future", "famous", "discovery", "myth", "why ")
+LESSON_KEYWORDS = ("derive", "derivation", "calculate", "numerical", "problem", "solve", "formula", "law",
+                   "theorem", "equation", "experiment", "practical", "definition", "principle", "measurement")
+
+_route_sources = Counter()
+_route_sources_lock = threading.Lock()
 
 
 def load_or_build_collections(vdb_path, lessons_collection, scraped_collection):
-    client = chromadb.PersistentClient(path=vdb_path)
+    client = get_chroma_client(vdb_path)
 
     try:
         lessons_col = client.get_collection(lessons_collection)
         logging.info(f"Collection '{lessons_collection}' loaded successfully.")
     except chromadb.exceptions.CollectionNotFoundError:
         logging.warning(f"Collection '{lessons_collection}' not found. Building it now.")
-        build_chroma_db_collection()
+        build_chroma_db_collection(collection_name=lessons_collection, vdb_path=vdb_path)
         lessons_col = client.get_collection(lessons_collection)
     except Exception as e:
         logging.error(f"An unexpected error occurred while loading/building collection '{lessons_collection}': {e}")
         raise
 
+    # The crawler streams pages into the scraped collection as they arrive; raw_data.json
+    # is only used to seed an empty collection, and upserts make that idempotent.
     try:
-        scraped_col = client.get_collection(scraped_collection)
+        scraped_col = client.get_or_create_collection(scraped_collection)
+        if scraped_col.count() == 0:
+            logging.warning(f"Collection '{scraped_collection}' is empty. Seeding it from raw_data.json.")
+            save_scraped_data_to_vdb(vdb_path=vdb_path, collection_name=scraped_collection)
         logging.info(f"Collection '{scraped_collection}' loaded successfully.")
-    except chromadb.exceptions.CollectionNotFoundError:
-        logging.warning(f"Collection '{scraped_collection}' not found. Building it now.")
-        save_scraped_data_to_vdb()
-        scraped_col = client.get_collection(scraped_collection)
     except Exception as e:
         logging.error(f"An unexpected error occurred while loading/building collection '{scraped_collection}': {e}")
         raise
@@ -109,6 +124,49 @@ def lesson_decision_node(state: LearningState) -> str:
     return style
 
 
+def route_decision(state: LearningState) -> Tuple[str, float]:
+    """
+    Rule-based choice between `content_generation` and `blog_generation`.
+
+    Quizzes, projects and practicals are always lessons. Otherwise blog and lesson
+    keywords are counted over the topic, unit, description, elaboration and keywords of
+    the enriched resource (or the current resource), and a syllabus topic with teaching
+    hours counts as two lesson signals. Confidence grows with the margin between the two
+    counts and with the amount of evidence.
+
+    Returns:
+        Tuple[str, float]: The route and a confidence between 0.5 and 1.
+    """
+    if state.content_type in (ContentType.QUIZ, ContentType.PROJECT, ContentType.PRACTICAL):
+        return "content_generation", 1.0
+    resource = state.enriched_resource or state.current_resource
+    if resource is None:
+        return "content_generation", 0.5
+
+    text = " ".join([resource.topic, resource.unit, resource.description, resource.elaboration or "",
+                     " ".join(resource.keywords)]).lower()
+    blog = sum(keyword in text for keyword in BLOG_KEYWORDS)
+    lesson = sum(keyword in text for keyword in LESSON_KEYWORDS)
+    if resource.hours and resource.hours >= 2:
+        lesson += 2
+    total = blog + lesson
+    if total == 0:
+        return "content_generation", 0.5
+    route = "blog_generation" if blog > lesson else "content_generation"
+    confidence = 0.5 + 0.5 * (abs(lesson - blog) / total) * min(1.0, total / 3)
+    return route, confidence
+
+
+def log_route_source(source: str, route: str):
+    """Count a route decided by `rules` or the `llm` and log the running rules hit rate."""
+    record_route_decision(source, route)
+    with _route_sources_lock:
+        _route_sources[source] += 1
+        decided = sum(_route_sources.values())
+        hit_rate = _route_sources["rules"] / decided
+    logging.info(f"INFO Route '{route}' decided by {source}; rules decided {hit_rate:.0%} of {decided} routes")
+
+
 def parse_chromadb_metadata(metadata: dict) -> LearningResource:
     return LearningResource(
         subject=ResourceSubject(metadata.get('subject', 'unknown').lower()),
@@ -4,8 +4,10 @@ This script serves as the entry point for the Personalised Learning System. It i
 processes user data, generates educational content, and saves the learning state and generated content.
 It orchestrates the flow of various nodes defined in `nodes.py` to create a dynamic learning experience.
 """
+import argparse
 import asyncio
 import logging
+import sys
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,7 +15,7 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-from nodes import graph_run
+from nodes import graph_run, graph_stream
 
 user_data = {
     "user": {
@@ -48,19 +50,38 @@ user_data = {
 }
 
 
-async def main():
+def print_stream_event(event: dict):
+    """
+    CLI sink for `graph_stream`: prints lesson tokens as they arrive and a marker for
+    every later revision, which replaces the text printed before it.
+    """
+    if event["event"] == "revision_start":
+        print(f"\n\n===== Revision {event['revision']} ({event['node']}) =====\n", flush=True)
+    elif event["event"] == "delta":
+        sys.stdout.write(event["text"])
+        sys.stdout.flush()
+    elif event["event"] == "replace" and event["node"] not in ("content_generation", "blog_generation"):
+        print(event["content"], flush=True)
+
+
+async def main(stream: bool = False, run_id: str = None):
     """
     Asynchronous entry point for running the learning graph.
 
     This function orchestrates the entire learning content generation process:
-    1. Invokes the `graph_run` function with predefined `user_data` to generate learning content.
+    1. Invokes the `graph_run` function with predefined `user_data` to generate learning content,
+       or `graph_stream` when `stream` is set, printing content to the terminal as it is generated.
+       Passing the `run_id` of an interrupted run resumes it from its last completed node.
     2. Validates and converts the output to a `LearningState` object.
-    3. Saves the final `LearningState` to `learning_state.json`.
-    4. Extracts and saves the generated educational content to `generated_content.md` if available.
+    3. Appends the final `LearningState`, generated content included, to the run log (`db/run_log.py`),
+       indexed by run and user id; `get_run(run_id)` reads it back.
 
     Logs the progress and any errors encountered during the process.
     """
-    output = await graph_run(user_data)
+    if stream:
+        output = await graph_stream(user_data, print_stream_event, run_id=run_id)
+    else:
+        output = await graph_run(user_data, run_id=run_id)
     logging.info(f"Graph has given an output! {output}")
     logging.info(f"Output content: {output.get('content').content if output.get('content') else 'No content found'}")
     # If output is not a LearningState, convert it
@@ -72,16 +93,17 @@ async def main():
             logging.error(f"Failed to convert output to LearningState: {e}")
             print("Error: Output is not a valid LearningState object.")
             return
-    # Save the learning state to a JSON file
-    from utils.utils import save_learning_state_to_json, save_generated_content
-    save_learning_state_to_json(output, "learning_state.json")
-    # Save the generated content to a separate file if available
-    if output.content and getattr(output.content, 'content', None):
-        save_generated_content(output.content.content, "generated_content.md")
-        print("Generated content saved to generated_content.md")
-    else:
-        print("No generated content to save.")
+    # Append the learning state to the run log
+    from db.run_log import append_run, RUN_LOG_PATH
+    if not (output.content and getattr(output.content, 'content', None)):
+        print("The run produced no content.")
+    if append_run(output) is not None:
+        print(f"Run {output.run_id} saved to {RUN_LOG_PATH}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Run the personalised learning graph for the predefined user.")
+    parser.add_argument("--stream", action="store_true", help="Print generated content as it is produced.")
+    parser.add_argument("--run-id", help="Id of the run; pass the id of an interrupted run to resume it.")
+    args = parser.parse_args()
+    asyncio.run(main(stream=args.stream, run_id=args.run_id))
@@ -0,0 +1,229 @@
+"""
+Adaptive concurrency limits and circuit breakers for outbound LLM calls, per provider.
+
+`AdaptiveLimiter` caps the number of in-flight calls to a provider with an AIMD rule:
+while calls succeed with healthy latency and the limit is actually in use, the limit
+grows by about one slot per round trip (`+1/limit` per success); a 429 or timeout
+halves it, at most once per round trip. Throughput settles near what the provider
+sustains at the time instead of a hand-tuned constant.
+
+`CircuitBreaker` stops sending calls to a provider after repeated failures. While open,
+calls fail immediately with `CircuitOpenError`, so the router moves on to another
+provider. After a cool-down one trial call is let through; success closes the circuit,
+failure re-opens it with a doubled cool-down.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+from models.rate_limiter import is_rate_limit_error
+from utils.instrumentation import REGISTRY
+
+INITIAL_CONCURRENCY = int(os.environ.get('LLM_INITIAL_CONCURRENCY', '4'))
+MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '32'))
+MIN_CONCURRENCY = 1
+DECREASE_FACTOR = 0.5
+# A call slower than this multiple of its chain's typical latency does not grow the limit.
+LATENCY_TOLERANCE = 2.0
+
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('LLM_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.environ.get('LLM_BREAKER_COOLDOWN_SECONDS', '30'))
+BREAKER_MAX_COOLDOWN = 300.0
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """True for errors meaning the provider is saturated: 429s, quota errors and timeouts."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, Exception) and is_rate_limit_error(error):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return 'timeout' in text or 'timed out' in text
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on concurrent calls to one provider, usable from threads and event loops.
+
+    Args:
+        provider (str): Provider name, used in logs and metrics.
+        initial (int): Starting limit.
+        min_limit (int): Lowest limit after decreases.
+        max_limit (int): Highest limit after increases.
+    """
+
+    def __init__(self, provider: str, initial: int = INITIAL_CONCURRENCY, min_limit: int = MIN_CONCURRENCY,
+                 max_limit: int = MAX_CONCURRENCY):
+        self.provider = provider
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._async_waiters = deque()
+        self._latency: Dict[str, float] = {}
+        self._last_decrease = 0.0
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self) -> float:
+        """Block until a slot is free. Returns the time spent waiting."""
+        started = time.perf_counter()
+        with self._available:
+            while not self._try_acquire():
+                self._available.wait()
+        return time.perf_counter() - started
+
+    async def aacquire(self) -> float:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return time.perf_counter() - started
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def _wake_all(self):
+        self._available.notify_all()
+        while self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+
+    def release(self, route: str, latency: float, outcome: str):
+        """
+        Free a slot and adapt the limit.
+
+        Args:
+            route (str): Chain name; latency is judged against that chain's own average.
+            latency (float): Wall time of the call in seconds.
+            outcome (str): `ok`, `overload` (429 or timeout), `error` or `cancelled`.
+        """
+        with self._lock:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if outcome == 'ok':
+                typical = self._latency.get(route)
+                self._latency[route] = latency if typical is None else 0.9 * typical + 0.1 * latency
+                healthy = typical is None or latency <= LATENCY_TOLERANCE * typical
+                if healthy and saturated and self.limit < self.max_limit:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif outcome == 'overload':
+                now = time.monotonic()
+                if now - self._last_decrease >= max(latency, 1.0):
+                    self._last_decrease = now
+                    previous = self.limit
+                    self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+                    logging.warning(f"{self.provider}: overloaded, concurrency {previous:.1f} -> {self.limit:.1f}")
+                    REGISTRY.increment("llm_concurrency_decreases_total", {"provider": self.provider})
+            self._wake_all()
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker: closed, open after `failure_threshold` consecutive
+    failures, half-open (one trial call) after the cool-down.
+    """
+
+    def __init__(self, provider: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 cooldown: float = BREAKER_COOLDOWN):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self):
+        """Raise `CircuitOpenError` unless a call may go to the provider now."""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                logging.info(f"{self.provider}: circuit half-open, sending a trial call")
+                return
+        raise CircuitOpenError(f"Circuit for {self.provider} is open.")
+
+    def record(self, ok: bool):
+        with self._lock:
+            trial = self._trial_in_flight
+            self._trial_in_flight = False
+            if ok:
+                if self.opened_at is not None:
+                    logging.info(f"{self.provider}: circuit closed")
+                self.failures, self.opened_at, self.cooldown = 0, None, self.base_cooldown
+                return
+            self.failures += 1
+            if trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if trial:
+                    self.cooldown = min(BREAKER_MAX_COOLDOWN, self.cooldown * 2)
+                self.opened_at = time.monotonic()
+                logging.warning(f"{self.provider}: circuit open for {self.cooldown:.0f}s "
+                                f"after {self.failures} consecutive failures")
+                REGISTRY.increment("llm_circuit_open_total", {"provider": self.provider})
+
+    def abandon(self):
+        """Forget a call that was cancelled before it finished, e.g. a losing hedge."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_concurrency_limiter(provider: str) -> AdaptiveLimiter:
+    with _registry_lock:
+        if provider not in _limiters:
+            _limiters[provider] = AdaptiveLimiter(provider)
+        return _limiters[provider]
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    with _registry_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
+
+
+def concurrency_snapshot() -> Dict[str, dict]:
+    """Current limit, in-flight calls and circuit state per provider, for health checks."""
+    with _registry_lock:
+        providers = sorted(set(_limiters) | set(_breakers))
+    return {
+        provider: {
+            "concurrency_limit": round(get_concurrency_limiter(provider).limit, 2),
+            "in_flight": get_concurrency_limiter(provider).in_flight,
+            "circuit": get_circuit_breaker(provider).state,
+        }
+        for provider in providers
+    }
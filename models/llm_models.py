@@ -1,61 +1,463 @@
+import asyncio
+import contextvars
 import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Tuple
 
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import ensure_config
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
 from langchain_openai import ChatOpenAI
 
 from keys.apis import set_env
+from models.concurrency import (MAX_CONCURRENCY, CircuitOpenError, get_circuit_breaker, get_concurrency_limiter,
+                                is_overload_error)
+from models.rate_limiter import (EXPECTED_OUTPUT_TOKENS, MAX_RATE_LIMIT_RETRIES, estimate_tokens, get_rate_limiter,
+                                 is_rate_limit_error, queue_wait, retry_after_seconds)
+from utils.instrumentation import current_run, REGISTRY
 
+MODEL_NAMES = {
+    'gemini': 'gemini-2.0-flash',
+    'groq': 'meta-llama/llama-4-scout-17b-16e-instruct',
+    'deepseek': 'deepseek/deepseek-r1-0528:free',
+}
 
-def get_gemini_model(output_schema):
+# Optional factory replacing every provider, e.g. with deterministic fakes for offline
+# benchmarks. Called as factory(provider, output_schema); must be installed before
+# `prompts.prompts` is imported, since the chains are built at import time.
+_model_override = None
+
+
+def set_model_override(factory):
+    """
+    Route every `get_*_model` call to `factory(provider, output_schema)` instead of a live client.
+    Pass None to restore the real providers.
+    """
+    global _model_override
+    _model_override = factory
+
+
+def get_gemini_model(output_schema=None):
     """
     Initialize and return a Gemini model with structured output for the given schema.
     Args:
-        output_schema: The output schema for structured responses.
+        output_schema: The output schema for structured responses. If None, the plain
+            text model is returned, which streams tokens as they are generated.
     Returns:
-        ChatGoogleGenerativeAI instance with structured output.
+        ChatGoogleGenerativeAI instance, with structured output if a schema is given.
     """
     logging.info("Initializing Gemini model with structured output.")
+    if _model_override is not None:
+        return _model_override('gemini', output_schema)
     google_api_key = set_env('GOOGLE_API_KEY')
     if not google_api_key:
         raise ValueError("GOOGLE_API_KEY is not set. Please set it in your environment variables.")
-    return ChatGoogleGenerativeAI(
-        model='gemini-2.0-flash',
+    model = ChatGoogleGenerativeAI(
+        model=MODEL_NAMES['gemini'],
         api_key=google_api_key,
         temperature=1,
-    ).with_structured_output(output_schema)
+    )
+    return model.with_structured_output(output_schema) if output_schema is not None else model
 
 
-def get_groq_model():
+def get_groq_model(output_schema=None):
     """
     Initialize and return a Groq model for text generation.
+    Args:
+        output_schema: Optional output schema for structured responses.
     Returns:
-        ChatGroq instance.
+        ChatGroq instance, with structured output if a schema is given.
     """
     logging.info("Initializing Groq model.")
+    if _model_override is not None:
+        return _model_override('groq', output_schema)
     groq_api_key = set_env('GROQ_API_KEY')
     if not groq_api_key:
         raise ValueError("GROQ_API_KEY is not set. Please set it in your environment variables.")
-    return ChatGroq(
-        model='meta-llama/llama-4-scout-17b-16e-instruct',
+    model = ChatGroq(
+        model=MODEL_NAMES['groq'],
         api_key=groq_api_key,
         temperature=0.5
     )
+    return model.with_structured_output(output_schema) if output_schema is not None else model
 
 
-def get_deepseek_model(output_schema):
+def get_deepseek_model(output_schema=None):
     """
     Initialize and return an OpenAI model for text generation.
+    Args:
+        output_schema: Optional output schema for structured responses.
     Returns:
-        ChatOpenAI instance.
+        ChatOpenAI instance, with structured output if a schema is given.
     """
     logging.info("Initializing DeepSeek Model!.")
+    if _model_override is not None:
+        return _model_override('deepseek', output_schema)
     deepseek_api_key = set_env('DEEPSEEK_API_KEY')
     if not deepseek_api_key:
         raise ValueError("DEEPSEEK_API_KEY is not set. Please set it in your environment variables.")
-    return ChatOpenAI(
-        model='deepseek/deepseek-r1-0528:free',
+    model = ChatOpenAI(
+        model=MODEL_NAMES['deepseek'],
         temperature=0.5,
         api_key=deepseek_api_key,
         base_url="https://openrouter.ai/api/v1"
-    ).with_structured_output(output_schema)
+    )
+    return model.with_structured_output(output_schema) if output_schema is not None else model
+
+
+PROVIDER_FACTORIES = {
+    'gemini': get_gemini_model,
+    'groq': get_groq_model,
+    'deepseek': get_deepseek_model,
+}
+
+HEDGING_ENABLED = os.environ.get('LLM_HEDGING', '1') != '0'
+HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', '0.95'))
+HEDGE_MIN_SAMPLES = 8
+HEDGE_MIN_DELAY = 1.0
+UNHEALTHY_ERROR_RATE = 0.5
+
+# One pool per provider: calls block their thread while they wait for the provider's rate
+# limiter and concurrency limit, so a throttled provider must not hold the threads of the
+# others. Each pool is as large as the provider's maximum concurrency.
+_provider_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def provider_pool(provider: str) -> ThreadPoolExecutor:
+    with _pools_lock:
+        if provider not in _provider_pools:
+            _provider_pools[provider] = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY,
+                                                           thread_name_prefix=f"llm-{provider}")
+        return _provider_pools[provider]
+
+
+class ProviderStats:
+    """
+    Rolling window of call outcomes. Kept per provider for error rates and per
+    (chain, provider) for latency, since one provider's latency differs greatly
+    between a route selection and a full lesson.
+    """
+
+    def __init__(self, window: int = 50):
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self._outcomes.append(ok)
+            if ok:
+                self._latencies.append(latency)
+
+    def error_rate(self) -> float:
+        with self._lock:
+            return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+
+_provider_stats: Dict[str, ProviderStats] = {}
+_route_stats: Dict[Tuple[str, str], ProviderStats] = {}
+_stats_lock = threading.Lock()
+
+
+def provider_stats(provider: str) -> ProviderStats:
+    with _stats_lock:
+        return _provider_stats.setdefault(provider, ProviderStats())
+
+
+def route_stats(route: str, provider: str) -> ProviderStats:
+    with _stats_lock:
+        return _route_stats.setdefault((route, provider), ProviderStats())
+
+
+def _count(name: str, provider: str):
+    run = current_run()
+    if run is not None:
+        run.increment(name)
+    REGISTRY.increment(f"llm_{name}_total", {"provider": provider})
+
+
+class RoutedChatModel(Runnable):
+    """
+    Sends a chain's model call to the healthiest of several providers.
+
+    Candidates are tried in preference order, except that a provider whose recent error
+    rate exceeds `UNHEALTHY_ERROR_RATE` is moved behind healthy ones. If the first call
+    has not returned by the primary's `HEDGE_PERCENTILE` latency, a hedged duplicate
+    goes to the next provider and the first successful answer wins. Failed calls fall
+    through to the next provider. Every candidate is built with the same output
+    schema, so callers get the same result type whichever provider answers.
+
+    Each provider call is gated by that provider's circuit breaker, adaptive concurrency
+    limit and rate limiter; a provider with an open circuit is tried last.
+
+    Args:
+        name (str): Chain name, used to keep latency statistics per chain.
+        candidates (List[Tuple[str, Runnable]]): (provider, model) pairs in preference order.
+    """
+
+    def __init__(self, name: str, candidates: List[Tuple[str, Runnable]]):
+        if not candidates:
+            raise ValueError(f"No LLM provider is configured for '{name}'.")
+        self.name = name
+        self.candidates = candidates
+
+    def _ordered(self) -> List[Tuple[str, Runnable]]:
+        return sorted(self.candidates,
+                      key=lambda candidate: (get_circuit_breaker(candidate[0]).state == 'open',
+                                             provider_stats(candidate[0]).error_rate() > UNHEALTHY_ERROR_RATE))
+
+    def _hedge_delay(self, provider: str) -> Optional[float]:
+        if not HEDGING_ENABLED:
+            return None
+        latency = route_stats(self.name, provider).latency_percentile(HEDGE_PERCENTILE)
+        return max(latency, HEDGE_MIN_DELAY) if latency is not None else None
+
+    def _record(self, provider: str, started: float, ok: bool):
+        latency = time.perf_counter() - started
+        provider_stats(provider).record(latency, ok)
+        route_stats(self.name, provider).record(latency, ok)
+
+    @staticmethod
+    def _config_for(config: dict, hedge: bool) -> dict:
+        if not hedge:
+            return config
+        return {**config, 'tags': list(config.get('tags') or []) + ['hedge']}
+
+    @staticmethod
+    def _with_queue_time(config: dict, seconds: float) -> dict:
+        # Read by `LLMMetricsCallback`, which records it as the call's queue time.
+        return {**config, 'metadata': {**(config.get('metadata') or {}), 'llm_queue_time': seconds}}
+
+    @staticmethod
+    def _settle(limiter, estimated: int, result):
+        usage = getattr(result, 'usage_metadata', None) or {}
+        limiter.settle(estimated, usage.get('total_tokens', 0))
+
+    def _rate_limited(self, provider: str, error: Exception, attempt: int, limiter) -> float:
+        """Seconds to back off before retrying after `error`, or 0 if it is not retried."""
+        if not is_rate_limit_error(error) or attempt == MAX_RATE_LIMIT_RETRIES:
+            return 0.0
+        backoff = retry_after_seconds(error) or 2 ** attempt * 5
+        logging.warning(f"{self.name}: {provider} rate limited, retrying in {backoff:.0f}s")
+        _count("rate_limited", provider)
+        limiter.penalize(backoff)
+        return backoff
+
+    def _finish(self, provider: str, started: float, outcome: str):
+        get_concurrency_limiter(provider).release(self.name, time.perf_counter() - started, outcome)
+        breaker = get_circuit_breaker(provider)
+        if outcome == 'cancelled':
+            breaker.abandon()
+        else:
+            breaker.record(outcome == 'ok')
+
+    def _call(self, provider: str, model: Runnable, input, config: dict):
+        get_circuit_breaker(provider).allow()
+        slot_wait = get_concurrency_limiter(provider).acquire()
+        queue_wait(provider, slot_wait)
+        limiter = get_rate_limiter(provider, MODEL_NAMES.get(provider, provider))
+        estimated = estimate_tokens(input) + EXPECTED_OUTPUT_TOKENS
+        started, outcome = time.perf_counter(), 'cancelled'
+        backoff = 0.0
+        try:
+            for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+                waited = limiter.acquire(estimated)
+                # The penalty usually covers the backoff; without a request limit it does not.
+                if backoff > waited:
+                    time.sleep(backoff - waited)
+                    waited = backoff
+                queue_wait(provider, waited)
+                started = time.perf_counter()
+                # The slot wait belongs to the first attempt only.
+                attempt_config, slot_wait = self._with_queue_time(config, waited + slot_wait), 0.0
+                try:
+                    result = model.invoke(input, attempt_config)
+                except Exception as e:
+                    backoff = self._rate_limited(provider, e, attempt, limiter)
+                    if backoff:
+                        continue
+                    outcome = 'overload' if is_overload_error(e) else 'error'
+                    raise
+                self._settle(limiter, estimated, result)
+                outcome = 'ok'
+                return result
+        finally:
+            self._finish(provider, started, outcome)
+
+    async def _acall(self, provider: str, model: Runnable, input, config: dict):
+        breaker = get_circuit_breaker(provider)
+        breaker.allow()
+        try:
+            slot_wait = await get_concurrency_limiter(provider).aacquire()
+        except asyncio.CancelledError:
+            # A losing hedge cancelled while waiting for a slot: no call was made and no
+            # slot is held, but a half-open trial must be given back.
+            breaker.abandon()
+            raise
+        queue_wait(provider, slot_wait)
+        limiter = get_rate_limiter(provider, MODEL_NAMES.get(provider, provider))
+        estimated = estimate_tokens(input) + EXPECTED_OUTPUT_TOKENS
+        started, outcome = time.perf_counter(), 'cancelled'
+        backoff = 0.0
+        try:
+            for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+                waited = await limiter.aacquire(estimated)
+                # The penalty usually covers the backoff; without a request limit it does not.
+                if backoff > waited:
+                    await asyncio.sleep(backoff - waited)
+                    waited = backoff
+                queue_wait(provider, waited)
+                started = time.perf_counter()
+                # The slot wait belongs to the first attempt only.
+                attempt_config, slot_wait = self._with_queue_time(config, waited + slot_wait), 0.0
+                try:
+                    result = await model.ainvoke(input, attempt_config)
+                except Exception as e:
+                    backoff = self._rate_limited(provider, e, attempt, limiter)
+                    if backoff:
+                        continue
+                    outcome = 'overload' if is_overload_error(e) else 'error'
+                    raise
+                self._settle(limiter, estimated, result)
+                outcome = 'ok'
+                return result
+        finally:
+            self._finish(provider, started, outcome)
+
+    def invoke(self, input, config=None, **kwargs):
+        config = ensure_config(config)
+        order = self._ordered()
+        pending = {}
+        last_error = None
+        next_index = 0
+        hedged = False
+
+        def launch(hedge: bool):
+            nonlocal next_index
+            provider, model = order[next_index]
+            next_index += 1
+            context = contextvars.copy_context()
+            future = provider_pool(provider).submit(context.run, self._call, provider, model, input,
+                                                    self._config_for(config, hedge))
+            pending[future] = (provider, time.perf_counter())
+            return provider
+
+        primary = launch(hedge=False)
+        try:
+            while pending:
+                deadline = None if hedged or next_index >= len(order) else self._hedge_delay(primary)
+                done, _ = wait(list(pending), timeout=deadline, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    provider = launch(hedge=True)
+                    _count("hedges", provider)
+                    logging.info(f"{self.name}: {primary} slower than p{int(HEDGE_PERCENTILE * 100)}, "
+                                 f"hedging with {provider}")
+                    continue
+                for future in done:
+                    provider, started = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        if not isinstance(e, CircuitOpenError):
+                            self._record(provider, started, ok=False)
+                        last_error = e
+                        logging.warning(f"{self.name}: provider {provider} failed: {e}")
+                        continue
+                    self._record(provider, started, ok=True)
+                    return result
+                if not pending and next_index < len(order):
+                    provider = launch(hedge=False)
+                    _count("fallbacks", provider)
+                    logging.info(f"{self.name}: falling back to {provider}")
+            raise last_error
+        finally:
+            # A losing call still queued for a pool thread is dropped; one already running
+            # finishes in the background, since a thread cannot be interrupted.
+            for future in pending:
+                future.cancel()
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        config = ensure_config(config)
+        order = self._ordered()
+        pending = {}
+        last_error = None
+        next_index = 0
+        hedged = False
+
+        def launch(hedge: bool):
+            nonlocal next_index
+            provider, model = order[next_index]
+            next_index += 1
+            task = asyncio.ensure_future(self._acall(provider, model, input, self._config_for(config, hedge)))
+            pending[task] = (provider, time.perf_counter())
+            return provider
+
+        primary = launch(hedge=False)
+        try:
+            while pending:
+                deadline = None if hedged or next_index >= len(order) else self._hedge_delay(primary)
+                done, _ = await asyncio.wait(list(pending), timeout=deadline, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    provider = launch(hedge=True)
+                    _count("hedges", provider)
+                    logging.info(f"{self.name}: {primary} slower than p{int(HEDGE_PERCENTILE * 100)}, "
+                                 f"hedging with {provider}")
+                    continue
+                for task in done:
+                    provider, started = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if not isinstance(e, CircuitOpenError):
+                            self._record(provider, started, ok=False)
+                        last_error = e
+                        logging.warning(f"{self.name}: provider {provider} failed: {e}")
+                        continue
+                    self._record(provider, started, ok=True)
+                    return result
+                if not pending and next_index < len(order):
+                    provider = launch(hedge=False)
+                    _count("fallbacks", provider)
+                    logging.info(f"{self.name}: falling back to {provider}")
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def get_routed_model(name: str, output_schema=None, providers: Sequence[str] = ('gemini', 'groq', 'deepseek')):
+    """
+    Build a `RoutedChatModel` over the given providers, in preference order.
+
+    Providers whose API key is missing are skipped with a warning, so a chain still works
+    with whichever providers are configured.
+
+    Args:
+        name (str): Chain name used for per-chain latency statistics.
+        output_schema: Structured output schema applied to every provider, or None for text.
+        providers (Sequence[str]): Provider names from `PROVIDER_FACTORIES`.
+    Returns:
+        RoutedChatModel instance.
+    """
+    candidates = []
+    for provider in providers:
+        try:
+            candidates.append((provider, PROVIDER_FACTORIES[provider](output_schema)))
+        except ValueError as e:
+            logging.warning(f"Skipping provider {provider} for {name}: {e}")
+    return RoutedChatModel(name, candidates)
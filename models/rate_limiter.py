@@ -0,0 +1,212 @@
+"""
+Per-provider, per-model request and token rate limiting for outbound LLM calls.
+
+Each (provider, model) pair has two token buckets: requests per minute and tokens per
+minute. A caller reserves one request plus its estimated token count up front; if the
+buckets are short, the balance goes negative and the caller sleeps until it would be
+refilled. Reservations are served in arrival order, so under load callers queue instead
+of tripping the provider's 429 responses. Time spent waiting is reported as a queue-wait
+metric.
+
+Buckets live in process memory by default. With `RATE_LIMIT_BACKEND=sqlite`, bucket state
+is kept in a SQLite file (`RATE_LIMIT_DB_PATH`), updated under an immediate transaction,
+so several worker processes share one budget.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Dict, Optional, Tuple
+
+from utils.instrumentation import record_queue_wait
+
+# (requests per minute, tokens per minute) on the free tiers; None means unlimited.
+DEFAULT_LIMITS: Dict[str, Tuple[Optional[int], Optional[int]]] = {
+    'gemini': (15, 1_000_000),
+    'groq': (30, 30_000),
+    'deepseek': (20, None),
+}
+
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_DB_PATH = os.environ.get('RATE_LIMIT_DB_PATH', './data/rate_limits.sqlite')
+EXPECTED_OUTPUT_TOKENS = int(os.environ.get('RATE_LIMIT_OUTPUT_TOKENS', '1000'))
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+def estimate_tokens(payload) -> int:
+    """Rough token estimate (about four characters per token) of a prompt payload."""
+    if hasattr(payload, 'to_string'):
+        payload = payload.to_string()
+    elif isinstance(payload, (list, tuple)):
+        payload = " ".join(str(getattr(item, 'content', item)) for item in payload)
+    return len(str(payload)) // 4
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if status == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in ('429', 'rate limit', 'ratelimit', 'resourceexhausted', 'quota'))
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    value = headers.get('retry-after') if hasattr(headers, 'get') else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _refill(balance: float, capacity: float, rate: float, elapsed: float) -> float:
+    return min(capacity, balance + elapsed * rate)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget for one provider and model.
+
+    Args:
+        key (str): Identifier of the budget, e.g. `groq:meta-llama/llama-4-scout-17b-16e-instruct`.
+        rpm (Optional[int]): Requests per minute, or None for no request limit.
+        tpm (Optional[int]): Tokens per minute, or None for no token limit.
+    """
+
+    def __init__(self, key: str, rpm: Optional[int], tpm: Optional[int]):
+        self.key = key
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        self._requests = float(rpm or 0)
+        self._tokens = float(tpm or 0)
+        self._updated = now
+
+    def _reserve_state(self, requests: float, tokens: float, updated: float, now: float,
+                       request_cost: float, token_cost: float, drain: bool = False) -> Tuple[float, float, float]:
+        elapsed = max(0.0, now - updated)
+        wait = 0.0
+        if self.rpm:
+            requests = _refill(requests, self.rpm, self.rpm / 60, elapsed)
+            # Draining discards what is left of the budget before charging.
+            requests = (min(requests, 0.0) if drain else requests) - request_cost
+            if requests < 0:
+                wait = max(wait, -requests / (self.rpm / 60))
+        if self.tpm:
+            tokens = _refill(tokens, self.tpm, self.tpm / 60, elapsed) - min(token_cost, self.tpm)
+            if tokens < 0:
+                wait = max(wait, -tokens / (self.tpm / 60))
+        return requests, tokens, wait
+
+    def reserve(self, tokens: int, requests: float = 1, drain: bool = False) -> float:
+        """
+        Take `requests` and `tokens` from the budget and return how long the caller must wait.
+        With `drain`, the unused request budget is discarded first.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._requests, self._tokens, wait = self._reserve_state(self._requests, self._tokens, self._updated,
+                                                                     now, requests, tokens, drain)
+            self._updated = now
+        return wait
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """Return over-estimated tokens to the budget, or charge under-estimated ones."""
+        if self.tpm and actual_tokens:
+            self.reserve(actual_tokens - estimated_tokens, requests=0)
+
+    def penalize(self, seconds: float):
+        """
+        Empty the request budget and push it `seconds` into deficit, so every caller backs off
+        for at least `seconds` after a 429. Without a request limit this does nothing.
+        """
+        if self.rpm:
+            self.reserve(0, requests=seconds * self.rpm / 60, drain=True)
+
+    def acquire(self, tokens: int) -> float:
+        """Block until the call fits in the budget. Returns the time spent waiting."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int) -> float:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """
+    `RateLimiter` whose bucket state is shared between processes through a SQLite file.
+    Wall-clock time is used instead of the monotonic clock so processes agree on it.
+    """
+
+    def __init__(self, key: str, rpm: Optional[int], tpm: Optional[int], path: str = RATE_LIMIT_DB_PATH):
+        super().__init__(key, rpm, tpm)
+        self.path = path
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        with closing(sqlite3.connect(path, timeout=30)) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    requests REAL NOT NULL,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO rate_limit_buckets VALUES (?, ?, ?, ?)",
+                         (key, float(rpm or 0), float(tpm or 0), time.time()))
+
+    def reserve(self, tokens: int, requests: float = 1, drain: bool = False) -> float:
+        with closing(sqlite3.connect(self.path, timeout=30, isolation_level=None)) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                balance_requests, balance_tokens, updated = conn.execute(
+                    "SELECT requests, tokens, updated_at FROM rate_limit_buckets WHERE key = ?",
+                    (self.key,)).fetchone()
+                now = time.time()
+                balance_requests, balance_tokens, wait = self._reserve_state(
+                    balance_requests, balance_tokens, updated, now, requests, tokens, drain)
+                conn.execute("UPDATE rate_limit_buckets SET requests = ?, tokens = ?, updated_at = ? WHERE key = ?",
+                             (balance_requests, balance_tokens, now, self.key))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str) -> RateLimiter:
+    """
+    Process-wide limiter for a provider and model. Limits come from `<PROVIDER>_RPM` and
+    `<PROVIDER>_TPM` environment variables (0 disables a limit), falling back to
+    `DEFAULT_LIMITS`.
+    """
+    key = f"{provider}:{model}"
+    with _limiters_lock:
+        if key not in _limiters:
+            default_rpm, default_tpm = DEFAULT_LIMITS.get(provider, (None, None))
+            rpm = int(os.environ.get(f"{provider.upper()}_RPM", default_rpm or 0)) or None
+            tpm = int(os.environ.get(f"{provider.upper()}_TPM", default_tpm or 0)) or None
+            limiter_cls = SQLiteRateLimiter if RATE_LIMIT_BACKEND == 'sqlite' else RateLimiter
+            _limiters[key] = limiter_cls(key, rpm, tpm)
+            logging.info(f"Rate limiter for {key}: rpm={rpm}, tpm={tpm}, backend={RATE_LIMIT_BACKEND}")
+        return _limiters[key]
+
+
+def queue_wait(provider: str, waited: float):
+    if waited > 0:
+        logging.info(f"Queued {waited:.2f}s for {provider} rate limit")
+        record_queue_wait(provider, waited)
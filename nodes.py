@@ -4,59 +4,117 @@ This module defines the individual nodes and the overall graph structure for the
 personalized learning system. Each node represents a step in the content generation
 and refinement pipeline, processing a `LearningState` object and updating it.
 """
+import asyncio
 import json
 import logging
 import os
+import re
+import sqlite3
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
 
 import pydantic
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from more_itertools import flatten
 
+from logis.local_validation import LocalValidationReport, validate_markdown
 from logis.logical_functions import lesson_decision_node, blog_decision_node, parse_chromadb_metadata, \
-    update_content_count, search_both_collections
+    update_content_count, search_both_collections, route_decision, log_route_source, ROUTE_CONFIDENCE_THRESHOLD
 from prompts.prompts import user_summary, enriched_content, \
     content_improviser, route_selector, blog_generation, content_generation, \
     prompt_content_improviser, prompt_feedback, content_feedback, gap_finder, \
-    content_seo_optimization, prompt_post_validation, post_validation, prompt_seo_optimization
+    content_seo_optimization, post_validation, prompt_seo_optimization, \
+    content_generation_stream, blog_generation_stream, prompt_section_improviser, lesson_outline, lesson_section, \
+    prompt_combined_critique, combined_critique, prompt_semantic_validation, compact_json, FEEDBACK_BUDGET, \
+    VALIDATION_BUDGET, COMBINED_CRITIQUE_BUDGET, IMPROVE_BUDGET, SECTION_IMPROVE_BUDGET
 from schemas import LearningState, ContentResponse, EnrichedLearningResource, FeedBack, RouteSelector, \
-    PostValidationResult
-from scrapper.crawl4ai_scrapping import crawl_and_extract_json
+    PostValidationResult, UserInfo, GenerationMode, LessonOutline, CritiqueMode, CombinedCritique
+from db.artifact_store import put_artifact, put_artifact_file
+from db.checkpoints import open_checkpointer, mark_run
+from db.content_versions import best_version, put_version
+from db.learner_store import load_learner_slice, record_run
+from db.pregeneration import get_pregenerated
+from db.topic_graph import related_examples
+from db.profile_cache import PROFILE_REFRESH_AGE, get_cached_profile, profile_hash, save_profile
+from db.vector_db import ScrapedDataIndexer
+from scrapper.crawl4ai_scrapping import crawl_and_extract_stream
 from scrapper.save_to_local import serper_api_results_parser, save_to_local
+from utils.instrumentation import RunMetrics, LLMMetricsCallback, instrument_node, finish_run, record_cache_hit, \
+    record_cache_miss, record_validation
+from utils.markdown_sections import Section, ensure_heading, join_sections, match_issues, outline, split_sections
+from utils.streaming import ContentSink, ContentStreamer, STREAM_CONFIG_KEY, is_streaming
 from utils.utils import read_from_local
 
 
-def user_info_node(state: LearningState) -> LearningState:
+_profile_refresh_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-refresh")
+_profile_refreshes = set()
+
+
+def _summarise_user(user: UserInfo, digest: str) -> UserInfo:
+    """Summarise the raw profile with the `user_summary` chain and cache the result."""
+    response = user_summary.invoke({
+        "action": "summarise_user",
+        "existing_data": user.model_dump()
+    })
+    user_data = response.content if hasattr(response, 'content') else response
+    summarised = user.model_validate(user_data if isinstance(user_data, dict) else user_data.model_dump())
+    save_profile(user.id, digest, summarised.model_dump())
+    return summarised
+
+
+def _refresh_profile(user: UserInfo, digest: str):
+    try:
+        _summarise_user(user, digest)
+        logging.info(f"Refreshed cached profile of user {user.id}")
+    except Exception as e:
+        logging.error(f"Background refresh of the profile of user {user.id} failed: {e}")
+    finally:
+        _profile_refreshes.discard(user.id)
+
+
+def user_info_node(state: LearningState) -> dict:
     """
     Processes and summarizes user information.
 
     This node takes the current `LearningState`, extracts user data, and uses an
     LLM (via `user_summary` prompt) to generate a summarized version of the user's profile.
-    The summarized user information is then validated and updated back into the `state.user` attribute.
+    Summaries are cached per user id and profile hash (`db/profile_cache.py`), so a
+    returning user with an unchanged profile skips the LLM call; summaries older than
+    `PROFILE_REFRESH_AGE` are served from the cache and refreshed in the background.
+    The summarized user information is then validated and returned as the new `user`.
 
     Args:
         state (LearningState): The current state of the learning process, containing user information.
 
     Returns:
-        LearningState: The updated state with processed and summarized user information.
+        dict: The summarized `user`, or no update if summarizing failed.
     """
     logging.info("Entering user_info_node")
     if state.user is not None:
         try:
-            response = user_summary.invoke({
-                "action": "summarise_user",
-                "existing_data": state.user.model_dump()
-            })
-            print(response)
-            user_data = response.content if hasattr(response, 'content') else response
-            print('hello')
-            state.user = state.user.model_validate(user_data if isinstance(user_data, dict) else user_data.model_dump())
-            logging.info(f"User info processed: {state.user}")
+            digest = profile_hash(state.user.model_dump())
+            cached = get_cached_profile(state.user.id, digest)
+            if cached is not None:
+                summary, age = cached
+                record_cache_hit("user_profile")
+                if PROFILE_REFRESH_AGE and age > PROFILE_REFRESH_AGE and state.user.id not in _profile_refreshes:
+                    _profile_refreshes.add(state.user.id)
+                    _profile_refresh_pool.submit(_refresh_profile, state.user.model_copy(), digest)
+                user = state.user.model_validate(summary)
+            else:
+                record_cache_miss("user_profile")
+                user = _summarise_user(state.user, digest)
+            logging.info(f"User info processed: {user}")
+            return {"user": user}
         except pydantic.ValidationError as e:
             logging.error(f"Pydantic validation error in user_info_node: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred in user_info_node: {e}")
-    return state
+    return {}
 
 
 # def enrich_content(state: LearningState) -> LearningState:
@@ -88,28 +146,30 @@ def user_info_node(state: LearningState) -> LearningState:
 #             logging.error(f"Error processing learning resource data: {e}")
 #     return state
 
-async def crawler_node(state: LearningState) -> LearningState:
+async def crawler_node(state: LearningState) -> dict:
     """
     Crawls web data related to the current topic and updates the learning state.
 
     This node first checks if raw data already exists locally. If so, it loads the data.
-    Otherwise, it uses `serper_api_results_parser` to get links, then `crawl_and_extract_json`
-    to scrape content from those links. The extracted raw data is saved locally and
-    then updated into the `state.topic_data` attribute.
+    Otherwise, it uses `serper_api_results_parser` to get links, then `crawl_and_extract_stream`
+    to scrape content from those links. Each extracted page is streamed into the scraped
+    ChromaDB collection as it arrives, then the raw data is saved locally. The crawl
+    results are kept in the artifact store and `topic_data` only holds a reference
+    to them, so they are not copied and checkpointed with the state after every node.
 
     Args:
         state (LearningState): The current state of the learning process.
 
     Returns:
-        LearningState: The updated state with crawled topic data.
+        dict: `topic_data` referencing the crawl results, or no update if nothing was crawled.
     """
     if os.path.exists('./data/raw_data.json'):
         logging.info("Raw data already exists, loading from file.")
         try:
-            with open('./data/raw_data.json', 'r', encoding='utf-8') as f:
-                state.topic_data = json.load(f)
+            # Hashed once per change of the file; later runs reuse the remembered reference.
+            topic_data = put_artifact_file("crawl_results", './data/raw_data.json')
             logging.info("Raw data loaded from file and state updated successfully.")
-            return state
+            return {"topic_data": topic_data}
         except FileNotFoundError:
             logging.error("raw_data.json not found, despite os.path.exists returning True. This is unexpected.")
         except json.JSONDecodeError as e:
@@ -120,48 +180,59 @@ async def crawler_node(state: LearningState) -> LearningState:
             pass
     links = serper_api_results_parser(state=state)
     logging.info(f"Scrapped Links: {links}")
-    raw_data = None
+    raw_data = []
     try:
         save_to_local(links, "./data/scrapped_data.json")
         link_list = [item.get('link') for item in links.get('organic', []) if 'link' in item]
         if not link_list:
             logging.warning("No valid links found for crawling.")
-            return state
-        raw_data = await crawl_and_extract_json(link_list)
+            return {}
+        # Pages are upserted into the scraped collection while the rest are still being crawled.
+        async with ScrapedDataIndexer() as indexer:
+            async for record in crawl_and_extract_stream(link_list):
+                raw_data.append(record)
+                await indexer.put(record)
         logging.info("Raw Data has been extracted!")
     except Exception as e:
         logging.error(f"Error extracting raw data: {e}")
-        return state
+        return {}
 
     if raw_data:
         try:
             save_to_local(raw_data, "./data/raw_data.json")
-            state.topic_data = raw_data
+            topic_data = put_artifact("crawl_results", raw_data)
             logging.info("Raw data saved and state updated successfully.")
+            return {"topic_data": topic_data}
         except Exception as e:
             logging.error(f"Error saving raw data: {e}")
     else:
         logging.warning("No raw data extracted from the links.")
-    return state
+    return {}
 
 
-def enrich_content(state: LearningState) -> LearningState:
+def enrich_content(state: LearningState) -> dict:
     """
     Enriches the current learning resource using retrieved data and LLM capabilities.
 
     This node retrieves relevant data from both local and scraped data collections,
     then invokes an LLM (via `enriched_content` prompt) to enrich the `current_resource`.
     The enriched data is validated against `EnrichedLearningResource` schema and
-    updated into the `state.enriched_resource` attribute.
+    returned as `enriched_resource`. Related and next topics of the resource are looked
+    up in the precomputed topic graph (`db/topic_graph.py`) and returned as
+    `related_examples`.
 
     Args:
         state (LearningState): The current state of the learning process.
 
     Returns:
-        LearningState: The updated state with an enriched learning resource.
+        dict: The `enriched_resource` and `related_examples`, when available.
     """
     logging.info("Entering enrich_content node")
+    update = {}
     if state.current_resource is not None:
+        examples = None if state.related_examples else related_examples(state.current_resource)
+        if examples:
+            update["related_examples"] = examples
         try:
             retrieved_data = search_both_collections(state=state)
             local_medadata = retrieved_data.get('lessons_results').get('metadatas')
@@ -176,8 +247,9 @@ def enrich_content(state: LearningState) -> LearningState:
             resource_data = response.content if hasattr(response, "content") else response
             print('ENRICHED DATA=======> ', resource_data)
             try:
-                state.enriched_resource = EnrichedLearningResource.model_validate(resource_data)
+                enriched_resource = EnrichedLearningResource.model_validate(resource_data)
                 logging.info(f"Learning resource processed!")
+                update["enriched_resource"] = enriched_resource
             except Exception as validation_error:
                 logging.error(f"Pydantic validation error for EnrichedLearningResource: {validation_error}")
                 logging.error(f"Malformed LLM output: {resource_data}")
@@ -186,35 +258,47 @@ def enrich_content(state: LearningState) -> LearningState:
         except Exception as e:
             print()
             logging.error(f"An unexpected error occurred in enrich_content: {e}")
-    return state
+    return update
 
 
-def route_selector_node(state: LearningState) -> LearningState:
+def route_selector_node(state: LearningState) -> dict:
     """
     Selects the next route (lesson or blog generation) based on the enriched resource.
 
-    This node uses an LLM (via `route_selector` prompt) to decide whether the next step
-    should be generating a lesson or a blog. The decision is then stored in
-    `state.next_action` as a `RouteSelector` object.
+    The rule-based `route_decision` settles most resources locally. Only when its
+    confidence is below `ROUTE_CONFIDENCE_THRESHOLD` is the LLM (via the `route_selector`
+    prompt) consulted. The decision is returned as `next_action`, a `RouteSelector`
+    object.
 
     Args:
         state (LearningState): The current state of the learning process.
 
     Returns:
-        LearningState: The updated state with the selected next action.
+        dict: The selected `next_action`.
     """
     logging.info("Entering route_selector_node")
     if state.user is not None and state.current_resource is not None:
+        route, confidence = route_decision(state)
+        if confidence >= ROUTE_CONFIDENCE_THRESHOLD:
+            logging.info(f"Rule-based route selection: {route} (confidence {confidence:.2f})")
+            log_route_source("rules", route)
+            return {"next_action": RouteSelector(next_node=route)}
+        next_action = None
         try:
-            logging.info(f"Selecting the route for resource: {state.current_resource}")
+            logging.info(f"Rule-based route '{route}' has low confidence ({confidence:.2f}); "
+                         f"selecting the route for resource: {state.current_resource}")
             response = route_selector.invoke({
-                'current_resources': state.enriched_resource.model_dump()
+                'current_resources': (state.enriched_resource or state.current_resource).model_dump()
             })
             # Set next_action as a RouteSelector model
-            next_action_str = response.content if hasattr(response, "content") else response
+            if isinstance(response, RouteSelector):
+                next_action_str = response.next_node
+            else:
+                next_action_str = response.content if hasattr(response, "content") else response
             try:
-                state.next_action = RouteSelector(next_node=next_action_str)
-                logging.info(f"Route selection response: {state.next_action}")
+                next_action = RouteSelector(next_node=next_action_str)
+                logging.info(f"Route selection response: {next_action}")
+                log_route_source("llm", next_action.next_node)
             except Exception as validation_error:
                 logging.error(f"Pydantic validation error for RouteSelector: {validation_error}")
                 logging.error(f"Malformed LLM output: {next_action_str}")
@@ -222,32 +306,87 @@ def route_selector_node(state: LearningState) -> LearningState:
             logging.error(f"Pydantic validation error in route_selector_node: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred in route_selector_node: {e}")
-    return state
+        if next_action is None:
+            # The LLM failed; fall back to the rule-based route.
+            next_action = RouteSelector(next_node=route)
+            log_route_source("rules", route)
+        return {"next_action": next_action}
+    return {}
 
 
-def generate_lesson_content(state: LearningState) -> LearningState:
+def _generate_lesson_by_sections(state: LearningState, style: str, urls: list) -> Optional[str]:
+    """
+    Outline-first lesson generation: one structured `lesson_outline` call, then every
+    section concurrently via `lesson_section`, assembled in outline order.
+
+    Returns:
+        Optional[str]: The assembled markdown, or None if the outline or a section failed.
+    """
+    shared = {
+        "user_data": state.user.model_dump(),
+        "resource_data": state.enriched_resource.model_dump(),
+        "style": style,
+    }
+    lesson_plan = lesson_outline.invoke(shared)
+    if not isinstance(lesson_plan, LessonOutline) or not lesson_plan.sections:
+        logging.warning(f"Lesson outline is empty or malformed: {lesson_plan}")
+        return None
+    plan_text = "\n".join(f"- {section.heading}: {'; '.join(section.key_points)}" for section in lesson_plan.sections)
+    logging.info(f"Generating {len(lesson_plan.sections)} sections of '{lesson_plan.title}' concurrently")
+    responses = lesson_section.batch([
+        {**shared, "urls": urls, "outline": plan_text, "heading": section.heading, "key_points": section.key_points}
+        for section in lesson_plan.sections
+    ], return_exceptions=True)
+
+    parts = [f"# {lesson_plan.title}\n\n"]
+    for section, response in zip(lesson_plan.sections, responses):
+        if isinstance(response, Exception):
+            logging.error(f"Failed to generate section '{section.heading}': {response}")
+            return None
+        text = response.content if hasattr(response, "content") else str(response)
+        parts.append(ensure_heading(Section(heading=section.heading, level=2, text=f"## {section.heading}\n"), text))
+    return "".join(parts)
+
+
+def generate_lesson_content(state: LearningState, config: Optional[RunnableConfig] = None) -> dict:
     """
     Generates educational lesson content.
 
     This node orchestrates the generation of lesson content by invoking an LLM
     (via `content_generation` prompt) with user data, enriched resource data,
     a determined logical style, and relevant URLs. The generated content is then
-    validated and stored in `state.content` as a `ContentResponse` object.
+    validated and returned as `content`, a `ContentResponse` object.
+    When the graph runs under `graph_stream`, the plain-text chain is used so tokens
+    reach the stream sink as they are generated.
+    With `generation_mode` set to `outline_sections` (and no streaming), an outline is
+    generated first and its sections are written concurrently, falling back to the single
+    call if that fails.
 
     Args:
         state (LearningState): The current state of the learning process.
+        config (Optional[RunnableConfig]): Run configuration supplied by LangGraph.
 
     Returns:
-        LearningState: The updated state with the generated lesson content.
+        dict: The generated lesson `content`, or no update if generation failed.
     """
     logging.info("Entering generate_lesson_content node")
     if state.user is not None and state.enriched_resource is not None:
         try:
             logical_response = lesson_decision_node(state=state)
             urls = read_from_local('./data/scrapped_data.json')
-            print(urls)
             logging.info(f"Logical response for lesson generation: {logical_response}")
-            response = content_generation.invoke({
+            if state.generation_mode == GenerationMode.OUTLINE_SECTIONS and not is_streaming(config):
+                try:
+                    lesson = _generate_lesson_by_sections(state, logical_response, urls)
+                except Exception as e:
+                    logging.error(f"Outline-first generation failed: {e}")
+                    lesson = None
+                if lesson is not None:
+                    logging.info("Lesson content has been generated section by section!")
+                    return {"content": ContentResponse(content=lesson)}
+                logging.warning("Falling back to single-pass lesson generation.")
+            chain = content_generation_stream if is_streaming(config) else content_generation
+            response = chain.invoke({
                 "action": "generate_lesson",
                 "user_data": state.user.model_dump(),
                 "resource_data": state.enriched_resource.model_dump(),
@@ -256,9 +395,10 @@ def generate_lesson_content(state: LearningState) -> LearningState:
             })
             resource_data = response.content if hasattr(response, "content") else response
             try:
-                state.content = ContentResponse(content=resource_data)
+                content = ContentResponse(content=resource_data)
                 logging.info(f"Lesson content has been generated!")
-                print(f'Generated Content: {state.content}')
+                print(f'Generated Content: {content}')
+                return {"content": content}
             except Exception as validation_error:
                 logging.error(f"Pydantic validation error for ContentResponse: {validation_error}")
                 logging.error(f"Malformed LLM output: {resource_data}")
@@ -266,23 +406,23 @@ def generate_lesson_content(state: LearningState) -> LearningState:
             logging.error(f"Pydantic validation error in generate_lesson_content: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred in generate_lesson_content: {e}")
-    return state
+    return {}
 
 
-def seo_optimiser_node(state: LearningState) -> LearningState:
+def seo_optimiser_node(state: LearningState) -> dict:
     """
     Optimizes the generated content for Search Engine Optimization (SEO).
 
     This node takes the existing content from `state.content` and uses an LLM
     (via `content_seo_optimization` prompt) to apply SEO best practices.
-    The optimized content replaces the original content in `state.content`.
+    The optimized content is returned as the new `content`.
     Error handling is included to prevent crashes if the LLM call fails.
 
     Args:
         state (LearningState): The current state of the learning process.
 
     Returns:
-        LearningState: The updated state with SEO-optimized content.
+        dict: The SEO-optimized `content`, or no update if optimization failed.
     """
     if state.content is not None:
         try:
@@ -298,8 +438,8 @@ Generated Undiagnosed Learning Resource:
             try:
                 response = content_seo_optimization.invoke(messages)
                 resource_data = response.content if hasattr(response, "content") else response
-                state.content = ContentResponse(content=resource_data)
                 logging.info(f"Content has been optimised for SEO!")
+                return {"content": ContentResponse(content=resource_data)}
             except Exception as e:
                 logging.error(f"An error occurred during SEO optimization: {e}")
         except pydantic.ValidationError as e:
@@ -307,30 +447,34 @@ Generated Undiagnosed Learning Resource:
         except Exception as e:
             logging.error(f"An unexpected error occurred in seo_optimiser_node: {e}")
 
-    return state
+    return {}
 
 
-def generate_blog_content(state: LearningState) -> LearningState:
+def generate_blog_content(state: LearningState, config: Optional[RunnableConfig] = None) -> dict:
     """
     Generates educational blog content.
 
     This node is responsible for creating blog posts by invoking an LLM
     (via `blog_generation` prompt) with user data, enriched resource data,
     and a determined logical style. The generated content is then validated
-    and stored in `state.content` as a `ContentResponse` object.
+    and returned as `content`, a `ContentResponse` object.
+    When the graph runs under `graph_stream`, the plain-text chain is used so tokens
+    reach the stream sink as they are generated.
 
     Args:
         state (LearningState): The current state of the learning process.
+        config (Optional[RunnableConfig]): Run configuration supplied by LangGraph.
 
     Returns:
-        LearningState: The updated state with the generated blog content.
+        dict: The generated blog `content`, or no update if generation failed.
     """
     logging.info("Entering generate_blog_content node")
     if state.user is not None and state.enriched_resource is not None:
         try:
             logical_response = blog_decision_node(state=state)
             logging.info(f"Logical response for blog generation: {logical_response}")
-            response = blog_generation.invoke({
+            chain = blog_generation_stream if is_streaming(config) else blog_generation
+            response = chain.invoke({
                 "action": "generate_lesson",
                 "user_data": state.user.model_dump(),
                 "resource_data": state.enriched_resource.model_dump(),
@@ -338,8 +482,9 @@ def generate_blog_content(state: LearningState) -> LearningState:
             })
             resource_data = response.content if hasattr(response, "content") else response
             try:
-                state.content = ContentResponse(content=resource_data)
+                content = ContentResponse(content=resource_data)
                 logging.info(f"Blog content has been generated!")
+                return {"content": content}
             except Exception as validation_error:
                 logging.error(f"Pydantic validation error for ContentResponse: {validation_error}")
                 logging.error(f"Malformed LLM output: {resource_data}")
@@ -347,80 +492,161 @@ def generate_blog_content(state: LearningState) -> LearningState:
             logging.error(f"Pydantic validation error in generate_blog_content: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred in generate_blog_content: {e}")
-    return state
+    return {}
+
+
+SECTION_REWRITE_MAX_FRACTION = 0.6
+
+
+def _review_issues(state: LearningState) -> list:
+    """Feedback gaps and validation violations the improver has to address."""
+    issues = list(state.feedback.gaps or []) if state.feedback is not None else []
+    if state.validation_result is not None:
+        issues += state.validation_result.violations
+    return [issue for issue in issues if issue and issue.strip()]
 
 
-def content_improviser_node(state: LearningState) -> LearningState:
+def _improve_sections(content: str, issues: list) -> Optional[str]:
+    """
+    Rewrite only the markdown sections the issues refer to and splice them back in.
+
+    Returns:
+        Optional[str]: The improved document, or None when the issues cannot be pinned to
+        sections or touch most of the document, in which case a full rewrite is cheaper.
+    """
+    sections = split_sections(content)
+    if len(sections) < 2:
+        return None
+    targeted, unmatched = match_issues(sections, issues)
+    targeted_chars = sum(len(sections[index].text) for index in targeted)
+    if unmatched or not targeted or targeted_chars > SECTION_REWRITE_MAX_FRACTION * len(content):
+        return None
+
+    indices = sorted(targeted)
+    # Each request carries one section, so the outline only has to fit next to the largest.
+    outline_text = SECTION_IMPROVE_BUDGET.fit(
+        [prompt_section_improviser.content, max((sections[index].text for index in indices), key=len)],
+        outline=outline(sections)
+    )["outline"]
+    requests = [
+        [
+            prompt_section_improviser,
+            HumanMessage(content=f"""
+Lesson outline:
+{outline_text}
+
+Section to revise:
+{sections[index].text}
+
+Issues to address in this section:
+{chr(10).join(f"- {issue}" for issue in targeted[index])}
+""")
+        ]
+        for index in indices
+    ]
+    responses = content_improviser.batch(requests, return_exceptions=True)
+    for index, response in zip(indices, responses):
+        if isinstance(response, Exception):
+            logging.error(f"Failed to improve section '{sections[index].heading}': {response}")
+            continue
+        text = response.content if hasattr(response, "content") else str(response)
+        if text.strip():
+            sections[index].text = ensure_heading(sections[index], text)
+    logging.info(f"Improved {len(indices)} of {len(sections)} sections "
+                 f"({targeted_chars} of {len(content)} characters sent)")
+    return join_sections(sections)
+
+
+def content_improviser_node(state: LearningState) -> dict:
     """
     Improves generated content based on feedback and validation results.
 
-    This node takes the existing content, feedback, and validation results from the `state`
-    and uses an LLM (via `content_improviser` prompt) to refine the content.
-    The improved content replaces the original content in `state.content`.
+    This node takes the feedback gaps and validation violations from the `state` and
+    rewrites only the markdown sections they refer to (via the `content_improviser`
+    model), splicing the revised sections back into the document. When the issues cannot
+    be pinned to sections, or cover most of the document, the whole content is rewritten
+    instead. The improved content is returned as the new `content`.
     Error handling is included to prevent crashes if the LLM call fails.
 
     Args:
         state (LearningState): The current state of the learning process.
 
     Returns:
-        LearningState: The updated state with improved content.
+        dict: The improved `content`, or no update if there was nothing to improve or the call failed.
     """
     logging.info("Entering content_improviser_node")
     if state.content is not None and state.feedback is not None:
         try:
+            issues = _review_issues(state)
+            if not issues:
+                logging.info("No gaps or violations reported; content left unchanged.")
+                return {}
+            improved_content = _improve_sections(state.content.content, issues)
+            if improved_content is not None:
+                logging.info("Improvised content has been generated and updated in state.content!")
+                return {"content": ContentResponse(content=improved_content)}
+
+            logging.info("Issues span the whole document; rewriting the full content.")
+            fields = IMPROVE_BUDGET.fit(
+                prompt_content_improviser.content,
+                content=state.content.content,
+                feedback=state.feedback.model_dump(),
+                validation=state.validation_result.model_dump() if state.validation_result is not None else {}
+            )
             messages = [
                 prompt_content_improviser,
                 HumanMessage(content=f"""
-Unpolished Learning Resource:
-{state.content.model_dump()}
-
 Please improve the content by making it more engaging, informative, and suitable for the target audience.
 
 Feedback (including gaps):
-{state.feedback.model_dump()}
+{compact_json(fields["feedback"])}
 
 Post_Validation Result:
-{state.validation_result.model_dump()}
+{compact_json(fields["validation"])}
+
+Unpolished Learning Resource:
+{state.content.content}
 """)
             ]
             try:
                 response = content_improviser.invoke(messages)
                 improved_content = response.content if hasattr(response, "content") else str(response)
-                state.content = ContentResponse(content=improved_content)
-                logging.info(f"Improvised content has been generated and updated in state.content!")
+                logging.info("Improvised content has been generated and updated in state.content!")
+                return {"content": ContentResponse(content=improved_content)}
             except Exception as e:
                 logging.error(f"An error occurred during content improvisation: {e}")
         except pydantic.ValidationError as e:
             logging.error(f"Pydantic validation error in content_improviser_node: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred in content_improviser_node: {e}")
-    return state
+    return {}
 
 
-def collect_feedback_node(state: LearningState) -> LearningState:
+def collect_feedback_node(state: LearningState) -> dict:
     """
     Collects feedback on the generated content.
 
     This node uses an LLM (via `content_feedback` prompt) to generate feedback
     on the current content in `state.content`. The feedback, including rating,
-    comments, and identified gaps, is then validated and stored in `state.feedback`.
+    comments, and identified gaps, is then validated and returned as `feedback`.
     Error handling is included to prevent crashes if the LLM call or JSON parsing fails.
 
     Args:
         state (LearningState): The current state of the learning process.
 
     Returns:
-        LearningState: The updated state with collected feedback.
+        dict: The collected `feedback`, or no update if the call failed.
     """
     logging.info("Entering collect_feedback_node")
     if state.content is not None:
         try:
             logging.info("Collecting feedback for content")
+            content = FEEDBACK_BUDGET.fit(prompt_feedback.content, content=state.content.content)["content"]
             messages = [
                 prompt_feedback,
                 HumanMessage(content=f"""
 Unpolished Learning Resource:
-{state.content.content}
+{content}
 """)
             ]
             response = content_feedback.invoke(messages)
@@ -428,10 +654,11 @@ Unpolished Learning Resource:
             feedback_data = response.content if hasattr(response, "content") else response
             feedback_data = json.loads(feedback_data) if isinstance(feedback_data, str) else feedback_data
             try:
-                state.feedback = FeedBack.model_validate(feedback_data)
-                logging.info(f"Feedback processed and updated: {state.feedback}")
+                feedback = FeedBack.model_validate(feedback_data)
+                logging.info(f"Feedback processed and updated: {feedback}")
                 # Log rating and gaps for debugging
-                logging.info(f"Feedback rating: {state.feedback.rating}, gaps: {state.feedback.gaps}")
+                logging.info(f"Feedback rating: {feedback.rating}, gaps: {feedback.gaps}")
+                return {"feedback": feedback}
             except Exception as validation_error:
                 logging.error(f"Pydantic validation error for FeedBack: {validation_error}")
                 logging.error(f"Malformed LLM output: {feedback_data}")
@@ -441,23 +668,23 @@ Unpolished Learning Resource:
             logging.error(f"Pydantic validation error in collect_feedback_node: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred in collect_feedback_node: {e}")
-    return state
+    return {}
 
 
-def find_content_gap_node(state: LearningState) -> LearningState:
+def find_content_gap_node(state: LearningState) -> dict:
     """
     Identifies content gaps based on existing feedback.
 
     This node takes the current content and feedback from the `state` and uses an LLM
     (via `gap_finder` prompt) to identify specific content gaps or areas for improvement.
-    The updated feedback, including new gaps, is then stored in `state.feedback`.
+    The updated feedback, including new gaps, is then returned as `feedback`.
     Error handling is included for LLM call and JSON parsing failures.
 
     Args:
         state (LearningState): The current state of the learning process.
 
     Returns:
-        LearningState: The updated state with identified content gaps in the feedback.
+        dict: The `feedback` with identified content gaps, or no update if the call failed.
     """
     logging.info("Entering find_content_gap_node")
     if state.feedback is not None and state.content is not None:
@@ -471,11 +698,11 @@ def find_content_gap_node(state: LearningState) -> LearningState:
         try:
             # Update feedback with new gaps for the next improvise node
             updated_feedback = FeedBack.model_validate(json.loads(response) if isinstance(response, str) else response)
-            state.feedback = updated_feedback
-            logging.info(f"Feedback received and updated: {state.feedback}")
+            logging.info(f"Feedback received and updated: {updated_feedback}")
             # Log rating and gaps for debugging
             logging.info(
-                f"GapFinder rating: {state.feedback.rating}, gaps: {state.feedback.gaps}, ai_reliability_score: {state.feedback.ai_reliability_score}")
+                f"GapFinder rating: {updated_feedback.rating}, gaps: {updated_feedback.gaps}, ai_reliability_score: {updated_feedback.ai_reliability_score}")
+            return {"feedback": updated_feedback}
         except Exception as validation_error:
             logging.error(f"Pydantic validation error for FeedBack: {validation_error}")
             logging.error(f"Malformed LLM output: {response}")
@@ -485,35 +712,67 @@ def find_content_gap_node(state: LearningState) -> LearningState:
             logging.error(f"Pydantic validation error in find_content_gap_node: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred in find_content_gap_node: {e}")
-    return state
+    return {}
+
+
+LOCAL_VALIDATION_SKIP_CONFIDENCE = float(os.environ.get('LOCAL_VALIDATION_SKIP_CONFIDENCE', '0.8'))
+URL_PATTERN = re.compile(r"https?://[^\s,;)\]]+")
+
+
+def _local_validation(state: LearningState) -> LocalValidationReport:
+    """Run the deterministic checks with the topic as primary keyword and the known reference URLs."""
+    resource = state.enriched_resource or state.current_resource
+    allowed_urls = None
+    try:
+        allowed_urls = read_from_local('./data/scrapped_data.json')
+        if resource is not None:
+            allowed_urls += URL_PATTERN.findall(resource.references or "")
+    except Exception as e:
+        logging.warning(f"Reference URLs unavailable, skipping link provenance checks: {e}")
+    return validate_markdown(state.content.content, keyword=resource.topic if resource is not None else None,
+                             allowed_urls=allowed_urls)
 
 
-def post_validator_node(state: LearningState) -> LearningState:
+def post_validator_node(state: LearningState) -> dict:
     """
     Validates the generated content against predefined criteria.
 
-    This node takes the current content from `state.content` and uses an LLM
-    (via `post_validation` prompt) to assess its quality, adherence to guidelines,
-    and other validation criteria. The validation result is then stored in
-    `state.validation_result` as a `PostValidationResult` object.
+    Mechanical checks (headings, length, keyword placement, SEO metadata, markdown and
+    links) run locally via `validate_markdown`. When they pass and the reviewer's
+    `ai_reliability_score` is at least `LOCAL_VALIDATION_SKIP_CONFIDENCE`, the LLM is
+    skipped; otherwise it (via `post_validation` with the semantic-only prompt) checks
+    content integrity. Local and LLM violations are merged into
+    `validation_result`, a `PostValidationResult` object.
     Error handling is included for LLM call and JSON parsing failures.
 
     Args:
         state (LearningState): The current state of the learning process.
 
     Returns:
-        LearningState: The updated state with the content validation result.
+        dict: The `validation_result`; only the local checks' result if the LLM call failed.
     """
     logging.info("Entering post_validator_node")
     validation_result = None
+    update = {}
     if state.content is not None:
         try:
             logging.info("Checking Validation!")
+            report = _local_validation(state)
+            logging.info(f"Local validation ran {len(report.checks)} checks: {len(report.violations)} violations")
+            reliability = state.feedback.ai_reliability_score if state.feedback is not None else None
+            if report.is_clean and (reliability or 0) >= LOCAL_VALIDATION_SKIP_CONFIDENCE:
+                record_validation(llm_skipped=True)
+                logging.info(f"Local checks clean and reliability {reliability:.2f}; semantic validation skipped.")
+                return {"validation_result": PostValidationResult(is_valid=True, violations=[])}
+            record_validation(llm_skipped=False)
+            update["validation_result"] = PostValidationResult(is_valid=report.is_clean, violations=report.violations)
+            content = VALIDATION_BUDGET.fit(prompt_semantic_validation.content,
+                                            content=state.content.content)["content"]
             messages = [
-                prompt_post_validation,
+                prompt_semantic_validation,
                 HumanMessage(content=f"""
 Learning Resource:
-{state.content.content}
+{content}
 """)
             ]
             response = post_validation.invoke(messages)
@@ -522,8 +781,13 @@ Learning Resource:
             validation_result = json.loads(validation_result) if isinstance(validation_result,
                                                                             str) else validation_result
             try:
-                state.validation_result = PostValidationResult.model_validate(validation_result)
-                logging.info(f"Validated and Updated: {state.feedback}")
+                semantic = PostValidationResult.model_validate(validation_result if isinstance(validation_result, dict)
+                                                               else validation_result.model_dump())
+                update["validation_result"] = PostValidationResult(
+                    is_valid=report.is_clean and semantic.is_valid,
+                    violations=report.violations + semantic.violations
+                )
+                logging.info(f"Validated and Updated: {update['validation_result']}")
             except Exception as validation_error:
                 logging.error(f"Pydantic validation error for PostValidationResult: {validation_error}")
                 logging.error(f"Malformed LLM output: {validation_result}")
@@ -533,50 +797,135 @@ Learning Resource:
             logging.error(f"Pydantic validation error in post_validator_node: {e}")
         except Exception as e:
             logging.error(f"An unexpected error occurred in post_validator_node: {e}")
-    return state
+    return update
+
+
+def combined_critique_node(state: LearningState) -> dict:
+    """
+    Rates, finds gaps in and validates the content with a single LLM call.
+
+    Used instead of `collect_feedback_node`, `find_content_gap_node` and
+    `post_validator_node` when `state.critique_mode` is `combined`, so the content is
+    sent once per iteration instead of three times. The `CombinedCritique` response is
+    split into `feedback` and `validation_result`, whose violations also include those
+    of the local checks in `logis/local_validation.py`.
+
+    Args:
+        state (LearningState): The current state of the learning process.
+
+    Returns:
+        dict: The `feedback` and `validation_result`, or no update if the call failed.
+    """
+    logging.info("Entering combined_critique_node")
+    if state.content is not None:
+        try:
+            content = COMBINED_CRITIQUE_BUDGET.fit(prompt_combined_critique.content,
+                                                   content=state.content.content)["content"]
+            messages = [
+                prompt_combined_critique,
+                HumanMessage(content=f"""
+Learning Resource:
+{content}
+""")
+            ]
+            response = combined_critique.invoke(messages)
+            critique = response.content if hasattr(response, "content") else response
+            critique = json.loads(critique) if isinstance(critique, str) else critique
+            critique = CombinedCritique.model_validate(critique if isinstance(critique, dict) else critique.model_dump())
+            feedback = FeedBack.model_validate(critique.model_dump())
+            report = _local_validation(state)
+            validation_result = PostValidationResult(is_valid=critique.is_valid and report.is_clean,
+                                                     violations=report.violations + critique.violations)
+            logging.info(f"Combined critique rating: {feedback.rating}, gaps: {feedback.gaps}, "
+                         f"violations: {validation_result.violations}")
+            return {"feedback": feedback, "validation_result": validation_result}
+        except json.JSONDecodeError as e:
+            logging.error(f"JSON decoding error in combined_critique_node: {e}")
+        except pydantic.ValidationError as e:
+            logging.error(f"Pydantic validation error in combined_critique_node: {e}")
+        except Exception as e:
+            logging.error(f"An unexpected error occurred in combined_critique_node: {e}")
+    return {}
 
 
-def update_state(state: LearningState) -> LearningState:
+def update_state(state: LearningState) -> dict:
     """
     Updates an internal counter within the learning state.
 
-    This node increments a `count` attribute in the `LearningState` if an update
-    is required (as determined by `update_content_count`). This counter can be
-    used to track iterations or progress within the graph.
+    The content of this iteration is first recorded in the content version store
+    (`db/content_versions.py`) with the feedback and validation result it was just given.
+    This node then increments the `count` of the `LearningState` if an update is required
+    (as determined by `update_content_count`). This counter can be used to track
+    iterations or progress within the graph.
 
     Args:
         state (LearningState): The current state of the learning process.
 
     Returns:
-        LearningState: The updated state with an incremented count if an update was required.
+        dict: The incremented `count` if an update was required, otherwise no update.
     """
+    if state.run_id is not None and state.content is not None:
+        try:
+            put_version(state.run_id, state.count, state.content.content, state.feedback, state.validation_result)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to record content version {state.count} of run {state.run_id}: {e}")
     try:
-        if not hasattr(state, "count"):
-            state.count = 0
         response = update_content_count(state)
         if response == 'Update required':
-            state.count += 1
-            logging.info(f"State updated: {state.count}")
-        else:
-            logging.info(f"No update required, current count: {state.count}")
+            logging.info(f"State updated: {state.count + 1}")
+            return {"count": state.count + 1}
+        logging.info(f"No update required, current count: {state.count}")
     except Exception as e:
         logging.error(f"Error updating state: {e}")
-    return state
+    return {}
+
+
+def select_version_node(state: LearningState) -> dict:
+    """
+    Replaces the final content with the best-scoring iteration of the run.
+
+    Every iteration was recorded by `update_state`, so an earlier draft that was rated
+    higher (or passed validation when the last one did not) is restored without
+    generating anything. See `best_version` for the ranking.
+
+    Args:
+        state (LearningState): The current state of the learning process.
+
+    Returns:
+        dict: The `content`, `feedback` and `validation_result` of the best version, or no
+        update if the final content is the best one.
+    """
+    logging.info("Entering select_version_node")
+    if state.run_id is None or state.content is None:
+        return {}
+    best = best_version(state.run_id)
+    if best is None or best["content"] == state.content.content:
+        return {}
+    logging.info(f"Selected content version {best['version']} of run {state.run_id} "
+                 f"(rating {best['rating']}, valid: {bool(best['is_valid'])})")
+    return {
+        "content": ContentResponse(content=best["content"]),
+        "feedback": FeedBack.model_validate(best["feedback"]) if best["feedback"] else None,
+        "validation_result": (PostValidationResult.model_validate(best["validation_result"])
+                              if best["validation_result"] else None),
+    }
 
 
 builder = StateGraph(LearningState)
-builder.add_node("user_info", user_info_node)
-builder.add_node("learning_resource", enrich_content)
-builder.add_node("route_selector", route_selector_node)
-builder.add_node("content_generation", generate_lesson_content)
-builder.add_node("blog_generation", generate_blog_content)
-builder.add_node("content_improviser", content_improviser_node)
-builder.add_node("collect_feedback", collect_feedback_node)
-builder.add_node("find_content_gap", find_content_gap_node)
-builder.add_node("update_state", update_state)
-builder.add_node("crawler", crawler_node)
-builder.add_node("content_seo_optimization", seo_optimiser_node)
-builder.add_node("post_validator", post_validator_node)
+builder.add_node("user_info", instrument_node("user_info", user_info_node))
+builder.add_node("learning_resource", instrument_node("learning_resource", enrich_content))
+builder.add_node("route_selector", instrument_node("route_selector", route_selector_node))
+builder.add_node("content_generation", instrument_node("content_generation", generate_lesson_content))
+builder.add_node("blog_generation", instrument_node("blog_generation", generate_blog_content))
+builder.add_node("content_improviser", instrument_node("content_improviser", content_improviser_node))
+builder.add_node("collect_feedback", instrument_node("collect_feedback", collect_feedback_node))
+builder.add_node("find_content_gap", instrument_node("find_content_gap", find_content_gap_node))
+builder.add_node("update_state", instrument_node("update_state", update_state))
+builder.add_node("crawler", instrument_node("crawler", crawler_node))
+builder.add_node("content_seo_optimization", instrument_node("content_seo_optimization", seo_optimiser_node))
+builder.add_node("post_validator", instrument_node("post_validator", post_validator_node))
+builder.add_node("combined_critique", instrument_node("combined_critique", combined_critique_node))
+builder.add_node("select_version", instrument_node("select_version", select_version_node))
 
 builder.set_entry_point("user_info")
 builder.add_edge("user_info", "crawler")
@@ -598,35 +947,187 @@ builder.add_conditional_edges(
 builder.add_edge("content_generation", "content_seo_optimization")
 builder.add_edge("blog_generation", "content_seo_optimization")
 builder.add_edge("content_seo_optimization", "content_improviser")
-builder.add_edge("content_improviser", 'collect_feedback')
+builder.add_conditional_edges(
+    "content_improviser",
+    lambda state: "combined_critique" if state.critique_mode == CritiqueMode.COMBINED else "collect_feedback",
+    {
+        "collect_feedback": "collect_feedback",
+        "combined_critique": "combined_critique"
+    }
+)
 builder.add_edge("collect_feedback", "find_content_gap")
 builder.add_edge("find_content_gap", 'post_validator')
 builder.add_edge("post_validator", "update_state")
+builder.add_edge("combined_critique", "update_state")
 builder.add_conditional_edges(
     "update_state",
-    lambda state: "content_improviser" if getattr(state, "count", 0) < 4 else "END",
+    lambda state: "content_improviser" if getattr(state, "count", 0) < 4 else "select_version",
     {
         "content_improviser": "content_improviser",
-        "END": END
+        "select_version": "select_version"
     }
 )
+builder.add_edge("select_version", END)
 
 graph = builder.compile()
 
 
-async def graph_run(user_data: dict):
+@asynccontextmanager
+async def _prepared_run(user_data: Optional[dict], run_id: Optional[str], checkpoint: bool,
+                        configurable: Optional[dict] = None):
+    """
+    Set up one graph run: metrics, run config and, when `checkpoint` is set, a graph compiled
+    with the SQLite checkpointer. History and progress the caller did not supply are loaded
+    from the learner store, limited to the learner's recent history and the requested
+    topic. If `run_id` names an interrupted run, the graph input is None so LangGraph
+    resumes from the last completed node.
+
+    Yields:
+        Tuple of (compiled graph, graph input, run config, RunMetrics).
+    """
+    run_id = run_id or uuid.uuid4().hex
+    if user_data is not None:
+        user_data = await asyncio.to_thread(load_learner_slice, user_data)
+    metrics = RunMetrics(run_id)
+    config = {'recursion_limit': 30, 'callbacks': [LLMMetricsCallback(metrics)],
+              'configurable': {'thread_id': run_id, **(configurable or {})}}
+    if not checkpoint:
+        if user_data is None:
+            raise ValueError("User data is required when checkpointing is disabled.")
+        yield graph, LearningState.model_validate({**user_data, 'run_id': run_id}), config, metrics
+        return
+
+    async with open_checkpointer() as saver:
+        checkpointed_graph = builder.compile(checkpointer=saver)
+        snapshot = await checkpointed_graph.aget_state(config)
+        if snapshot.next:
+            logging.info(f"Resuming run {run_id} before node(s): {', '.join(snapshot.next)}")
+            graph_input = None
+        elif user_data is None:
+            raise ValueError(f"Run {run_id} has no interrupted checkpoint to resume and no user data was given.")
+        else:
+            graph_input = LearningState.model_validate({**user_data, 'run_id': run_id})
+        user_id = (user_data or {}).get('user', {}).get('id')
+        await asyncio.to_thread(mark_run, run_id, 'running', user_id=str(user_id) if user_id is not None else None)
+        try:
+            yield checkpointed_graph, graph_input, config, metrics
+        except BaseException:
+            await asyncio.to_thread(mark_run, run_id, 'failed')
+            raise
+        await asyncio.to_thread(mark_run, run_id, 'completed')
+
+
+def _pregenerated_state(user_data: Optional[dict], run_id: Optional[str]) -> Optional[LearningState]:
+    """
+    The final state for a request whose content was pre-generated by `pregenerate.py`, or
+    None. Content is matched on the grade, topic, lesson style and content type of the
+    requested resource.
+    """
+    if not user_data or not user_data.get('current_resource'):
+        return None
+    try:
+        state = LearningState.model_validate({**user_data, 'run_id': run_id})
+        resource = state.current_resource
+        cached = get_pregenerated(resource.grade, resource.topic_id, resource.topic, lesson_decision_node(state),
+                                  state.content_type.value)
+    except pydantic.ValidationError as e:
+        logging.error(f"Invalid user data, skipping the pre-generated content lookup: {e}")
+        return None
+    if cached is None:
+        record_cache_miss("pregenerated")
+        return None
+    record_cache_hit("pregenerated")
+    logging.info(f"Serving pre-generated content of run {cached['run_id']} for topic '{resource.topic}'")
+    return state.model_copy(update={
+        'content': ContentResponse(content=cached['content']),
+        'feedback': FeedBack.model_validate(cached['feedback']) if cached['feedback'] else None,
+        'validation_result': (PostValidationResult.model_validate(cached['validation_result'])
+                              if cached['validation_result'] else None),
+    })
+
+
+async def _pregenerated_output(user_data: Optional[dict], run_id: Optional[str]) -> Optional[dict]:
+    """`_pregenerated_state` as a graph output dict, with a run summary, recorded like a graph run."""
+    run_id = run_id or uuid.uuid4().hex
+    state = await asyncio.to_thread(_pregenerated_state, user_data, run_id)
+    if state is None:
+        return None
+    output = finish_run(RunMetrics(run_id), dict(state))
+    await asyncio.to_thread(record_run, output, (user_data or {}).get('user'))
+    return output
+
+
+async def graph_run(user_data: Optional[dict], run_id: Optional[str] = None, checkpoint: bool = True,
+                    use_pregenerated: bool = True):
     """
     Invokes the LangGraph with initial user data to start the learning process.
 
     This asynchronous function takes initial user data, validates it against the
     `LearningState` schema, and then invokes the compiled LangGraph (`graph`).
     The graph processes the data through its defined nodes and returns the final
-    `LearningState` after execution.
+    `LearningState` after execution, with per-node and per-LLM-call metrics
+    attached as `run_summary`.
+
+    With `checkpoint` enabled the state is saved to SQLite after every node, keyed by
+    `run_id`. Calling again with the id of a run that crashed or was interrupted resumes
+    it from the last completed node; `user_data` may then be None.
 
     Args:
-        user_data (dict): A dictionary containing the initial user information.
+        user_data (Optional[dict]): A dictionary containing the initial user information.
+        run_id (Optional[str]): Id of the run to start or resume. Generated if omitted.
+        checkpoint (bool): Persist checkpoints so the run can be resumed.
+        use_pregenerated (bool): Return pre-generated content for the requested resource,
+            if there is any, instead of running the graph.
 
     Returns:
         LearningState: The final state of the learning process after the graph has run.
     """
-    return await graph.ainvoke(LearningState.model_validate(user_data), config={'recursion_limit': 30})
+    if use_pregenerated:
+        output = await _pregenerated_output(user_data, run_id)
+        if output is not None:
+            return output
+    async with _prepared_run(user_data, run_id, checkpoint) as (run_graph, graph_input, config, metrics):
+        with metrics.activate():
+            output = await run_graph.ainvoke(graph_input, config=config)
+    output = finish_run(metrics, output)
+    await asyncio.to_thread(record_run, output, (user_data or {}).get('user'))
+    return output
+
+
+async def graph_stream(user_data: Optional[dict], sink: ContentSink, run_id: Optional[str] = None,
+                       checkpoint: bool = True, use_pregenerated: bool = True):
+    """
+    Runs the LangGraph like `graph_run`, streaming generated content to `sink` as it is produced.
+
+    Lesson and blog generation stream token deltas; SEO optimisation and every improvement
+    iteration arrive as replace-in-place updates. See `utils.streaming` for the event format.
+
+    Args:
+        user_data (Optional[dict]): A dictionary containing the initial user information.
+        sink (ContentSink): Sync or async callable receiving each stream event.
+        run_id (Optional[str]): Id of the run to start or resume. Generated if omitted.
+        checkpoint (bool): Persist checkpoints so the run can be resumed.
+        use_pregenerated (bool): Send pre-generated content for the requested resource, if
+            there is any, as a single `replace` event instead of running the graph.
+
+    Returns:
+        The final state of the learning process after the graph has run.
+    """
+    streamer = ContentStreamer(sink)
+    if use_pregenerated:
+        output = await _pregenerated_output(user_data, run_id)
+        if output is not None:
+            await streamer.emit({"event": "revision_start", "revision": 1, "node": "pregenerated"})
+            await streamer.emit({"event": "replace", "revision": 1, "node": "pregenerated",
+                                 "content": output["content"].content})
+            await streamer.emit({"event": "done"})
+            return output
+    async with _prepared_run(user_data, run_id, checkpoint, {STREAM_CONFIG_KEY: True}) as \
+            (run_graph, graph_input, config, metrics):
+        with metrics.activate():
+            async for event in run_graph.astream_events(graph_input, config=config, version="v2"):
+                await streamer.handle(event)
+    output = finish_run(metrics, streamer.final_output)
+    await asyncio.to_thread(record_run, output, (user_data or {}).get('user'))
+    await streamer.emit({"event": "done"})
+    return output
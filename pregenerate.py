@@ -0,0 +1,141 @@
+"""pregenerate.py
+
+Offline pre-generation of curriculum content.
+
+Every topic in `data/lessons/` is known ahead of time. This script enumerates each
+(grade, topic_id, style, content_type) combination and runs the learning graph over it
+with bounded concurrency. Validated results go to `data/pregenerated.sqlite`
+(`db/pregeneration.py`), where `graph_run` finds them, so on-demand requests for these
+topics become cache lookups.
+
+Progress is kept in a SQLite work queue. An interrupted job resumes where it stopped:
+finished items are skipped, and a half-finished item's graph run resumes from its last
+checkpointed node, because each attempt at an item has its own run id. A retry after a
+failure starts a fresh run.
+
+Usage:
+    python pregenerate.py
+    python pregenerate.py --concurrency 4 --content-types lesson quiz
+    python pregenerate.py --status
+"""
+import argparse
+import asyncio
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s [%(filename)s:%(lineno)d] %(levelname)s %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+from db.loader import load_json_data
+from db.pregeneration import PREGENERATION_DB_PATH, attempt_run_id, claim, enqueue, finish, item_key, queue_counts, \
+    reset_interrupted, save_pregenerated
+from logis.logical_functions import lesson_decision_node
+from schemas import ContentType, LearningState
+
+LESSON_FILES = ["lessons/class_11_physics.json", "lessons/class_12_physics.json"]
+
+
+def _resource(lesson: dict) -> dict:
+    """`LearningResource` fields of a lesson file entry."""
+    return {
+        "subject": lesson["subject"].lower(),
+        "grade": lesson["grade"],
+        "unit": lesson.get("unit", ""),
+        "topic_id": lesson["topic_id"],
+        "topic": lesson["topic_title"],
+        "description": lesson.get("description", ""),
+        "elaboration": lesson.get("elaboration", ""),
+        "keywords": lesson.get("keywords", []),
+        "hours": lesson.get("hours", 1),
+        "references": lesson.get("references", ""),
+    }
+
+
+def _user(grade: int) -> dict:
+    """Generic learner profile the content for `grade` is generated for."""
+    return {
+        "username": f"grade_{grade}_student",
+        "age": grade + 5,
+        "grade": grade,
+        "id": f"pregeneration-{grade}",
+        "is_active": True,
+        "user_info": f"A typical grade {grade} student following the physics curriculum.",
+    }
+
+
+def curriculum_items(content_types: list) -> list:
+    """Every (grade, topic_id, style, content_type) combination of the lesson files."""
+    items = []
+    for filename in LESSON_FILES:
+        for lesson in load_json_data(filename):
+            resource = _resource(lesson)
+            for content_type in content_types:
+                state = LearningState.model_validate({"user": _user(resource["grade"]),
+                                                      "current_resource": resource, "content_type": content_type})
+                items.append({"grade": resource["grade"], "topic_id": resource["topic_id"],
+                              "style": lesson_decision_node(state), "content_type": content_type,
+                              "resource": resource})
+    return items
+
+
+async def generate_item(item: dict, accept_invalid: bool) -> str:
+    """
+    Run the graph for one queue item and store its content.
+
+    Returns:
+        str: Empty if the content was stored, otherwise why it was not.
+    """
+    from nodes import graph_run
+
+    user_data = {"user": _user(item["grade"]), "current_resource": item["resource"],
+                 "content_type": item["content_type"]}
+    output = await graph_run(user_data, run_id=attempt_run_id(item), use_pregenerated=False)
+    state = LearningState.model_validate(output)
+    if state.content is None or not state.content.content:
+        return "no content was generated"
+    if not accept_invalid and not (state.validation_result and state.validation_result.is_valid):
+        violations = state.validation_result.violations if state.validation_result else []
+        return f"content did not pass validation: {violations}"
+    await asyncio.to_thread(save_pregenerated, item, state)
+    return ""
+
+
+async def worker(name: int, max_attempts: int, accept_invalid: bool):
+    while (item := await asyncio.to_thread(claim, max_attempts)) is not None:
+        key = item_key(item)
+        logging.info(f"Worker {name}: generating {key} (attempt {item['attempts']})")
+        try:
+            error = await generate_item(item, accept_invalid)
+        except Exception as e:
+            logging.exception(f"Worker {name}: {key} failed")
+            error = f"{type(e).__name__}: {e}"
+        await asyncio.to_thread(finish, item, error or None)
+        if error:
+            logging.warning(f"Worker {name}: {key} not stored: {error}")
+
+
+async def main(concurrency: int, content_types: list, max_attempts: int, accept_invalid: bool):
+    added = enqueue(curriculum_items(content_types))
+    resumed = reset_interrupted()
+    logging.info(f"Queued {added} new item(s); {resumed} interrupted item(s) returned to the queue; "
+                 f"queue: {queue_counts()}")
+    await asyncio.gather(*(worker(i, max_attempts, accept_invalid) for i in range(concurrency)))
+    print(f"Pre-generation finished; queue in {PREGENERATION_DB_PATH}: {queue_counts()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate content for every curriculum topic.")
+    parser.add_argument("--concurrency", type=int, default=2, help="Graph runs in flight at once.")
+    parser.add_argument("--content-types", nargs="*", default=[t.value for t in ContentType],
+                        choices=[t.value for t in ContentType], help="Content types to generate.")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts per item before it is given up.")
+    parser.add_argument("--accept-invalid", action="store_true",
+                        help="Store content even if it did not pass post-validation.")
+    parser.add_argument("--status", action="store_true", help="Print the queue status and exit.")
+    args = parser.parse_args()
+    if args.status:
+        print(queue_counts())
+    else:
+        asyncio.run(main(args.concurrency, args.content_types, args.max_attempts, args.accept_invalid))
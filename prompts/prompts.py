@@ -6,15 +6,37 @@ These prompts are crucial for tasks such as summarizing user information,
 enriching learning resources, generating lessons/blogs, improving content,
 collecting feedback, and performing SEO optimization and post-validation.
 """
-import json
 import logging
 
 from langchain_core.messages import SystemMessage
 from langchain_core.prompts import PromptTemplate
 
-from models.llm_models import get_gemini_model, get_groq_model, get_deepseek_model
+from models.llm_models import get_routed_model
+from prompts.token_budget import TokenBudget, compact_json
 from schemas import UserInfo, ContentResponse, EnrichedLearningResource, RouteSelector, \
-    FeedBack, PostValidationResult
+    FeedBack, PostValidationResult, LessonOutline, CombinedCritique
+
+# Token budgets per prompt (see prompts/token_budget.py). Fields listed with a share may be
+# truncated; everything else in the prompt is sent whole and counted against the budget.
+USER_SUMMARY_BUDGET = TokenBudget("user_summary", {"existing_data": 1})
+ENRICHMENT_BUDGET = TokenBudget("enriched_content", {"foundation_data": 1, "scrapped_data": 2})
+CONTENT_GENERATION_BUDGET = TokenBudget("content_generation", {"user_data": 1, "resource_data": 3, "urls": 1})
+LESSON_OUTLINE_BUDGET = TokenBudget("lesson_outline", {"user_data": 1, "resource_data": 3})
+LESSON_SECTION_BUDGET = TokenBudget("lesson_section", {"user_data": 1, "resource_data": 3, "urls": 1})
+BLOG_GENERATION_BUDGET = TokenBudget("blog_generation", {"user_data": 1, "resource_data": 3})
+ROUTE_SELECTOR_BUDGET = TokenBudget("route_selector", {"current_resources": 1}, total=2000)
+GAP_FINDER_BUDGET = TokenBudget("gap_finder", {"content": 3, "feedback": 1})
+# Messages assembled in nodes.py. Content that the model must return in full (SEO
+# optimisation, improvement) is never truncated; content that is only reviewed may be.
+FEEDBACK_BUDGET = TokenBudget("content_feedback", {"content": 1})
+VALIDATION_BUDGET = TokenBudget("post_validation", {"content": 1})
+COMBINED_CRITIQUE_BUDGET = TokenBudget("combined_critique", {"content": 1})
+IMPROVE_BUDGET = TokenBudget("content_improviser", {"feedback": 1, "validation": 1})
+SECTION_IMPROVE_BUDGET = TokenBudget("section_improviser", {"outline": 1})
+
+
+def markdown_links(urls: list) -> list:
+    return [f"- [{url}]({url})" for url in urls]
 
 
 class UserSummaryTemplate(PromptTemplate):
@@ -30,7 +52,7 @@ class UserSummaryTemplate(PromptTemplate):
         logging.info("Initializing UserSummaryTemplate")
         super().__init__(
             template=(
-                """Your role is {action}. You are given structured user data: {existing_data}
+                """You are given structured user data at the end of this prompt.
 Your task:
 - For **every key-value pair**, write a meaningful, human-readable summary.
 - Maintain the same keys in the output.
@@ -46,6 +68,9 @@ Example output:
   "is_active": "User is currently active",
   "user_info": "The user named dyane_master is 22 years old and is currently active. They are halfway through Grade 12 and currently focused on academic growth. No further user details are available at this time."
 }}
+
+Your role is {action}.
+User data: {existing_data}
 """
             ),
             input_variables=["action", "existing_data"], *args, **kwargs
@@ -53,12 +78,13 @@ Example output:
 
     def format_prompt(self, action: str, existing_data: dict) -> str:
         """
-        Convert the input dict to a pretty JSON string for better formatting and inject it into the prompt.
+        Convert the input dict to a compact JSON string and inject it at the end of the prompt.
         """
         logging.info(f"Formatting UserSummaryTemplate prompt for action: {action}")
+        fields = USER_SUMMARY_BUDGET.fit(self.template, action=action, existing_data=existing_data)
         return self.format(
             action=action,
-            existing_data=json.dumps(existing_data, indent=2)
+            existing_data=compact_json(fields["existing_data"])
         )
 
 
@@ -71,14 +97,11 @@ class EnrichContent(PromptTemplate):
         logging.info("Initializing EnrichFoundationContent Template")
         super().__init__(
             template="""
-You are a curriculum enrichment agent. Your job is to {action}.
+You are a curriculum enrichment agent.
 
-You have access to:
-- Structured foundation resource data (the base object you must work from):
-{foundation_data}
-
-- External search data (for clarification only, strictly within foundation scope):
-{scrapped_data}
+You have access to (given at the end of this prompt):
+- Structured foundation resource data (the base object you must work from).
+- External search data (for clarification only, strictly within foundation scope).
 
 Instructions:
 - Begin by copying the structured foundation data **exactly** as your starting point.
@@ -95,6 +118,14 @@ Instructions:
 
 Output:
 Return a single, valid JSON object with the enriched resource. The enriched content **must remain strictly aligned with the foundation content only**. Do not include any explanations, commentary, or extra text.
+
+Your job is to {action}.
+
+Foundation resource data:
+{foundation_data}
+
+External search data:
+{scrapped_data}
 """,
             input_variables=["action", "foundation_data", "scrapped_data"]
         )
@@ -106,10 +137,12 @@ Return a single, valid JSON object with the enriched resource. The enriched cont
             scrapped_data: dict
     ) -> str:
         logging.info("Formatting EnrichContent prompt")
+        fields = ENRICHMENT_BUDGET.fit(self.template, action=action, foundation_data=foundation_data,
+                                       scrapped_data=scrapped_data)
         return self.format(
             action=action,
-            foundation_data=json.dumps(foundation_data, indent=2),
-            scrapped_data=json.dumps(scrapped_data, indent=2)
+            foundation_data=compact_json(fields["foundation_data"]),
+            scrapped_data=compact_json(fields["scrapped_data"])
         )
 
 
@@ -119,6 +152,8 @@ class ContentGenerationTemplate(PromptTemplate):
     The model must return ONLY the markdown content as a plain string.
     No JSON, metadata, or commentary outside the content.
     The structure adapts to the user input (class, topic, curriculum, URLs, style, etc.).
+    Instructions come first and the per-request data last, so the long static prefix is
+    identical across calls and can be served from provider prompt caches.
     """
 
     def __init__(self):
@@ -126,153 +161,285 @@ class ContentGenerationTemplate(PromptTemplate):
         super().__init__(
             template=(
                 """
-                You are an expert educational content creator and SEO-focused blog writer.
-                
-                PRIMARY OBJECTIVE:
-                {action}
-                
-                USER CONTEXT:
-                {user_data}
-                
-                LEARNING RESOURCE METADATA:
-                {resource_data}
-                
-                REFERENCE URLs:
-                {urls}
-                
-                PREFERRED STYLE & TONE:
-                {style}
-                
-                ---
-                
-                INSTRUCTIONS:
-                
-                1. Generate a **well-structured, markdown-formatted educational blog lesson**.
-                2. Follow the **exact section order** below, with keyword-rich and SEO-friendly headings.
-                3. Insert the **primary keyword** from {action} or {resource_data}:
-                   - Within the first 25 words of the introduction.
-                   - At least once in a subheading.
-                   - Naturally 2–3 times in the content (avoid keyword stuffing).
-                4. Use **short paragraphs (2–4 sentences)** and bullet points for readability.
-                5. Include **at least one table or structured list** if it aids understanding.
-                6. Present **formulas in standalone LaTeX blocks** and explain variables.
-                7. Include **2–3 FAQs** for reinforcement and SEO snippet opportunities.
-                8. Include **1–2 real-world examples or case studies** showing relevance (technology, environment, society).
-                9. Ensure **curriculum alignment**:
-                   - Mention the exact curriculum unit or subject (e.g., "NEB Class 12 Physics Unit 5").
-                   - Highlight exam relevance and practical applications.
-                   - Optionally reference advanced topics explicitly provided in {resource_data}.
-                10. Include the references as well.
-                11. Keep content **SEO-friendly yet readable**:
-                    - Clear, informative headings.
-                    - Concise bullet points.
-                    - URLs preserved as clickable links.
-                    - Conversational yet authoritative tone.
-                    - Include simple diagrams or chart placeholders if they aid comprehension.
-                
-                ---
-                
-                STRUCTURE TO FOLLOW:
-                
-                # Topic Title
-                - Use the exact topic from {action} or {resource_data}.
-                - Keep it keyword-rich and clear and google friendly.
-                - Keep the title google friendly and concise of the contents.
-                
-                ## Introduction
-                - Define the topic concisely.
-                - Include the primary keyword early.
-                - Explain why it matters and its relevance to the curriculum.
-                
-                ## Real-Life Application
-                - Include 1–2 examples or case studies:
-                  - **Example 1:** Technology / Environment / Society
-                  - **Example 2:** Local or emerging use case
-                
-                ## Formula & Explanation
-                - Present formulas in standalone LaTeX blocks.
-                - Define all variables.
-                - Explain derivations or logic at student level.
-                - Include short example calculations if possible.
-                
-                ## Curriculum Relevance
-                - State the exact curriculum unit or subject.
-                - Emphasize exam relevance and practical applications.
-                - Optionally reference advanced topics from {resource_data}.
-                
-                ## Frequently Asked Questions
-                - 2–3 common student questions.
-                - Answers concise, accurate, and SEO-friendly.
-                - Include at least one “People Also Ask” style question.
-                
-                ## Summary
-                - 3–5 key points in bullet form.
-                - Short, clear, keyword-friendly bullets
-                
-                OUTPUT FORMAT:
-                - Markdown only.
-                - No JSON, metadata, or commentary outside the markdown.
-                """
+You are an expert educational content creator and SEO-focused blog writer.
+Follow the instructions and structure below, then write the lesson for the INPUT at the end.
+
+INSTRUCTIONS:
+
+1. Generate a **well-structured, markdown-formatted educational blog lesson**.
+2. Follow the **exact section order** below, with keyword-rich and SEO-friendly headings.
+3. Insert the **primary keyword** from the objective or the resource metadata below:
+   - Within the first 25 words of the introduction.
+   - At least once in a subheading.
+   - Naturally 2–3 times in the content (avoid keyword stuffing).
+4. Use **short paragraphs (2–4 sentences)** and bullet points for readability.
+5. Include **at least one table or structured list** if it aids understanding.
+6. Present **formulas in standalone LaTeX blocks** and explain variables.
+7. Include **2–3 FAQs** for reinforcement and SEO snippet opportunities.
+8. Include **1–2 real-world examples or case studies** showing relevance (technology, environment, society).
+9. Ensure **curriculum alignment**:
+   - Mention the exact curriculum unit or subject (e.g., "NEB Class 12 Physics Unit 5").
+   - Highlight exam relevance and practical applications.
+   - Optionally reference advanced topics explicitly provided in the resource metadata.
+10. Include the references as well.
+11. Keep content **SEO-friendly yet readable**:
+    - Clear, informative headings.
+    - Concise bullet points.
+    - URLs preserved as clickable links.
+    - Conversational yet authoritative tone.
+    - Include simple diagrams or chart placeholders if they aid comprehension.
+
+---
+
+STRUCTURE TO FOLLOW:
+
+# Topic Title
+- Use the exact topic from the objective or the resource metadata below.
+- Keep it keyword-rich and clear and google friendly.
+- Keep the title google friendly and concise of the contents.
+
+## Introduction
+- Define the topic concisely.
+- Include the primary keyword early.
+- Explain why it matters and its relevance to the curriculum.
+
+## Real-Life Application
+- Include 1–2 examples or case studies:
+  - **Example 1:** Technology / Environment / Society
+  - **Example 2:** Local or emerging use case
+
+## Formula & Explanation
+- Present formulas in standalone LaTeX blocks.
+- Define all variables.
+- Explain derivations or logic at student level.
+- Include short example calculations if possible.
+
+## Curriculum Relevance
+- State the exact curriculum unit or subject.
+- Emphasize exam relevance and practical applications.
+- Optionally reference advanced topics from the resource metadata.
+
+## Frequently Asked Questions
+- 2–3 common student questions.
+- Answers concise, accurate, and SEO-friendly.
+- Include at least one “People Also Ask” style question.
+
+## Summary
+- 3–5 key points in bullet form.
+- Short, clear, keyword-friendly bullets
+
+OUTPUT FORMAT:
+- Markdown only.
+- No JSON, metadata, or commentary outside the markdown.
+
+---
+
+INPUT
+
+PRIMARY OBJECTIVE:
+{action}
+
+USER CONTEXT:
+{user_data}
+
+LEARNING RESOURCE METADATA:
+{resource_data}
+
+REFERENCE URLs:
+{urls}
+
+PREFERRED STYLE & TONE:
+{style}
+"""
             ),
             input_variables=["action", "user_data", "resource_data", "style", "urls"]
         )
 
     def format_prompt(self, action: str, user_data: dict, resource_data: dict, style: str, urls: list) -> str:
         logging.info(f"Formatting ContentGenerationTemplate prompt for action: {action}")
+        fields = CONTENT_GENERATION_BUDGET.fit(self.template, action=action, user_data=user_data,
+                                               resource_data=resource_data, style=style, urls=markdown_links(urls))
         return self.format(
             action=action,
-            user_data=json.dumps(user_data, indent=2),
-            resource_data=json.dumps(resource_data, indent=2),
+            user_data=compact_json(fields["user_data"]),
+            resource_data=compact_json(fields["resource_data"]),
             style=style,
-            urls="\n".join(f"- [{url}]({url})" for url in urls)
+            urls="\n".join(fields["urls"])
         )
 
 
-CONTENT_IMPROVISE_SYSTEM_PROMPT = SystemMessage(content=
-                                                """
-                                                You are an energetic, insightful, and detail-oriented educational content improver.
-                                                
-                                                PRIMARY OBJECTIVE:
-                                                Take the given educational content and enhance it for clarity, engagement, and reader experience — while preserving all original meaning, structure, key points, and URLs.
-                                                
-                                                IMPROVEMENT PRINCIPLES:
-                                                - Use **clear markdown structure** with proper headings, subheadings, and lists for scannability.
-                                                - Maintain a **warm, professional, and approachable tone** — friendly but academically credible.
-                                                - Improve flow, sentence clarity, and logical progression.
-                                                - Include **memorable real-world connections** or analogies where appropriate.
-                                                - Add **1–2 light reflective prompts or motivational nudges** to spark curiosity (without overwhelming the text).
-                                                - Avoid redundancy, filler, or overly complex phrasing.
-                                                - Keep explanations concise and precise for motivated learners who want efficiency and depth.
-                                                - Emphasize **why** a topic matters alongside what it is.
-                                                - Always preserve factual correctness and technical accuracy.
-                                                - **Do NOT remove, alter, or delete any URLs or reference links** present in the original content.
-                                                
-                                                VALIDATION FEEDBACK INTEGRATION:
-                                                You will receive a post-validation report containing:
-                                                - `"is_valid"`: a boolean indicating if the content passed quality validation.
-                                                - `"violations"`: a list of specific issues or gaps found.
-                                                
-                                                STRICT RULES FOR USING FEEDBACK:
-                                                1. If `"is_valid": true`:
-                                                   - Apply **only light polishing** (minor structural and readability improvements).
-                                                   - Do NOT make major changes.
-                                                2. If `"is_valid": false`:
-                                                   - Address **only** the violations listed.
-                                                   - Do NOT alter valid sections unnecessarily.
-                                                   - Fix structure, clarity, and engagement issues exactly as reported.
-                                                3. Never add new factual content, invent data, or change established meanings.
-                                                4. Never remove key ideas, examples, or URLs already in the original.
-                                                5. Any additions must come from **clarifying existing points**, not adding new knowledge.
-                                                
-                                                OUTPUT FORMAT:
-                                                - Return **only** the improved markdown content.
-                                                - No JSON, no metadata, no explanations before or after the markdown.
-                                                
-                                                EXAMPLE OPENING STYLE:
-                                                “Let’s dive into [subject] — mastering this will give you a sharper edge in your learning journey!”
-                                                
-                                                Now, improve the provided content based on these rules and the validation feedback.
-                                                """)
+class LessonOutlineTemplate(PromptTemplate):
+    """
+    Template for the first step of outline-first lesson generation: a structured outline
+    (title plus ordered sections with key points) that section prompts expand in parallel.
+    """
+
+    def __init__(self):
+        logging.info("Initializing LessonOutlineTemplate")
+        super().__init__(
+            template=(
+                """You are an expert educational content planner.
+Plan a markdown lesson for the learner and resource below. Do not write the lesson itself.
+
+Return a JSON object with:
+- "title": a keyword-rich, concise lesson title using the exact topic.
+- "sections": the sections in reading order, each with a "heading" (no '#' characters) and 2-5 "key_points".
+
+Follow this section order, adapting headings to the topic: Introduction, Real-Life Application,
+Formula & Explanation, Curriculum Relevance, Frequently Asked Questions, Summary.
+Key points must not overlap between sections.
+
+USER CONTEXT:
+{user_data}
+
+LEARNING RESOURCE METADATA:
+{resource_data}
+
+PREFERRED STYLE & TONE:
+{style}"""
+            ),
+            input_variables=["user_data", "resource_data", "style"]
+        )
+
+    def format_prompt(self, user_data: dict, resource_data: dict, style: str) -> str:
+        logging.info("Formatting LessonOutlineTemplate prompt.")
+        fields = LESSON_OUTLINE_BUDGET.fit(self.template, user_data=user_data, resource_data=resource_data,
+                                           style=style)
+        return self.format(
+            user_data=compact_json(fields["user_data"]),
+            resource_data=compact_json(fields["resource_data"]),
+            style=style
+        )
+
+
+class LessonSectionTemplate(PromptTemplate):
+    """
+    Template for writing one section of an outlined lesson. Every section prompt shares
+    the same user, resource and style context and sees the full outline, so sections
+    generated concurrently stay consistent and do not repeat each other. Only the last
+    lines differ between sections, so the shared prefix is cacheable.
+    """
+
+    def __init__(self):
+        logging.info("Initializing LessonSectionTemplate")
+        super().__init__(
+            template=(
+                """You are an expert educational content creator writing ONE section of a markdown lesson.
+
+INSTRUCTIONS:
+- Start with the line "## <SECTION TO WRITE>" and write only this section; other sections are written separately.
+- Use short paragraphs (2-4 sentences), bullet points, and standalone LaTeX blocks for formulas with every variable defined.
+- Keep URLs as clickable links where they support this section.
+- Stay consistent with the outline and do not cover key points of other sections.
+
+OUTPUT FORMAT:
+- Markdown only.
+- No JSON, metadata, or commentary outside the markdown.
+
+USER CONTEXT:
+{user_data}
+
+LEARNING RESOURCE METADATA:
+{resource_data}
+
+PREFERRED STYLE & TONE:
+{style}
+
+REFERENCE URLs:
+{urls}
+
+LESSON OUTLINE:
+{outline}
+
+SECTION TO WRITE: {heading}
+KEY POINTS TO COVER:
+{key_points}"""
+            ),
+            input_variables=["user_data", "resource_data", "style", "urls", "outline", "heading", "key_points"]
+        )
+
+    def format_prompt(self, user_data: dict, resource_data: dict, style: str, urls: list, outline: str,
+                      heading: str, key_points: list) -> str:
+        logging.info(f"Formatting LessonSectionTemplate prompt for section: {heading}")
+        key_points = "\n".join(f"- {point}" for point in key_points)
+        fields = LESSON_SECTION_BUDGET.fit(self.template, user_data=user_data, resource_data=resource_data,
+                                           style=style, urls=markdown_links(urls), outline=outline,
+                                           heading=heading, key_points=key_points)
+        return self.format(
+            user_data=compact_json(fields["user_data"]),
+            resource_data=compact_json(fields["resource_data"]),
+            style=style,
+            urls="\n".join(fields["urls"]),
+            outline=outline,
+            heading=heading,
+            key_points=key_points
+        )
+
+
+CONTENT_IMPROVISE_SYSTEM_PROMPT = SystemMessage(content="""
+You are an energetic, insightful, and detail-oriented educational content improver.
+
+PRIMARY OBJECTIVE:
+Take the given educational content and enhance it for clarity, engagement, and reader experience — while preserving all original meaning, structure, key points, and URLs.
+
+IMPROVEMENT PRINCIPLES:
+- Use **clear markdown structure** with proper headings, subheadings, and lists for scannability.
+- Maintain a **warm, professional, and approachable tone** — friendly but academically credible.
+- Improve flow, sentence clarity, and logical progression.
+- Include **memorable real-world connections** or analogies where appropriate.
+- Add **1–2 light reflective prompts or motivational nudges** to spark curiosity (without overwhelming the text).
+- Avoid redundancy, filler, or overly complex phrasing.
+- Keep explanations concise and precise for motivated learners who want efficiency and depth.
+- Emphasize **why** a topic matters alongside what it is.
+- Always preserve factual correctness and technical accuracy.
+- **Do NOT remove, alter, or delete any URLs or reference links** present in the original content.
+
+VALIDATION FEEDBACK INTEGRATION:
+You will receive a post-validation report containing:
+- `"is_valid"`: a boolean indicating if the content passed quality validation.
+- `"violations"`: a list of specific issues or gaps found.
+
+STRICT RULES FOR USING FEEDBACK:
+1. If `"is_valid": true`:
+   - Apply **only light polishing** (minor structural and readability improvements).
+   - Do NOT make major changes.
+2. If `"is_valid": false`:
+   - Address **only** the violations listed.
+   - Do NOT alter valid sections unnecessarily.
+   - Fix structure, clarity, and engagement issues exactly as reported.
+3. Never add new factual content, invent data, or change established meanings.
+4. Never remove key ideas, examples, or URLs already in the original.
+5. Any additions must come from **clarifying existing points**, not adding new knowledge.
+
+OUTPUT FORMAT:
+- Return **only** the improved markdown content.
+- No JSON, no metadata, no explanations before or after the markdown.
+
+EXAMPLE OPENING STYLE:
+“Let’s dive into [subject] — mastering this will give you a sharper edge in your learning journey!”
+
+Now, improve the provided content based on these rules and the validation feedback.
+""")
+
+SECTION_IMPROVE_SYSTEM_PROMPT = SystemMessage(content="""
+You are an educational content improver revising ONE section of a longer markdown lesson.
+
+You will receive:
+- The outline of the whole lesson (its headings), for context only.
+- The section to revise, starting with its heading line.
+- The review issues (content gaps or validation violations) that concern this section.
+
+RULES:
+1. Address every listed issue within this section; do not touch anything the issues do not concern.
+2. Keep the section's heading line unchanged and keep its heading level.
+3. Preserve factual correctness, existing examples and every URL or reference link.
+4. Do not repeat material that belongs to other sections of the outline.
+5. Keep the tone warm, clear and academically credible, matching the surrounding lesson.
+
+OUTPUT FORMAT:
+- Return **only** the revised section in markdown, starting with its heading line.
+- No JSON, no metadata, no explanations before or after the markdown.
+""")
 
 
 class BlogGenerationPrompt(PromptTemplate):
@@ -289,30 +456,31 @@ class BlogGenerationPrompt(PromptTemplate):
         super().__init__(
             template=(
                 """You're a friendly education blogger.
-                
-                USER PROFILE:
-                {user_data}
-                
-                TOPIC INFORMATION:
-                {resource_data}
-                
-                STYLE TO FOLLOW:
-                {style}
-                
-                Write a short, engaging blog post for students based on the above topic.
-                
-                - Make it informative but not too formal.
-                - Use real-world analogies and visuals if appropriate.
-                - Output Markdown-formatted blog content only."""
+Write a short, engaging blog post for students based on the topic below.
+
+- Make it informative but not too formal.
+- Use real-world analogies and visuals if appropriate.
+- Output Markdown-formatted blog content only.
+
+USER PROFILE:
+{user_data}
+
+TOPIC INFORMATION:
+{resource_data}
+
+STYLE TO FOLLOW:
+{style}"""
             ),
             input_variables=["user_data", "resource_data", "style"]
         )
 
     def format_prompt(self, user_data: dict, resource_data: dict, style: str) -> str:
         logging.info(f"Formatting BlogGenerationPrompt for style: {style}")
+        fields = BLOG_GENERATION_BUDGET.fit(self.template, user_data=user_data, resource_data=resource_data,
+                                            style=style)
         return self.format(
-            user_data=json.dumps(user_data, indent=2),
-            resource_data=json.dumps(resource_data, indent=2),
+            user_data=compact_json(fields["user_data"]),
+            resource_data=compact_json(fields["resource_data"]),
             style=style
         )
 
@@ -324,15 +492,19 @@ class RouteSelectorNode(PromptTemplate):
             template='''
 You are a route selector for an educational learning system.
 Your task is to determine the next action based on the user''s current state and progress.
-Based on the {current_resources} decide whether to generate a blog or a lesson and return the output as a JSON object with a single key "next_node" and its string value.
-Example: {"next_node": "lesson"}'''
+Based on the resource below, decide whether to generate a blog or a lesson and return the output as a JSON object with a single key "next_node" whose value is "blog_generation" or "content_generation".
+Example: {{"next_node": "content_generation"}}
+
+Resource:
+{current_resources}'''
             , input_variables=["current_resources"]
         )
 
     def format_prompt(self, current_resources: dict) -> str:
         logging.info(f"Formatting RouteSelectorNode prompt for action.")
+        fields = ROUTE_SELECTOR_BUDGET.fit(self.template, current_resources=current_resources)
         return self.format(
-            current_resources=json.dumps(current_resources, indent=2)
+            current_resources=compact_json(fields["current_resources"])
         )
 
 
@@ -368,6 +540,66 @@ Your task is to analyze the provided content and comments, and generate a valid
 """)
 
 
+SEMANTIC_VALIDATION_SYSTEM_PROMPT = SystemMessage(content="""
+You are an expert QA validator for educational lessons and blog posts.
+Heading structure, length, keyword placement, SEO metadata, markdown syntax and link format have
+already been checked automatically. Check ONLY the semantic criteria below.
+Do NOT make improvements or suggestions. Simply detect and report any issues.
+
+Content Integrity:
+- Are definitions, formulas and explanations scientifically correct and complete?
+- Was any hallucinated content introduced (links, statistics, citations, invented facts)?
+- Are examples accurate and relevant to the topic and curriculum?
+- Is there keyword stuffing or SEO manipulation that hurts readability?
+
+Return a JSON object in the format:
+
+{
+  "is_valid": true or false,
+  "violations": [
+    "<Clear description of the problem found, if any>"
+  ]
+}
+
+If there are no semantic issues, return:
+
+{
+  "is_valid": true,
+  "violations": []
+}
+""")
+
+
+COMBINED_CRITIQUE_SYSTEM_PROMPT = SystemMessage(content="""
+You are an expert reviewer and QA validator for SEO-optimized educational lessons.
+In ONE pass over the markdown content, rate it, list its content gaps and validate it.
+
+Review:
+- Rate the overall quality from 1 (very poor) to 5 (excellent) and summarise the main strengths and weaknesses.
+- List every content gap, missing explanation, unclear section or missing real-world example.
+  Name the section heading a gap belongs to whenever it belongs to one.
+- Estimate how reliable the AI-generated content is, between 0 and 1.
+
+Validation (report issues only, do not suggest improvements):
+- Exactly one H1; H2 and H3 used meaningfully; short, scannable paragraphs; standard markdown syntax.
+- Primary keyword in the first 25 words and in at least one subheading, without keyword stuffing.
+- No hallucinated links, statistics or citations; definitions and formulas correct and complete.
+
+Return ONLY a JSON object with exactly these fields:
+{
+  "rating": 4,
+  "comments": "Clear explanations, but the Real-Life Application section has a single example.",
+  "needed": true,
+  "gaps": ["Real-Life Application: add a second, local example."],
+  "ai_reliability_score": 0.85,
+  "is_valid": false,
+  "violations": ["The primary keyword does not appear in any subheading."]
+}
+`needed` is true if the content should be improved. `is_valid` is true only if there are no violations.
+Do not wrap the JSON in markdown or add any text outside it.
+""")
+
+
 class ContentGapGenerationPrompt(PromptTemplate):
     """
     Prompt to identify content gaps in educational material based on feedback and the content itself.
@@ -382,44 +614,45 @@ class ContentGapGenerationPrompt(PromptTemplate):
         super().__init__(
             template=(
                 """You are an expert educational content reviewer.
-                
-                Your task is to analyze the following learning content and the feedback provided, and identify any content gaps, missing explanations, unclear sections, or areas for improvement.
-                
-                CONTENT:
-                {content}
-                
-                FEEDBACK:
-                {feedback}
-                
-                Instructions:
-                - Carefully read both the content and the feedback.
-                - Identify and list all content gaps, missing details, or unclear explanations.
-                - If the feedback already mentions gaps, include them. If you find additional gaps, add those too.
-                - Return a JSON object with the following fields ONLY:
-                  - "rating": integer from 1 to 5 (overall quality)
-                  - "comments": a short summary of the main feedback and gaps
-                  - "needed": true if improvement is needed, false if not
-                  - "gaps": a list of specific content gaps or improvement points
-                - "ai_reliability_score": a float between 0 and 1 indicating the reliability of the AI-generated content.
-                
-                Example output:
-                {{
-                "rating": 3,
-                "comments": "The content is generally clear but lacks real-world examples and visual aids. Some sections are too brief.",
-                "needed": true,
-                "gaps": ["No real-world examples provided.", "Missing diagrams or visual explanations.", "The explanation of the formula derivation is too brief."],
-                "ai_reliability_score": 0.75
-                }}
-                - Do NOT include any extra text or explanation outside the JSON.
-                """
+
+Your task is to analyze the learning content and the feedback given at the end of this prompt, and identify any content gaps, missing explanations, unclear sections, or areas for improvement.
+
+Instructions:
+- Carefully read both the content and the feedback.
+- Identify and list all content gaps, missing details, or unclear explanations.
+- If the feedback already mentions gaps, include them. If you find additional gaps, add those too.
+- Return a JSON object with the following fields ONLY:
+  - "rating": integer from 1 to 5 (overall quality)
+  - "comments": a short summary of the main feedback and gaps
+  - "needed": true if improvement is needed, false if not
+  - "gaps": a list of specific content gaps or improvement points
+  - "ai_reliability_score": a float between 0 and 1 indicating the reliability of the AI-generated content.
+
+Example output:
+{{
+"rating": 3,
+"comments": "The content is generally clear but lacks real-world examples and visual aids. Some sections are too brief.",
+"needed": true,
+"gaps": ["No real-world examples provided.", "Missing diagrams or visual explanations.", "The explanation of the formula derivation is too brief."],
+"ai_reliability_score": 0.75
+}}
+- Do NOT include any extra text or explanation outside the JSON.
+
+FEEDBACK:
+{feedback}
+
+CONTENT:
+{content}
+"""
             ),
             input_variables=["content", "feedback"]
         )
 
     def format_prompt(self, content: str, feedback: dict) -> str:
+        fields = GAP_FINDER_BUDGET.fit(self.template, content=content, feedback=feedback)
         return self.format(
-            content=content,
-            feedback=feedback
+            content=fields["content"],
+            feedback=compact_json(fields["feedback"])
         )
 
 
@@ -471,75 +704,43 @@ OUTPUT REQUIREMENTS:
 """
                                                        )
 
-POST_VALIDATION_SYSTEM_PROMPT = SystemMessage(content="""
-You are an expert QA validator for SEO-optimized educational blog posts. Your job is to review the finalized markdown blog post and strictly validate that it follows all SEO, content integrity, and E-E-A-T guidelines.
-Do NOT make improvements or suggestions. Simply detect and report any issues.
-
-Validation Criteria:
-1. Structural & Format Checks
-- Does the blog have one and only one H1?
-- Are H2 and H3 used meaningfully to organize content?
-- Are large paragraphs broken down into smaller, scannable blocks?
-- Are bullet points used appropriately (only when they were originally sentence-based)?
-- Does the markdown formatting follow standard syntax?
-
-2. SEO Compliance
-- Is the title_tag under 60 characters?
-- Is the meta_description under 155 characters and aligned with the blog content?
-- Is the primary keyword present in the first 25 words (only if it existed in the original)?
-- Is the keyword used in at least one subheading?
-
-3. Content Integrity
-- Are all original paragraphs and facts intact?
-- Has any content been paraphrased, rewritten, or removed? (Should NOT be)
-- Are all definitions, formulas, and explanations preserved exactly?
-- Was any hallucinated content introduced? (e.g., links, tips, summaries, data, stats, citations)
-
-
-Failure Conditions:
-- Any factual alteration
-- Any hallucinated addition (e.g., extra info, citations, summaries)
-- Any missing original paragraph or heading
-- Any AI-generated rewriting
-- Any keyword stuffing or SEO manipulation
-
-Output Format:
-
-Return a JSON object in the format:
-
-{
-  "is_valid": true or false,
-  "violations": [
-    "<Clear description of the problem found, if any>"
-  ]
-}
-
-If everything is perfect, return:
-
-{
-  "is_valid": true,
-  "violations": []
-}
-""")
-
 prompt_user = UserSummaryTemplate()
 prompt_enrichment = EnrichContent()
 prompt_content_generation = ContentGenerationTemplate()
+prompt_lesson_outline = LessonOutlineTemplate()
+prompt_lesson_section = LessonSectionTemplate()
 prompt_content_improviser = CONTENT_IMPROVISE_SYSTEM_PROMPT
+prompt_section_improviser = SECTION_IMPROVE_SYSTEM_PROMPT
 prompt_feedback = CONTENT_FEEDBACK_SYSTEM_PROMPT
 prompt_seo_optimization = CONTENT_SEO_OPTIMIZATION_SYSTEM_PROMPT
 prompt_route_selector = RouteSelectorNode()
 prompt_blog_generation = BlogGenerationPrompt()
 prompt_gap_finder = ContentGapGenerationPrompt()
-prompt_post_validation = POST_VALIDATION_SYSTEM_PROMPT
-
-user_summary = prompt_user | get_gemini_model(UserInfo)
-enriched_content = prompt_enrichment | get_gemini_model(EnrichedLearningResource)
-route_selector = prompt_route_selector | get_gemini_model(RouteSelector)
-content_generation = prompt_content_generation | get_gemini_model(ContentResponse)
-blog_generation = prompt_blog_generation | get_gemini_model(ContentResponse)
-gap_finder = prompt_gap_finder | get_gemini_model(FeedBack)
-content_seo_optimization = get_groq_model()
-content_improviser = get_groq_model()
-content_feedback = get_deepseek_model(FeedBack)
-post_validation = get_deepseek_model(PostValidationResult)
+prompt_semantic_validation = SEMANTIC_VALIDATION_SYSTEM_PROMPT
+prompt_combined_critique = COMBINED_CRITIQUE_SYSTEM_PROMPT
+
+# Each chain prefers its original provider and falls back to (or hedges with) the others;
+# see `RoutedChatModel` in models/llm_models.py.
+user_summary = prompt_user | get_routed_model('user_summary', UserInfo, ('gemini', 'groq', 'deepseek'))
+enriched_content = prompt_enrichment | get_routed_model('enriched_content', EnrichedLearningResource,
+                                                        ('gemini', 'groq', 'deepseek'))
+route_selector = prompt_route_selector | get_routed_model('route_selector', RouteSelector, ('gemini', 'groq'))
+content_generation = prompt_content_generation | get_routed_model('content_generation', ContentResponse,
+                                                                  ('gemini', 'groq', 'deepseek'))
+blog_generation = prompt_blog_generation | get_routed_model('blog_generation', ContentResponse,
+                                                            ('gemini', 'groq', 'deepseek'))
+# Outline-first generation: one structured outline call, then one call per section.
+lesson_outline = prompt_lesson_outline | get_routed_model('lesson_outline', LessonOutline,
+                                                          ('gemini', 'groq', 'deepseek'))
+lesson_section = prompt_lesson_section | get_routed_model('lesson_section', None, ('gemini', 'groq'))
+# Plain-text variants used when content is streamed token by token to a sink.
+content_generation_stream = prompt_content_generation | get_routed_model('content_generation_stream', None,
+                                                                         ('gemini', 'groq'))
+blog_generation_stream = prompt_blog_generation | get_routed_model('blog_generation_stream', None, ('gemini', 'groq'))
+gap_finder = prompt_gap_finder | get_routed_model('gap_finder', FeedBack, ('gemini', 'deepseek', 'groq'))
+content_seo_optimization = get_routed_model('content_seo_optimization', None, ('groq', 'gemini'))
+content_improviser = get_routed_model('content_improviser', None, ('groq', 'gemini'))
+content_feedback = get_routed_model('content_feedback', FeedBack, ('deepseek', 'gemini', 'groq'))
+post_validation = get_routed_model('post_validation', PostValidationResult, ('deepseek', 'gemini', 'groq'))
+# One call returning feedback, gaps and validation together, used with CritiqueMode.COMBINED.
+combined_critique = get_routed_model('combined_critique', CombinedCritique, ('deepseek', 'gemini', 'groq'))
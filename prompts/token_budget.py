@@ -0,0 +1,183 @@
+"""
+Token budgets for prompt assembly.
+
+Prompt inputs come from upstream data of unbounded size: scraped metadata, every crawled
+URL, whole lessons. A `TokenBudget` caps the size of one prompt: the fixed instructions
+and any fields that must be sent whole are counted first, the rest of the budget is split
+between the remaining fields by weight (a field needing less than its share passes its
+surplus on), and each oversized field is cut down deterministically:
+
+- text keeps its beginning and end, with a marker saying how many tokens were left out;
+- lists keep their first items (inputs are ordered by relevance);
+- dicts keep every key, with their longest strings clipped.
+
+Dropped tokens are logged and counted per prompt and field as
+`prompt_tokens_dropped_total`, so latency and cost stay bounded and truncation is visible.
+"""
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Optional, Union
+
+from models.rate_limiter import estimate_tokens
+from utils.instrumentation import record_prompt_truncation
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "8000"))
+# No field is cut below this, even if the fixed parts alone exceed the budget.
+MIN_FIELD_TOKENS = 64
+MIN_STRING_CHARS = 40
+CHARS_PER_TOKEN = 4
+ELLIPSIS = "…"
+
+
+def compact_json(data) -> str:
+    """
+    Serialise prompt data as compact JSON with sorted keys: fewer input tokens than
+    indented JSON, and byte-identical for equal data so repeated prompts hit provider
+    prompt caches.
+    """
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def count_tokens(value) -> int:
+    """Token estimate of a prompt field as it is rendered: text as is, anything else as compact JSON."""
+    return estimate_tokens(value if isinstance(value, str) else compact_json(value))
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """Keep the first two thirds and last third of the allowed size, cut at line breaks."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens - 16) * CHARS_PER_TOKEN
+    head, tail = text[:keep * 2 // 3], text[len(text) - (keep - keep * 2 // 3):] if keep else ""
+    if "\n" in head[len(head) // 2:]:
+        head = head[:head.rindex("\n")]
+    if "\n" in tail[:len(tail) // 2]:
+        tail = tail[tail.index("\n") + 1:]
+    omitted = count_tokens(text) - count_tokens(head + tail)
+    return f"{head}\n[... {omitted} tokens omitted ...]\n{tail}"
+
+
+def _clip_strings(value, max_chars: int):
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars].rstrip() + ELLIPSIS
+    if isinstance(value, dict):
+        return {key: _clip_strings(item, max_chars) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clip_strings(item, max_chars) for item in value]
+    return value
+
+
+def _longest_string(value) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        return max((_longest_string(item) for item in value), default=0)
+    return 0
+
+
+def truncate_data(data: Union[dict, list], max_tokens: int):
+    """
+    Fit structured data into `max_tokens`: lists keep their longest fitting prefix, dicts
+    clip their strings to the largest common length that fits (never below
+    `MIN_STRING_CHARS`, so the result may still be over budget).
+    """
+    if count_tokens(data) <= max_tokens:
+        return data
+    if isinstance(data, (list, tuple)):
+        kept = []
+        for item in data:
+            if count_tokens(kept + [item]) > max_tokens:
+                break
+            kept.append(item)
+        return kept
+    low, high = MIN_STRING_CHARS, _longest_string(data)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(_clip_strings(data, middle)) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return _clip_strings(data, low)
+
+
+@dataclass
+class BudgetedFields:
+    """Fitted prompt fields, with the estimated prompt size and tokens dropped per field."""
+    values: Dict[str, Any]
+    tokens: int
+    dropped: Dict[str, int] = field(default_factory=dict)
+
+    def __getitem__(self, name: str):
+        return self.values[name]
+
+
+class TokenBudget:
+    """
+    Token budget of one prompt.
+
+    Args:
+        name (str): Prompt name, used in logs and metrics.
+        shares (Dict[str, float]): Relative share of the budget for each field that may be
+            truncated. Fields passed to `fit` that are not listed are sent whole.
+        total (Optional[int]): Budget of the whole prompt in tokens; `PROMPT_TOKEN_BUDGET` if None.
+    """
+
+    def __init__(self, name: str, shares: Dict[str, float], total: Optional[int] = None):
+        self.name = name
+        self.shares = shares
+        self.total = total if total is not None else PROMPT_TOKEN_BUDGET
+
+    def allocate(self, sizes: Dict[str, int], fixed_tokens: int) -> Dict[str, int]:
+        """Split what the fixed parts leave between the fields, giving unused shares to larger fields."""
+        remaining = max(self.total - fixed_tokens, 0)
+        pending = {name: size for name, size in sizes.items()}
+        allocation = {}
+        while pending:
+            weight = sum(self.shares[name] for name in pending)
+            fitting = {name: size for name, size in pending.items()
+                       if size <= remaining * self.shares[name] / weight}
+            if not fitting:
+                for name in pending:
+                    allocation[name] = max(MIN_FIELD_TOKENS, int(remaining * self.shares[name] / weight))
+                break
+            for name, size in fitting.items():
+                allocation[name] = size
+                remaining -= size
+                del pending[name]
+        return allocation
+
+    def fit(self, instructions: Union[str, Iterable[str]] = "", **fields) -> BudgetedFields:
+        """
+        Fit `fields` into the budget.
+
+        Args:
+            instructions (Union[str, Iterable[str]]): Fixed prompt text (template, system
+                prompt), counted against the budget.
+            **fields: Prompt fields as text, lists or dicts; the same types are returned.
+
+        Returns:
+            BudgetedFields: The fitted values, the estimated prompt size and the dropped tokens.
+        """
+        texts = [instructions] if isinstance(instructions, str) else list(instructions)
+        fixed_tokens = sum(estimate_tokens(text) for text in texts)
+        fixed_tokens += sum(count_tokens(value) for name, value in fields.items() if name not in self.shares)
+        sizes = {name: count_tokens(value) for name, value in fields.items() if name in self.shares}
+        allocation = self.allocate(sizes, fixed_tokens)
+
+        values, dropped = dict(fields), {}
+        for name, limit in allocation.items():
+            if sizes[name] <= limit:
+                continue
+            value = fields[name]
+            values[name] = truncate_text(value, limit) if isinstance(value, str) else truncate_data(value, limit)
+            dropped[name] = sizes[name] - count_tokens(values[name])
+            record_prompt_truncation(self.name, name, dropped[name])
+        tokens = fixed_tokens + sum(count_tokens(values[name]) for name in sizes)
+        if dropped:
+            logging.warning(f"Prompt '{self.name}' over its {self.total}-token budget; dropped tokens per field: "
+                            f"{dropped}")
+        return BudgetedFields(values=values, tokens=tokens, dropped=dropped)
@@ -5,9 +5,10 @@ throughout the personalized learning system. These schemas ensure data consisten
 and provide clear definitions for various entities like user information,
 learning resources, content responses, and the overall learning state.
 """
+import operator
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional, Union
+from typing import Annotated, List, Optional, Union
 
 from pydantic import BaseModel, Field, HttpUrl
 
@@ -27,6 +28,16 @@ class ContentType(str, Enum):
     PRACTICAL = "practical"
 
 
+class GenerationMode(str, Enum):
+    SINGLE_PASS = "single_pass"
+    OUTLINE_SECTIONS = "outline_sections"
+
+
+class CritiqueMode(str, Enum):
+    SEPARATE = "separate"
+    COMBINED = "combined"
+
+
 class UserInfo(BaseModel):
     username: str
     age: Union[int, float, str]
@@ -97,6 +108,16 @@ class EnrichedLearningResource(BaseModel):
     references: str
 
 
+class OutlineSection(BaseModel):
+    heading: str = Field(..., description="Section heading without the leading '#' characters.")
+    key_points: List[str] = Field(default_factory=list, description="Points the section must cover.")
+
+
+class LessonOutline(BaseModel):
+    title: str = Field(..., description="Lesson title, used as the top-level heading.")
+    sections: List[OutlineSection] = Field(default_factory=list, description="Sections in reading order.")
+
+
 class FeedBack(BaseModel):
     rating: int = 1
     comments: Optional[str] = None
@@ -141,21 +162,69 @@ class PostValidationResult(BaseModel):
                                   description="List of descriptive violation messages if validation failed. Empty if valid.")
 
 
+class CombinedCritique(BaseModel):
+    """`FeedBack` and `PostValidationResult` fields produced by a single critique call."""
+    rating: int = 1
+    comments: Optional[str] = None
+    needed: bool = Field(default=True, description="True if the content needs improvement else False")
+    gaps: List[str] = Field(default_factory=list, description="Specific content gaps or areas for improvement")
+    ai_reliability_score: float = Field(default=0.0,
+                                        description="AI reliability score for the content, between 0 and 1")
+    is_valid: bool = Field(default=False, description="Indicates whether the content passed all validation checks.")
+    violations: List[str] = Field(default_factory=list,
+                                  description="Descriptive validation violation messages. Empty if valid.")
+
+
+class ArtifactRef(BaseModel):
+    """Reference to data kept in the artifact store (db/artifact_store.py) instead of the state."""
+    kind: str
+    digest: str = Field(description="SHA-256 of the stored JSON, which is also its file name.")
+    size: int = Field(description="Size of the stored JSON in bytes.")
+    items: Optional[int] = Field(default=None, description="Number of items, for lists and dicts.")
+
+
 class LearningState(BaseModel):
+    """
+    State of one graph run. Nodes return only the fields they change; list fields with
+    an `operator.add` reducer (`progress`, `history`) are appended to, not replaced.
+    """
+    run_id: Optional[str] = None
     user: UserInfo
     current_resource: Optional[LearningResource] = None
     enriched_resource: Optional[EnrichedLearningResource] = None
-    progress: List[UserProgress] = []
-    topic_data: Optional[list] = None
+    progress: Annotated[List[UserProgress], operator.add] = []
+    topic_data: Optional[ArtifactRef] = Field(default=None,
+                                              description="Crawl results in the artifact store; see load_artifact.")
     related_examples: Optional[List[str]] = None
     content_type: ContentType = ContentType.LESSON
+    generation_mode: GenerationMode = Field(default=GenerationMode.SINGLE_PASS,
+                                            description="single_pass or outline_sections lesson generation.")
+    critique_mode: CritiqueMode = Field(default=CritiqueMode.SEPARATE,
+                                        description="separate feedback, gap and validation calls, or one combined call.")
     content: Optional[ContentResponse] = None
     next_action: Optional[RouteSelector] = Field(default="lesson_selection",
                                                  description="Should return lesson_selection or blog_selection")
-    history: List[HistoryEntry] = []
+    history: Annotated[List[HistoryEntry], operator.add] = []
     feedback: Optional[FeedBack] = None
     validation_result: Optional[PostValidationResult] = None
     count: int = 0
+    run_summary: Optional[dict] = Field(default=None, description="Per-node and per-provider metrics of the run.")
 
     class Config:
         from_attributes = True
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: JobState = JobState.QUEUED
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
@@ -1,20 +1,26 @@
 """
 Educational content crawling and extraction utilities using crawl4ai and LLM strategies.
 """
-import json
+import asyncio
 import logging
+import time
 from datetime import datetime
+from typing import AsyncIterator
 
 from crawl4ai import (
     AsyncWebCrawler,
     BrowserConfig,
     CrawlerRunConfig,
+    DefaultMarkdownGenerator,
     LLMExtractionStrategy,
-    LLMConfig
+    LLMConfig,
+    PruningContentFilter
 )
 
 from keys.apis import set_env
 from schemas import WebCrawlerConfig
+from scrapper.dedup import NearDuplicateIndex, findings_text
+from utils.instrumentation import current_run
 
 
 async def crawl_and_extract_json(urls: list) -> list:
@@ -25,6 +31,27 @@ async def crawl_and_extract_json(urls: list) -> list:
     Returns:
         list: List of extracted JSON objects for each URL.
     """
+    return [record async for record in crawl_and_extract_stream(urls)]
+
+
+async def crawl_and_extract_stream(urls: list) -> AsyncIterator[dict]:
+    """
+    Crawl a list of URLs and yield each extracted JSON object as soon as it is ready,
+    so callers can index pages while the rest of the list is still being crawled.
+
+    Each page is fetched once. Its main text, with navigation and other site chrome
+    pruned, is fingerprinted, and pages whose main text near-duplicates an earlier page
+    are skipped before the LLM extraction runs on the fetched markdown. Extracted
+    records whose `main_findings` near-duplicate an earlier record are dropped before
+    they reach the vector store. Every kept record lists the URLs folded into it
+    under `duplicate_urls`, making it the canonical copy. Copies found after a record
+    was yielded are appended to that record, which `ScrapedDataIndexer` writes back to
+    the collection when it closes.
+    Args:
+        urls (list): List of URLs to crawl.
+    Yields:
+        dict: The extracted JSON object for each non-duplicate URL, or a failed record.
+    """
     browser_cfg = BrowserConfig(
         browser_type="firefox",
         headless=False,
@@ -141,28 +168,67 @@ ALWAYS return full JSON — even if data is minimal.""",
         exclude_external_links=True,
         exclude_social_media_links=True,
         verbose=True,
-        extraction_strategy=extraction_strategy,
+        # fit_markdown holds the page's main text, used to fingerprint it.
+        markdown_generator=DefaultMarkdownGenerator(content_filter=PruningContentFilter()),
     )
 
-    results = []
+    page_index = NearDuplicateIndex()
+    findings_index = NearDuplicateIndex()
+    canonical_records = {}
+
+    def record_duplicate(url: str, canonical: str):
+        canonical = findings_index.duplicates.get(canonical, canonical)
+        if canonical in canonical_records:
+            canonical_records[canonical]["duplicate_urls"].append(url)
+
     async with AsyncWebCrawler(config=browser_cfg) as crawler:
         for url in urls:
             try:
                 logging.info(f"Crawling -> {url}")
 
-                result = await crawler.arun(
+                page = await crawler.arun(
                     url=url,
                     config=crawl_cfg
                 )
+                if not page.success:
+                    logging.error(f"Failed to crawl {url}: {page.error_message}")
+                    continue
+                canonical = page_index.add(url, page.markdown.fit_markdown or page.markdown.raw_markdown or "")
+                if canonical is not None:
+                    logging.info(f"Skipping extraction for near-duplicate page {url} (canonical: {canonical})")
+                    record_duplicate(url, canonical)
+                    continue
 
-                if result.success:
-                    logging.info(f"Successfully crawled {url}")
+                # Extract from the page already fetched, as crawl4ai would within `arun`.
+                sections = crawl_cfg.chunking_strategy.chunk(page.markdown.raw_markdown or "")
+                usage_before = (extraction_strategy.total_usage.prompt_tokens,
+                                extraction_strategy.total_usage.completion_tokens)
+                extract_started = time.perf_counter()
+                error = None
+                try:
+                    extracted_list = await asyncio.to_thread(extraction_strategy.run, url, sections)
+                except Exception as e:
+                    error = str(e)
+                    raise
+                finally:
+                    run = current_run()
+                    if run is not None:
+                        run.record_llm_call(
+                            node="crawler",
+                            provider="ollama",
+                            model="llama3",
+                            wall_time=time.perf_counter() - extract_started,
+                            input_tokens=extraction_strategy.total_usage.prompt_tokens - usage_before[0],
+                            output_tokens=extraction_strategy.total_usage.completion_tokens - usage_before[1],
+                            error=error
+                        )
 
-                    extracted_list = json.loads(result.extracted_content)
+                if extracted_list:
+                    logging.info(f"Successfully crawled {url}")
 
                     extracted = extracted_list[0] if isinstance(extracted_list, list) else extracted_list
 
-                    results.append({
+                    record = {
                         "url": extracted.get("url", url),
                         "source": extracted.get("source", ""),  # e.g. "byjus.com"
                         'content_type': extracted.get("content_type", ""),
@@ -180,13 +246,22 @@ ALWAYS return full JSON — even if data is minimal.""",
                             len(" ".join(extracted.get("main_findings", [])).split())
                         ),
                         "status": "success",
-                        "scraped_at": datetime.utcnow().isoformat() + "Z"
-                    })
+                        "scraped_at": datetime.utcnow().isoformat() + "Z",
+                        "duplicate_urls": []
+                    }
                     extraction_strategy.show_usage()
 
+                    canonical = findings_index.add(url, findings_text(record))
+                    if canonical is not None:
+                        logging.info(f"Dropping near-duplicate findings from {url} (canonical: {canonical})")
+                        record_duplicate(url, canonical)
+                        continue
+                    canonical_records[url] = record
+                    yield record
+
             except Exception as e:
                 logging.error(f"Error crawling {url}: {e}")
-                results.append({
+                yield {
                     "url": url,
                     "source": "",
                     "subject": "",
@@ -201,6 +276,6 @@ ALWAYS return full JSON — even if data is minimal.""",
                     "word_count": 0,
                     "status": "failed",
                     "scraped_at": datetime.utcnow().isoformat() + "Z"
-                })
+                }
 
-    return results
+    logging.info(f"Near-duplicate pages dropped: {len(page_index.duplicates) + len(findings_index.duplicates)}")
@@ -0,0 +1,168 @@
+"""
+Near-duplicate detection for crawled educational pages.
+
+Education sites syndicate the same article under several URLs, so a single Serper
+result list often holds near-identical copies. This module estimates the Jaccard
+similarity of the pages' word shingles with MinHash signatures and keeps the first URL
+seen for a group of near-duplicates as the canonical one.
+
+The Jaccard similarity of two copies falls only gradually with word edits, reordered
+paragraphs or boilerplate that differs between sites, and stays far above that of
+unrelated pages, so one threshold separates the two. Fingerprint the main text of a
+page, not markdown that still holds the site's navigation.
+"""
+import hashlib
+import logging
+import re
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+DEFAULT_SHINGLE_SIZE = 3
+# Estimated Jaccard similarity of shingle sets above which two texts are near-duplicates.
+DEFAULT_THRESHOLD = 0.4
+# Signatures are split into LSH bands of `_ROWS` hashes; texts sharing a band are compared.
+# 40 bands of 3 rows make pairs at Jaccard 0.4 candidates with probability ~0.93 and pairs
+# at 0.5 with ~0.995, while unrelated pages (Jaccard < 0.05) almost never share a band.
+NUM_PERMUTATIONS = 120
+_ROWS = 3
+
+# Fixed seeds keep signatures comparable across processes. The odd multipliers make
+# each hash a permutation of the 64-bit shingle hashes (arithmetic wraps modulo 2**64).
+_rng = np.random.default_rng(0x5EED)
+_MULTIPLIERS = _rng.integers(1, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_INCREMENTS = _rng.integers(0, 2 ** 63, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def _shingles(text: str, size: int = DEFAULT_SHINGLE_SIZE) -> set:
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) < size:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def minhash(text: str, shingle_size: int = DEFAULT_SHINGLE_SIZE) -> Optional[np.ndarray]:
+    """
+    Compute the MinHash signature of the given text.
+
+    Args:
+        text (str): Page text or joined findings.
+        shingle_size (int): Number of consecutive words per shingle.
+
+    Returns:
+        Optional[np.ndarray]: `NUM_PERMUTATIONS` unsigned 64-bit minima, or None for empty text.
+    """
+    shingles = _shingles(text, shingle_size)
+    if not shingles:
+        return None
+    hashes = np.fromiter((int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+                          for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    with np.errstate(over="ignore"):
+        permuted = hashes[None, :] * _MULTIPLIERS[:, None] + _INCREMENTS[:, None]
+    return permuted.min(axis=1)
+
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity of the shingle sets behind two MinHash signatures, estimated."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class NearDuplicateIndex:
+    """
+    Keeps MinHash signatures of accepted documents and reports, for each new
+    document, the canonical key it duplicates (if any).
+
+    Signatures are split into bands (locality-sensitive hashing), so lookups only
+    compare against documents sharing a band instead of the whole index.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, shingle_size: int = DEFAULT_SHINGLE_SIZE):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self._buckets: Dict[tuple, List[str]] = {}
+        self._signatures: Dict[str, np.ndarray] = {}
+        self.duplicates: Dict[str, str] = {}
+
+    @staticmethod
+    def _band_keys(signature: np.ndarray):
+        for band in range(NUM_PERMUTATIONS // _ROWS):
+            yield band, signature[band * _ROWS:(band + 1) * _ROWS].tobytes()
+
+    def _find(self, signature: Optional[np.ndarray]) -> Optional[str]:
+        if signature is None:
+            return None
+        best, best_similarity = None, self.threshold
+        for band_key in self._band_keys(signature):
+            for key in self._buckets.get(band_key, []):
+                similarity = jaccard(signature, self._signatures[key])
+                if similarity >= best_similarity:
+                    best, best_similarity = key, similarity
+        return best
+
+    def find(self, text: str) -> Optional[str]:
+        """Return the canonical key of the most similar indexed near-duplicate of `text`, or None."""
+        return self._find(minhash(text, self.shingle_size))
+
+    def add(self, key: str, text: str) -> Optional[str]:
+        """
+        Index `text` under `key` unless it near-duplicates an already indexed document.
+
+        Args:
+            key (str): Identifier of the document, usually its URL.
+            text (str): Text to fingerprint.
+
+        Returns:
+            Optional[str]: The canonical key if `text` is a near-duplicate, otherwise None.
+        """
+        signature = minhash(text, self.shingle_size)
+        canonical = self._find(signature)
+        if canonical is not None:
+            self.duplicates[key] = canonical
+            return canonical
+        if signature is None:
+            return None
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(key)
+        return None
+
+
+def findings_text(record: dict) -> str:
+    """Text used to compare extracted records: the `main_findings`, falling back to `content`."""
+    text = record.get("main_findings") or record.get("content") or ""
+    if isinstance(text, list):
+        return " ".join(str(item) for item in text)
+    return str(text)
+
+
+def dedupe_records(records: Iterable[dict],
+                   text_fn: Callable[[dict], str] = findings_text,
+                   index: Optional[NearDuplicateIndex] = None) -> List[dict]:
+    """
+    Drop near-duplicate extracted records, keeping the first occurrence as canonical.
+
+    Each kept record gets a `duplicate_urls` list naming the URLs folded into it.
+
+    Args:
+        records (Iterable[dict]): Extracted page records with at least a `url` key.
+        text_fn (Callable[[dict], str]): Returns the text to fingerprint for a record.
+        index (Optional[NearDuplicateIndex]): Index to reuse across calls.
+
+    Returns:
+        List[dict]: The records that are not near-duplicates of an earlier record.
+    """
+    index = index or NearDuplicateIndex()
+    kept: Dict[str, dict] = {}
+    for position, record in enumerate(records):
+        key = record.get("url") or str(position)
+        canonical = index.add(key, text_fn(record))
+        if canonical is not None:
+            if canonical in kept:
+                kept[canonical].setdefault("duplicate_urls", []).append(key)
+            logging.info(f"Dropping near-duplicate {key} (canonical: {canonical})")
+            continue
+        record.setdefault("duplicate_urls", [])
+        kept[key] = record
+    return list(kept.values())
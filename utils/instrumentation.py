@@ -0,0 +1,459 @@
+"""
+Per-run latency, token and cost instrumentation for graph runs.
+
+A `RunMetrics` collector is activated for the duration of a graph run. Graph nodes are
+wrapped with `instrument_node`, which records wall time and the queue time between the
+previous node finishing and this one starting. LLM calls are recorded by
+`LLMMetricsCallback`, a LangChain callback handler passed in the run config. Other
+layers (caches, rate limiters, provider routing) report into the active run through
+`current_run()`.
+
+Finished runs are summarised onto the graph output, folded into the process-wide
+`REGISTRY` (rendered in Prometheus text format) and appended to a JSONL file.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+METRICS_JSONL_PATH = os.environ.get("METRICS_JSONL_PATH", "./data/metrics/runs.jsonl")
+
+# USD per one million input / output tokens. Free-tier models cost nothing.
+MODEL_PRICING = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "meta-llama/llama-4-scout-17b-16e-instruct": (0.11, 0.34),
+    "deepseek/deepseek-r1-0528:free": (0.0, 0.0),
+    "llama3": (0.0, 0.0),
+}
+
+_current_run: contextvars.ContextVar[Optional["RunMetrics"]] = contextvars.ContextVar("current_run", default=None)
+
+
+def current_run() -> Optional["RunMetrics"]:
+    """The metrics collector of the graph run executing in this context, if any."""
+    return _current_run.get()
+
+
+def record_cache_hit(cache: str):
+    run = current_run()
+    if run is not None:
+        run.increment(f"cache_hit:{cache}")
+    REGISTRY.increment("cache_hits_total", {"cache": cache})
+
+
+def record_cache_miss(cache: str):
+    run = current_run()
+    if run is not None:
+        run.increment(f"cache_miss:{cache}")
+    REGISTRY.increment("cache_misses_total", {"cache": cache})
+
+
+def record_route_decision(source: str, route: str):
+    """Count a route selection decided by `rules` or by the `llm`."""
+    run = current_run()
+    if run is not None:
+        run.increment(f"route_{source}")
+    REGISTRY.increment("route_decisions_total", {"source": source, "route": route})
+
+
+def record_validation(llm_skipped: bool):
+    """Count a post-validation that was settled by local checks alone or needed the LLM."""
+    source = "local" if llm_skipped else "llm"
+    run = current_run()
+    if run is not None:
+        run.increment(f"validation_{source}")
+    REGISTRY.increment("validations_total", {"source": source})
+
+
+def record_prompt_truncation(prompt: str, field: str, tokens: int):
+    """Tokens cut from a prompt field to keep the prompt within its token budget."""
+    run = current_run()
+    if run is not None:
+        run.increment("prompt_tokens_dropped", tokens)
+    REGISTRY.increment("prompt_tokens_dropped_total", {"prompt": prompt, "field": field}, tokens)
+
+
+def record_queue_wait(provider: str, seconds: float):
+    """Time an outbound call spent waiting for a rate-limit or concurrency slot."""
+    run = current_run()
+    if run is not None:
+        run.add_queue_wait(provider, seconds)
+    REGISTRY.increment("llm_queue_wait_seconds_total", {"provider": provider}, seconds)
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class RunMetrics:
+    """
+    Thread-safe collector for one graph run. Sync nodes run in worker threads, so
+    every mutation goes through a lock.
+    """
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.started_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self.wall_time: Optional[float] = None
+        self._start = time.perf_counter()
+        self._last_node_end = self._start
+        self._lock = threading.Lock()
+        self.nodes: List[dict] = []
+        self.llm_calls: List[dict] = []
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.queue_wait: Dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def activate(self):
+        token = _current_run.set(self)
+        try:
+            yield self
+        finally:
+            _current_run.reset(token)
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def add_queue_wait(self, provider: str, seconds: float):
+        with self._lock:
+            self.queue_wait[provider] += seconds
+
+    def record_node(self, node: str, started: float, finished: float, error: Optional[str] = None):
+        with self._lock:
+            queue_time = max(0.0, started - self._last_node_end)
+            self._last_node_end = finished
+            self.nodes.append({
+                "node": node,
+                "wall_time": finished - started,
+                "queue_time": queue_time,
+                "error": error,
+            })
+
+    def record_llm_call(self, node: Optional[str], provider: str, model: str, wall_time: float,
+                        input_tokens: int = 0, output_tokens: int = 0, cached_input_tokens: int = 0,
+                        retries: int = 0, queue_time: float = 0.0, error: Optional[str] = None):
+        call = {
+            "node": node,
+            "provider": provider,
+            "model": model,
+            "wall_time": wall_time,
+            "queue_time": queue_time,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cached_input_tokens": cached_input_tokens,
+            "retries": retries,
+            "cost_usd": estimate_cost(model, input_tokens, output_tokens),
+            "error": error,
+        }
+        with self._lock:
+            self.llm_calls.append(call)
+        return call
+
+    def finish(self):
+        self.finished_at = datetime.utcnow()
+        self.wall_time = time.perf_counter() - self._start
+
+    def summary(self) -> dict:
+        """Aggregate the run per node and per provider."""
+        with self._lock:
+            nodes = defaultdict(lambda: {"calls": 0, "wall_time": 0.0, "queue_time": 0.0, "errors": 0})
+            for record in self.nodes:
+                entry = nodes[record["node"]]
+                entry["calls"] += 1
+                entry["wall_time"] += record["wall_time"]
+                entry["queue_time"] += record["queue_time"]
+                entry["errors"] += record["error"] is not None
+
+            providers = defaultdict(lambda: {"calls": 0, "wall_time": 0.0, "input_tokens": 0, "output_tokens": 0,
+                                             "cached_input_tokens": 0, "retries": 0, "errors": 0, "cost_usd": 0.0,
+                                             "queue_time": 0.0})
+            for call in self.llm_calls:
+                entry = providers[call["provider"]]
+                entry["calls"] += 1
+                for key in ("wall_time", "input_tokens", "output_tokens", "cached_input_tokens", "retries",
+                            "cost_usd"):
+                    entry[key] += call[key]
+                entry["errors"] += call["error"] is not None
+            # Per-call queue times are already part of these totals, which also count the waits
+            # of calls that never reached the model.
+            for provider, seconds in self.queue_wait.items():
+                providers[provider]["queue_time"] += seconds
+
+            for node in nodes.values():
+                node["llm_calls"] = 0
+            for call in self.llm_calls:
+                if call["node"] in nodes:
+                    nodes[call["node"]]["llm_calls"] += 1
+
+            return {
+                "run_id": self.run_id,
+                "started_at": self.started_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                "wall_time": self.wall_time if self.wall_time is not None else time.perf_counter() - self._start,
+                "nodes": dict(nodes),
+                "providers": dict(providers),
+                "totals": {
+                    "llm_calls": len(self.llm_calls),
+                    "input_tokens": sum(call["input_tokens"] for call in self.llm_calls),
+                    "output_tokens": sum(call["output_tokens"] for call in self.llm_calls),
+                    "cost_usd": sum(call["cost_usd"] for call in self.llm_calls),
+                    "retries": sum(call["retries"] for call in self.llm_calls),
+                },
+                "counters": dict(self.counters),
+            }
+
+
+def instrument_node(name: str, fn):
+    """
+    Wrap a graph node so its wall time and queue time are recorded in the active run.
+
+    `functools.wraps` keeps the original signature visible, so LangGraph still passes
+    `config` to nodes that accept it.
+    """
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            run = current_run()
+            started = time.perf_counter()
+            error = None
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                if run is not None:
+                    run.record_node(name, started, time.perf_counter(), error)
+
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        run = current_run()
+        started = time.perf_counter()
+        error = None
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            if run is not None:
+                run.record_node(name, started, time.perf_counter(), error)
+
+    return wrapper
+
+
+def _usage_from_result(response) -> Dict[str, int]:
+    usage = {"input_tokens": 0, "output_tokens": 0, "cached_input_tokens": 0}
+    for generations in response.generations or []:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                usage["input_tokens"] += metadata.get("input_tokens", 0) or 0
+                usage["output_tokens"] += metadata.get("output_tokens", 0) or 0
+                details = metadata.get("input_token_details") or {}
+                usage["cached_input_tokens"] += details.get("cache_read", 0) or 0
+    if not usage["input_tokens"] and response.llm_output:
+        token_usage = response.llm_output.get("token_usage") or response.llm_output.get("usage") or {}
+        usage["input_tokens"] = token_usage.get("prompt_tokens", 0) or 0
+        usage["output_tokens"] = token_usage.get("completion_tokens", 0) or 0
+    return usage
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    LangChain callback recording wall time, tokens, provider, retries and errors of every
+    chat model call into a `RunMetrics` collector. The time a call queued for a rate-limit
+    or concurrency slot comes from the `llm_queue_time` run metadata set by
+    `RoutedChatModel`.
+    """
+
+    def __init__(self, metrics: RunMetrics):
+        self.metrics = metrics
+        self._pending: Dict[Any, dict] = {}
+        self._retries: Dict[Any, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                            **kwargs):
+        metadata = metadata or {}
+        with self._lock:
+            self._pending[run_id] = {
+                "started": time.perf_counter(),
+                "node": metadata.get("langgraph_node"),
+                "provider": metadata.get("ls_provider", "unknown"),
+                "model": metadata.get("ls_model_name", "unknown"),
+                "queue_time": metadata.get("llm_queue_time", 0.0),
+                "parent_run_id": parent_run_id,
+            }
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        usage = _usage_from_result(response)
+        self._record(pending, **usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            pending = self._pending.pop(run_id, None)
+        if pending is not None:
+            self._record(pending, error=str(error))
+
+    def on_retry(self, retry_state, *, run_id, parent_run_id=None, **kwargs):
+        with self._lock:
+            self._retries[run_id] += 1
+        self.metrics.increment("retries")
+
+    def _record(self, pending: dict, **fields):
+        with self._lock:
+            retries = self._retries.pop(pending["parent_run_id"], 0)
+        call = self.metrics.record_llm_call(
+            node=pending["node"],
+            provider=pending["provider"],
+            model=pending["model"],
+            wall_time=time.perf_counter() - pending["started"],
+            retries=retries,
+            queue_time=pending["queue_time"],
+            **fields
+        )
+        if call["error"]:
+            logging.warning(f"LLM call to {call['provider']} failed in node {call['node']}: {call['error']}")
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Process-wide counters accumulated over all runs, rendered in Prometheus text format."""
+
+    PREFIX = "learning_"
+
+    HELP = {
+        "runs_total": "Graph runs completed.",
+        "run_seconds_total": "Wall time spent in graph runs.",
+        "node_calls_total": "Graph node executions.",
+        "node_seconds_total": "Wall time spent in graph nodes.",
+        "node_queue_seconds_total": "Time between a node becoming runnable and starting.",
+        "node_errors_total": "Graph node executions that raised.",
+        "llm_calls_total": "Chat model calls.",
+        "llm_seconds_total": "Wall time spent in chat model calls.",
+        "llm_input_tokens_total": "Input tokens sent to chat models.",
+        "llm_output_tokens_total": "Output tokens received from chat models.",
+        "llm_cached_input_tokens_total": "Input tokens served from provider prompt caches.",
+        "llm_retries_total": "Chat model call retries.",
+        "llm_errors_total": "Chat model calls that failed.",
+        "llm_cost_usd_total": "Estimated chat model cost in USD.",
+        "llm_queue_wait_seconds_total": "Time outbound calls waited for a rate-limit or concurrency slot.",
+        "llm_hedges_total": "Hedged duplicate requests sent to a second provider.",
+        "llm_fallbacks_total": "Requests retried on another provider after a failure.",
+        "llm_rate_limited_total": "Provider 429 responses retried after backing off.",
+        "llm_concurrency_decreases_total": "Adaptive concurrency limit cuts after a 429 or timeout.",
+        "llm_circuit_open_total": "Provider circuit breakers opened.",
+        "route_decisions_total": "Route selections by decision source (rules or llm).",
+        "validations_total": "Post-validations settled locally or by the LLM.",
+        "prompt_tokens_dropped_total": "Estimated prompt tokens truncated to stay within token budgets.",
+        "cache_hits_total": "Cache hits by cache name.",
+        "cache_misses_total": "Cache misses by cache name.",
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+
+    def increment(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1):
+        key = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            self._values[name][key] += value
+
+    def observe(self, run: RunMetrics):
+        """Fold a finished run into the process-wide counters."""
+        self.increment("runs_total")
+        self.increment("run_seconds_total", value=run.wall_time or 0.0)
+        for record in run.nodes:
+            labels = {"node": record["node"]}
+            self.increment("node_calls_total", labels)
+            self.increment("node_seconds_total", labels, record["wall_time"])
+            self.increment("node_queue_seconds_total", labels, record["queue_time"])
+            if record["error"]:
+                self.increment("node_errors_total", labels)
+        for call in run.llm_calls:
+            labels = {"provider": call["provider"], "model": call["model"], "node": call["node"] or ""}
+            self.increment("llm_calls_total", labels)
+            self.increment("llm_seconds_total", labels, call["wall_time"])
+            self.increment("llm_input_tokens_total", labels, call["input_tokens"])
+            self.increment("llm_output_tokens_total", labels, call["output_tokens"])
+            self.increment("llm_cached_input_tokens_total", labels, call["cached_input_tokens"])
+            self.increment("llm_retries_total", labels, call["retries"])
+            self.increment("llm_cost_usd_total", labels, call["cost_usd"])
+            if call["error"]:
+                self.increment("llm_errors_total", labels)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name in sorted(self._values):
+                metric = self.PREFIX + name
+                lines.append(f"# HELP {metric} {self.HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in sorted(self._values[name].items()):
+                    label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels)
+                    lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def write_jsonl(run: RunMetrics, file_path: str = METRICS_JSONL_PATH):
+    """
+    Append a finished run to a JSONL file: one line per node execution, one per LLM
+    call and a final summary line, each tagged with the run id.
+    """
+    try:
+        dir_name = os.path.dirname(file_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        lines = [json.dumps({"type": "node", "run_id": run.run_id, **record}) for record in run.nodes]
+        lines += [json.dumps({"type": "llm_call", "run_id": run.run_id, **call}) for call in run.llm_calls]
+        lines.append(json.dumps({"type": "run_summary", **run.summary()}))
+        with open(file_path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    except Exception as e:
+        logging.error(f"Failed to write run metrics to {file_path}: {e}")
+
+
+def finish_run(run: RunMetrics, output):
+    """
+    Close a run: attach its summary to the graph output as `run_summary`, add it to the
+    process-wide registry and append it to the metrics JSONL file.
+    """
+    run.finish()
+    summary = run.summary()
+    REGISTRY.observe(run)
+    write_jsonl(run)
+    slowest = max(summary["nodes"].items(), key=lambda item: item[1]["wall_time"], default=(None, None))[0]
+    logging.info(f"Run {run.run_id} finished in {summary['wall_time']:.2f}s; "
+                 f"{summary['totals']['llm_calls']} LLM calls, slowest node: {slowest}")
+    if isinstance(output, dict):
+        output["run_summary"] = summary
+    elif output is not None and hasattr(output, "run_summary"):
+        output.run_summary = summary
+    return output
@@ -0,0 +1,107 @@
+"""
+Split markdown documents into heading sections, match review issues to the sections
+they refer to, and splice rewritten sections back in.
+
+Used by `content_improviser_node` to rewrite only the sections named in the feedback gaps
+and validation violations instead of the whole lesson.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "content", "could", "does", "for", "from", "has",
+    "have", "in", "is", "it", "its", "lesson", "more", "not", "of", "on", "or", "should", "section", "that",
+    "the", "their", "there", "this", "to", "was", "with", "would", "add", "include", "missing", "lacks", "needs",
+}
+
+
+@dataclass
+class Section:
+    """A heading and the text under it up to the next heading; `level` is 0 for the preamble."""
+    heading: str
+    level: int
+    text: str
+
+
+def split_sections(markdown: str) -> List[Section]:
+    """Split at ATX headings outside fenced code blocks. `join_sections` restores the input."""
+    sections = [Section(heading="", level=0, text="")]
+    in_fence = False
+    for line in markdown.splitlines(keepends=True):
+        if FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else HEADING_PATTERN.match(line.rstrip("\n"))
+        if match:
+            sections.append(Section(heading=match.group(2), level=len(match.group(1)), text=line))
+        else:
+            sections[-1].text += line
+    if not sections[0].text:
+        sections.pop(0)
+    return sections
+
+
+def join_sections(sections: List[Section]) -> str:
+    parts = []
+    for section in sections:
+        text = section.text
+        if parts and not parts[-1].endswith("\n"):
+            parts[-1] += "\n\n"
+        parts.append(text)
+    return "".join(parts)
+
+
+def outline(sections: List[Section]) -> str:
+    """The document's headings, indented by level, for context in section prompts."""
+    return "\n".join(f"{'  ' * (section.level - 1)}- {section.heading}" for section in sections if section.level)
+
+
+def _words(text: str) -> set:
+    return {word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS and len(word) > 2}
+
+
+def _score(issue: str, section: Section) -> float:
+    issue_words = _words(issue)
+    if not issue_words:
+        return 0.0
+    if section.heading and section.heading.lower() in issue.lower():
+        return 1.0 + len(issue_words)
+    heading_overlap = len(issue_words & _words(section.heading))
+    body_overlap = len(issue_words & _words(section.text))
+    return (2 * heading_overlap + body_overlap) / len(issue_words)
+
+
+def match_issues(sections: List[Section], issues: List[str]) -> Tuple[Dict[int, List[str]], List[str]]:
+    """
+    Assign each issue to the section it most likely refers to: a section whose heading
+    the issue names, otherwise the one sharing the most words with it.
+
+    Returns:
+        Tuple[Dict[int, List[str]], List[str]]: Issues per section index, and issues that
+        share no words with any section.
+    """
+    targeted: Dict[int, List[str]] = {}
+    unmatched = []
+    for issue in issues:
+        best: Optional[int] = None
+        best_score = 0.0
+        for index, section in enumerate(sections):
+            score = _score(issue, section)
+            if score > best_score:
+                best, best_score = index, score
+        if best is None:
+            unmatched.append(issue)
+        else:
+            targeted.setdefault(best, []).append(issue)
+    return targeted, unmatched
+
+
+def ensure_heading(original: Section, rewritten: str) -> str:
+    """Keep the original heading line if the model dropped it, and end the section with a blank line."""
+    rewritten = rewritten.strip()
+    if original.level and not HEADING_PATTERN.match(rewritten.splitlines()[0] if rewritten else ""):
+        rewritten = original.text.splitlines()[0] + "\n\n" + rewritten
+    return rewritten + "\n\n"
@@ -0,0 +1,96 @@
+"""
+Translate LangGraph `astream_events` into content updates for a caller-supplied sink.
+
+A sink is any callable (sync or async) that accepts one event dict. Events are:
+
+    {"event": "revision_start", "revision": n, "node": name}
+        A node has started producing revision `n` of the content.
+    {"event": "delta", "revision": n, "node": name, "text": "..."}
+        More tokens of revision `n`, to be appended to what was already shown.
+    {"event": "replace", "revision": n, "node": name, "content": "..."}
+        Revision `n` is complete; the full text replaces whatever is on screen.
+    {"event": "done"}
+        The graph has finished.
+
+Generation nodes stream token deltas, so the first text appears within seconds.
+Later SEO and improvement passes are delivered as whole `replace` updates, as is an
+earlier, better-scoring iteration restored by `select_version` at the end of the run.
+"""
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Optional, Union
+
+ContentSink = Callable[[dict], Union[None, Awaitable[None]]]
+
+STREAMED_NODES = {"content_generation", "blog_generation"}
+REPLACED_NODES = {"content_seo_optimization", "content_improviser"}
+# Nodes that only sometimes change the content; a revision is emitted when they do.
+SELECTING_NODES = {"select_version"}
+
+STREAM_CONFIG_KEY = "stream_content"
+
+
+def is_streaming(config: Optional[dict]) -> bool:
+    """True when a node runs under `graph_stream` and should use its token-streaming chain."""
+    return bool((config or {}).get("configurable", {}).get(STREAM_CONFIG_KEY))
+
+
+def chunk_text(chunk: Any) -> str:
+    """Extract plain text from a chat model message chunk."""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "")
+                       for part in content if isinstance(part, (str, dict)))
+    return ""
+
+
+def _output_content(output: Any) -> Optional[str]:
+    content = output.get("content") if isinstance(output, dict) else getattr(output, "content", None)
+    if isinstance(content, dict):
+        return content.get("content")
+    return getattr(content, "content", content)
+
+
+class ContentStreamer:
+    """
+    Stateful translator from `astream_events(version="v2")` events to sink events.
+    """
+
+    def __init__(self, sink: ContentSink):
+        self.sink = sink
+        self.revision = 0
+        self.final_output = None
+
+    async def emit(self, event: dict):
+        result = self.sink(event)
+        if inspect.isawaitable(result):
+            await result
+
+    async def handle(self, event: dict):
+        kind = event.get("event")
+        name = event.get("name")
+        node = event.get("metadata", {}).get("langgraph_node")
+
+        if kind == "on_chain_start" and name == node and node in STREAMED_NODES | REPLACED_NODES:
+            self.revision += 1
+            await self.emit({"event": "revision_start", "revision": self.revision, "node": node})
+        elif kind == "on_chat_model_stream" and node in STREAMED_NODES and "hedge" not in event.get("tags", []):
+            text = chunk_text(event.get("data", {}).get("chunk"))
+            if text:
+                await self.emit({"event": "delta", "revision": self.revision, "node": node, "text": text})
+        elif kind == "on_chain_end" and name == node and node in STREAMED_NODES | REPLACED_NODES:
+            content = _output_content(event.get("data", {}).get("output"))
+            if content:
+                await self.emit({"event": "replace", "revision": self.revision, "node": node, "content": content})
+            else:
+                logging.warning(f"Node {node} finished without content to stream")
+        elif kind == "on_chain_end" and name == node and node in SELECTING_NODES:
+            content = _output_content(event.get("data", {}).get("output"))
+            if content:
+                self.revision += 1
+                await self.emit({"event": "revision_start", "revision": self.revision, "node": node})
+                await self.emit({"event": "replace", "revision": self.revision, "node": node, "content": content})
+        elif kind == "on_chain_end" and not event.get("parent_ids"):
+            self.final_output = event.get("data", {}).get("output")